@@ -3,8 +3,10 @@
 Alignment module.
 """
 from collections import namedtuple
-from atropos.align._align import Aligner, MultiAligner, compare_prefixes, locate
-from atropos.util import RandomMatchProbability, reverse_complement
+from atropos.align._align import (
+    Aligner, MultiAligner, PackedSequence, compare_packed, compare_prefixes,
+    locate)
+from atropos.util import RandomMatchProbability
 
 # flags for global alignment
 
@@ -30,10 +32,15 @@ def compare_suffixes(
     mismatches. Used to find an anchored 3' adapter when no indels are allowed.
     
     Args:
-        suffix_ref, suffix_query: The suffices to compare.
+        suffix_ref, suffix_query: The suffices to compare; either strings or
+            :class:`PackedSequence`s.
         wildcard_ref, wildcard_query: Whether wildcards are valid in either of
             the suffices.
     """
+    if isinstance(suffix_ref, PackedSequence):
+        if wildcard_ref or wildcard_query:
+            raise ValueError("Wildcards are not supported for packed sequences")
+        return compare_packed(suffix_ref, suffix_query, suffix=True)
     suffix_ref = suffix_ref[::-1]
     suffix_query = suffix_query[::-1]
     _, length, _, _, matches, errors = compare_prefixes(
@@ -239,6 +246,8 @@ class InsertAligner(object):
         self.adapter1_len = len(adapter1)
         self.adapter2 = adapter2
         self.adapter2_len = len(adapter2)
+        self.packed_adapter1 = PackedSequence(adapter1)
+        self.packed_adapter2 = PackedSequence(adapter2)
         self.match_probability = match_probability
         self.insert_max_rmp = insert_max_rmp
         self.adapter_max_rmp = adapter_max_rmp
@@ -271,7 +280,10 @@ class InsertAligner(object):
         elif len2 > len1:
             seq2 = seq1[:len1]
 
-        seq2_rc = reverse_complement(seq2)
+        # Pack both reads once; the insert and adapter comparisons below all
+        # operate on the packed sequences.
+        packed1 = PackedSequence(seq1)
+        packed2 = PackedSequence(seq2)
         
         def _match(insert_match, offset, insert_match_size, prob): # pylint disable=unused-argument
             if offset < self.min_adapter_overlap:
@@ -288,8 +300,10 @@ class InsertAligner(object):
             # the alignment will fail. We need to use a comparison that is a bit
             # more forgiving.
             
-            a1_match = compare_prefixes(seq1[insert_match_size:], self.adapter1)
-            a2_match = compare_prefixes(seq2[insert_match_size:], self.adapter2)
+            a1_match = compare_prefixes(
+                packed1[insert_match_size:], self.packed_adapter1)
+            a2_match = compare_prefixes(
+                packed2[insert_match_size:], self.packed_adapter2)
             adapter_len = min(offset, self.adapter1_len, self.adapter2_len)
             max_adapter_mismatches = round(
                 adapter_len * self.max_adapter_mismatch_frac)
@@ -348,7 +362,8 @@ class InsertAligner(object):
         # then mismatches, and then check each in turn until we find
         # one with an adapter match (if any).
         
-        insert_matches = self.aligner.locate(seq2_rc, seq1)
+        insert_matches = self.aligner.locate_packed(
+            packed2.reverse_complement(), packed1)
         
         if insert_matches:
             # Filter by random-match probability
@@ -8,6 +8,13 @@ from cpython.mem cimport PyMem_Malloc, PyMem_Free, PyMem_Realloc
 from cpython.array cimport array, clone
 cdef array ld_array = array('d', [])
 from libc.math cimport ceil
+from libc.stdint cimport uint64_t
+from libc.string cimport memset
+from atropos.util import reverse_complement
+
+cdef extern from *:
+    int __builtin_popcountll(unsigned long long) nogil
+    unsigned long long __builtin_bswap64(unsigned long long) nogil
 
 DEF START_WITHIN_SEQ1 = 1
 DEF START_WITHIN_SEQ2 = 2
@@ -82,8 +89,21 @@ def _iupac_table():
         t[ord(c.lower())] = v
     return bytes(t)
 
+def _packed_table():
+    """
+    Return a translation table that maps A, C, G, T characters to the 2-bit
+    codes 0-3 used by PackedSequence, N to 4 and all other characters
+    (including lowercase and IUPAC characters) to 5.
+    """
+    t = bytearray(b'\5') * 256
+    for i, c in enumerate('ACGT'):
+        t[ord(c)] = i
+    t[ord('N')] = 4
+    return bytes(t)
+
 cdef bytes ACGT_TABLE = _acgt_table()
 cdef bytes IUPAC_TABLE = _iupac_table()
+cdef bytes PACKED_TABLE = _packed_table()
 
 class DPMatrix:
     """
@@ -182,6 +202,7 @@ cdef class Aligner:
     """
     cdef int m
     cdef _Entry* column  # one column of the DP matrix
+    cdef int _column_size  # allocated size of column
     cdef double max_error_rate
     cdef int flags
     cdef int _insertion_cost
@@ -232,10 +253,14 @@ cdef class Aligner:
             return self._reference
 
         def __set__(self, str reference):
-            mem = <_Entry*> PyMem_Realloc(self.column, (len(reference) + 1) * sizeof(_Entry))
-            if not mem:
-                raise MemoryError()
-            self.column = mem
+            # The column is only ever grown, so that an aligner can be reused
+            # for many references of similar length (e.g. one per read).
+            if len(reference) + 1 > self._column_size:
+                mem = <_Entry*> PyMem_Realloc(self.column, (len(reference) + 1) * sizeof(_Entry))
+                if not mem:
+                    raise MemoryError()
+                self.column = mem
+                self._column_size = len(reference) + 1
             self._reference = reference.encode('ascii')
             self.m = len(reference)
             if self.wildcard_ref:
@@ -489,12 +514,242 @@ cdef class Aligner:
     def __dealloc__(self):
         PyMem_Free(self.column)
 
+# Packed sequences: two bits per base, 32 bases per 64-bit word. Base i is
+# stored in bits 2*(i%32) and 2*(i%32)+1 of word i/32 (a "lane"). A parallel
+# mask has the low bit of a lane set wherever the base is not A, C, G or T.
+
+cdef uint64_t LANE_LOW_BITS = 0x5555555555555555ULL
+
+cdef inline uint64_t _lanes_mask(int n) nogil:
+    """Return a mask that covers the first `n` lanes of a word."""
+    if n >= 32:
+        return ~(<uint64_t>0)
+    return ((<uint64_t>1) << (n << 1)) - 1
+
+cdef inline uint64_t _window(const uint64_t* words, int pos) nogil:
+    """Return the 32 lanes starting at lane `pos`."""
+    cdef int w = pos >> 5
+    cdef int shift = (pos & 31) << 1
+    if shift == 0:
+        return words[w]
+    return (words[w] >> shift) | (words[w + 1] << (64 - shift))
+
+cdef inline uint64_t _reverse_lanes(uint64_t x) nogil:
+    """Reverse the order of the lanes in a word."""
+    x = ((x >> 2) & 0x3333333333333333ULL) | ((x & 0x3333333333333333ULL) << 2)
+    x = ((x >> 4) & 0x0F0F0F0F0F0F0F0FULL) | ((x & 0x0F0F0F0F0F0F0F0FULL) << 4)
+    return __builtin_bswap64(x)
+
+cdef int _count_mismatches(
+        PackedSequence seq1, int start1, PackedSequence seq2, int start2,
+        int length) nogil:
+    """
+    Count the positions at which seq1[start1:start1+length] and
+    seq2[start2:start2+length] differ. Two masked positions are considered
+    equal (i.e. N matches N), as they are when comparing ASCII characters.
+    """
+    cdef int i = 0
+    cdef int mismatches = 0
+    cdef uint64_t diff, mask1, mask2
+    while i < length:
+        diff = _window(seq1.bases, start1 + i) ^ _window(seq2.bases, start2 + i)
+        diff = (diff | (diff >> 1)) & LANE_LOW_BITS
+        mask1 = _window(seq1.nmask, start1 + i)
+        mask2 = _window(seq2.nmask, start2 + i)
+        diff = (diff & ~(mask1 | mask2)) | (mask1 ^ mask2)
+        if length - i < 32:
+            diff &= _lanes_mask(length - i)
+        mismatches += __builtin_popcountll(diff)
+        i += 32
+    return mismatches
+
+cdef class PackedSequence:
+    """
+    A nucleotide sequence packed into 64-bit words using two bits per base
+    (A=0, C=1, G=2, T=3), plus a mask of the positions that hold any other
+    character. Comparisons between packed sequences are done a word at a time
+    using XOR/popcount, and the reverse complement is computed a word at a
+    time.
+    
+    Positions that hold N are only distinguishable from other non-ACGT
+    characters by the `acgtn` attribute, which is False if the sequence
+    contains characters other than (uppercase) A, C, G, T and N. Functions
+    that accept packed sequences fall back to comparing the original strings
+    in that case.
+    """
+    cdef uint64_t* bases
+    cdef uint64_t* nmask
+    cdef int nwords
+    cdef readonly int length
+    cdef readonly bint acgtn
+    cdef str _sequence
+    
+    def __cinit__(self, str sequence=None):
+        self.acgtn = True
+        self._sequence = sequence
+        if sequence is not None:
+            self._allocate(len(sequence))
+            self._pack(sequence)
+    
+    cdef _allocate(self, int length):
+        # Allocate one spare (zeroed) word for each array so that _window can
+        # always read the word following the one that contains `pos`.
+        self.length = length
+        self.nwords = (length + 31) >> 5
+        self.bases = <uint64_t*> PyMem_Malloc(
+            2 * (self.nwords + 1) * sizeof(uint64_t))
+        if not self.bases:
+            raise MemoryError()
+        memset(self.bases, 0, 2 * (self.nwords + 1) * sizeof(uint64_t))
+        self.nmask = self.bases + self.nwords + 1
+    
+    cdef _pack(self, str sequence):
+        cdef bytes code_bytes = sequence.encode('ascii').translate(PACKED_TABLE)
+        cdef const unsigned char* codes = code_bytes
+        cdef int i
+        cdef uint64_t code
+        for i in range(self.length):
+            code = codes[i]
+            if code < 4:
+                self.bases[i >> 5] |= code << ((i & 31) << 1)
+            else:
+                self.nmask[i >> 5] |= (<uint64_t>1) << ((i & 31) << 1)
+                if code > 4:
+                    self.acgtn = False
+    
+    cdef void _clear_tail(self) nogil:
+        cdef int rem = self.length & 31
+        if rem:
+            self.bases[self.nwords - 1] &= _lanes_mask(rem)
+            self.nmask[self.nwords - 1] &= _lanes_mask(rem)
+    
+    @property
+    def sequence(self):
+        """The unpacked sequence string."""
+        if self._sequence is None:
+            self._sequence = self._unpack()
+        return self._sequence
+    
+    cdef str _unpack(self):
+        cdef bytearray result = bytearray(self.length)
+        cdef char* buf = result
+        cdef const char* alphabet = b'ACGT'
+        cdef int i, shift
+        for i in range(self.length):
+            shift = (i & 31) << 1
+            if (self.nmask[i >> 5] >> shift) & 1:
+                buf[i] = b'N'
+            else:
+                buf[i] = alphabet[(self.bases[i >> 5] >> shift) & 3]
+        return result.decode('ascii')
+    
+    cpdef PackedSequence reverse_complement(self):
+        """
+        Return the reverse complement of this sequence. The lanes of each word
+        are reversed and complemented (by XOR with 0b11), and the words are
+        then shifted down to remove the padding at the end of the last word.
+        """
+        cdef PackedSequence result = PackedSequence.__new__(PackedSequence)
+        cdef int nwords = self.nwords
+        cdef int pad = (nwords << 5) - self.length
+        cdef int w
+        result._allocate(self.length)
+        result.acgtn = self.acgtn
+        with nogil:
+            for w in range(nwords):
+                result.bases[w] = ~_reverse_lanes(self.bases[nwords - 1 - w])
+                result.nmask[w] = _reverse_lanes(self.nmask[nwords - 1 - w])
+            if pad:
+                for w in range(nwords):
+                    result.bases[w] = _window(result.bases, (w << 5) + pad)
+                    result.nmask[w] = _window(result.nmask, (w << 5) + pad)
+            result._clear_tail()
+        if not self.acgtn:
+            # The masked characters cannot be recovered from the packed
+            # representation, so keep the exact string.
+            result._sequence = reverse_complement(self.sequence)
+        return result
+    
+    cdef PackedSequence _slice(self, int start, int stop):
+        cdef PackedSequence result = PackedSequence.__new__(PackedSequence)
+        cdef int w
+        result._allocate(stop - start)
+        result.acgtn = self.acgtn
+        with nogil:
+            for w in range(result.nwords):
+                result.bases[w] = _window(self.bases, start + (w << 5))
+                result.nmask[w] = _window(self.nmask, start + (w << 5))
+            result._clear_tail()
+        if self._sequence is not None:
+            result._sequence = self._sequence[start:stop]
+        return result
+    
+    def kmers(self, int k):
+        """
+        Return a list of all k-mers (1 <= k <= 32) in this sequence, in order.
+        A k-mer that consists only of A, C, G and T is returned as an int
+        (the packed lanes); any other k-mer is returned as a string. Thus, two
+        k-mers are equal if and only if the corresponding substrings are equal.
+        """
+        if k < 1 or k > 32:
+            raise ValueError("k must be between 1 and 32")
+        cdef uint64_t kmask = _lanes_mask(k)
+        cdef list result = []
+        cdef int i
+        for i in range(self.length - k + 1):
+            if _window(self.nmask, i) & kmask:
+                result.append(self.sequence[i:(i+k)])
+            else:
+                result.append(_window(self.bases, i) & kmask)
+        return result
+    
+    def __getitem__(self, key):
+        """slicing (step must be 1)"""
+        if not isinstance(key, slice):
+            raise TypeError("PackedSequence only supports slicing")
+        start, stop, step = key.indices(self.length)
+        if step != 1:
+            raise ValueError("PackedSequence slices must have step 1")
+        return self._slice(start, max(start, stop))
+    
+    def __len__(self):
+        return self.length
+    
+    def __str__(self):
+        return self.sequence
+    
+    def __repr__(self):
+        return '<PackedSequence({0!r})>'.format(self.sequence)
+    
+    def __dealloc__(self):
+        PyMem_Free(self.bases)
+
+def compare_packed(PackedSequence ref, PackedSequence query, bint suffix=False):
+    """
+    Equivalent of compare_prefixes (or compare_suffixes, if `suffix` is True)
+    for packed sequences without wildcards.
+    """
+    cdef int m = ref.length
+    cdef int n = query.length
+    cdef int length = min(m, n)
+    cdef int ref_start = m - length if suffix else 0
+    cdef int query_start = n - length if suffix else 0
+    cdef int mismatches
+    if ref.acgtn and query.acgtn:
+        mismatches = _count_mismatches(ref, ref_start, query, query_start, length)
+    else:
+        mismatches = compare_prefixes(
+            ref.sequence[ref_start:], query.sequence[query_start:])[5]
+    return (
+        ref_start, ref_start + length, query_start, query_start + length,
+        length - mismatches, mismatches)
+
 def locate(str reference, str query, double max_error_rate, int flags=SEMIGLOBAL, bint wildcard_ref=False, bint wildcard_query=False, int min_overlap=1):
     aligner = Aligner(reference, max_error_rate, flags, wildcard_ref, wildcard_query)
     aligner.min_overlap = min_overlap
     return aligner.locate(query)
 
-def compare_prefixes(str ref, str query, bint wildcard_ref=False, bint wildcard_query=False):
+def compare_prefixes(ref, query, bint wildcard_ref=False, bint wildcard_query=False):
     """
     Find out whether one string is the prefix of the other one, allowing
     IUPAC wildcards in ref and/or query if the appropriate flag is set.
@@ -502,8 +757,18 @@ def compare_prefixes(str ref, str query, bint wildcard_ref=False, bint wildcard_
     This is used to find an anchored 5' adapter (type 'FRONT') in the 'no indels' mode.
     This is very simple as only the number of errors needs to be counted.
 
+    ref and query may also both be PackedSequences, in which case wildcards
+    are not allowed.
+    
     This function returns a tuple compatible with what Aligner.locate outputs.
     """
+    if isinstance(ref, PackedSequence) and isinstance(query, PackedSequence):
+        if wildcard_ref or wildcard_query:
+            raise ValueError("Wildcards are not supported for packed sequences")
+        return compare_packed(ref, query)
+    return _compare_prefixes(ref, query, wildcard_ref, wildcard_query)
+
+cdef tuple _compare_prefixes(str ref, str query, bint wildcard_ref, bint wildcard_query):
     cdef int m = len(ref)
     cdef int n = len(query)
     cdef bytes query_bytes = query.encode('ascii')
@@ -539,6 +804,14 @@ def compare_prefixes(str ref, str query, bint wildcard_ref=False, bint wildcard_
     # length - matches = no. of errors
     return (0, length, 0, length, matches, length - matches)
 
+cpdef double log_rmp_lookup(double[::1] log_table, int matches, int size) nogil:
+    """
+    Look up a log random-match probability in a flat triangular table created
+    by atropos.util.RandomMatchProbability.log_table. The table must cover
+    `size`. Can be called from C code without the GIL.
+    """
+    return log_table[((size * (size + 1)) >> 1) + matches]
+
 DEF OVERHANG_MULTIPLIER = 100000
 
 cdef class MultiAligner:
@@ -760,6 +1033,52 @@ cdef class MultiAligner:
         
         return result
 
+    def locate_packed(self, PackedSequence reference, PackedSequence query, int max_matches=100):
+        """
+        Same as locate, but for packed sequences. Only supported when the
+        flags are START_WITHIN_SEQ1 | STOP_WITHIN_SEQ2 (i.e. when looking for
+        a prefix of the query that overlaps a suffix of the reference), in
+        which case each candidate overlap is scored by counting mismatches a
+        word at a time rather than by filling in the DP matrix. The result is
+        identical to that of locate. Falls back to locate if either sequence
+        contains characters other than A, C, G, T and N.
+        """
+        if self.flags != START_WITHIN_SEQ1 | STOP_WITHIN_SEQ2:
+            raise ValueError(
+                "locate_packed requires flags START_WITHIN_SEQ1 | STOP_WITHIN_SEQ2")
+        if not (reference.acgtn and query.acgtn):
+            return self.locate(reference.sequence, query.sequence, max_matches)
+        
+        cdef int m = reference.length
+        cdef int n = query.length
+        cdef int max_length = min(m, n)
+        cdef double max_error_rate = self.max_error_rate
+        cdef int min_overlap = self._min_overlap
+        cdef list result = []
+        cdef tuple match = None
+        cdef int length, cost
+        
+        for length in range(1, max_length + 1):
+            with nogil:
+                cost = _count_mismatches(reference, m - length, query, 0, length)
+            if length < min_overlap or cost > length * max_error_rate:
+                match = None
+                continue
+            match = (m - length, m, 0, length, length - cost, cost)
+            if cost == 0 and length == m:
+                # exact match, stop early
+                return [match]
+            result.append(match)
+            if len(result) >= max_matches:
+                break
+        else:
+            # When the whole query overlaps the reference, locate reports the
+            # match in the last column a second time.
+            if n <= m and match is not None:
+                result.append(match)
+        
+        return result or None
+    
     def _create_match(self, _Match _match):
         cdef int start1, start2
         if _match.origin >= 0:
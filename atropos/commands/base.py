@@ -2,25 +2,37 @@
 """
 from collections import Sequence
 import copy
+import glob
+import logging
+import os
 import platform
 import sys
 from atropos import __version__
 from atropos.adapters import AdapterCache
 from atropos.io.seqio import open_reader, sra_reader
-from atropos.util import MergingDict, Const, Summarizable, Timing
+from atropos.util import (
+    MergingDict, Const, Summarizable, Timing, cprofiled, merge_cprofiles,
+    reservoir_sample)
 
 class Pipeline(object):
     """Base class for analysis pipelines.
+    
+    A pipeline may set `stopped` to True to stop reading input before it is
+    exhausted (e.g. once it has seen enough records); this is only honored in
+    serial mode.
     """
     def __init__(self):
         self.record_counts = {}
         self.bp_counts = {}
+        self.stopped = False
     
     def __call__(self, command_runner, raise_on_error=False, **kwargs):
         self.start(**kwargs)
         try:
             for batch in command_runner.iterator():
                 self.process_batch(batch)
+                if self.stopped:
+                    break
         except Exception as err:
             if raise_on_error:
                 raise
@@ -108,18 +120,28 @@ class SingleEndPipelineMixin(object):
     """Mixin for pipelines that implements `handle_record` for single-end data.
     """
     def handle_record(self, context, record):
+        return self.handle_reads(context, *self.record_reads(context, record))
+    
+    def record_reads(self, context, record):
+        """Count the bases in a record and return its reads as a tuple.
+        """
         context['bp'][0] += len(record)
-        return self.handle_reads(context, record)
+        return (record,)
 
 class PairedEndPipelineMixin(object):
     """Mixin for pipelines that implements `handle_record` for paired-end data.
     """
     def handle_record(self, context, record):
+        return self.handle_reads(context, *self.record_reads(context, record))
+    
+    def record_reads(self, context, record):
+        """Count the bases in a record and return its reads as a tuple.
+        """
         read1, read2 = record
         bps = context['bp']
         bps[0] += len(read1.sequence)
         bps[1] += len(read2.sequence)
-        return self.handle_reads(context, read1, read2)
+        return record
 
 class Summary(MergingDict):
     """Contains summary information.
@@ -166,6 +188,9 @@ class BaseCommandRunner(object):
     Args:
         options: Command-line options.
     """
+    # Whether reads keep the text of their input records (see Sequence.raw)
+    keep_raw_records = False
+    
     def __init__(self, options, summary_class=Summary):
         self.options = options
         self.summary = summary_class()
@@ -176,6 +201,11 @@ class BaseCommandRunner(object):
         self.done = False
         self._empty_batch = [None] * self.size
         self._progress_options = None
+        self._cprofile_prefix = None
+        if options.cprofile:
+            os.makedirs(options.cprofile, exist_ok=True)
+            self._cprofile_prefix = os.path.join(
+                options.cprofile, 'atropos-{}'.format(os.getpid()))
         
         if options.sra_reader:
             self.reader = reader = sra_reader(
@@ -189,18 +219,23 @@ class BaseCommandRunner(object):
                 input2 = options.input2
             else:
                 qualfile = options.input2
+            # Reads held in the reservoir would otherwise pin the whole chunk
+            # of text that each of them was read from.
+            keep_raw = self.keep_raw_records and not options.sample_reads
             self.reader = reader = open_reader(
                 file1=input1, file2=input2, file_format=options.format, 
                 qualfile=qualfile, quality_base=options.quality_base, 
                 colorspace=options.colorspace, interleaved=interleaved, 
-                input_read=options.input_read)
+                input_read=options.input_read,
+                keep_raw=keep_raw)
         
         # Wrap reader in subsampler
-        if options.subsample:
+        if options.subsample or options.sample_reads:
             import random
             if options.subsample_seed:
                 random.seed(options.subsample_seed)
-            
+        
+        if options.subsample:
             def subsample(reader, frac):
                 """Generator that yields a random subsample of records.
                 
@@ -214,6 +249,19 @@ class BaseCommandRunner(object):
             
             reader = subsample(reader, options.subsample)
         
+        if options.sample_reads:
+            def sample(reader, size):
+                """Generator that yields a uniform random sample of records.
+                The sample is selected once the first record is requested.
+                
+                Args:
+                    reader: The reader from which to sample.
+                    size: The number of records to yield.
+                """
+                yield from reservoir_sample(reader, size)
+            
+            reader = sample(reader, options.max_reads)
+        
         self.iterable = enumerate(reader, 1)
         
         if options.progress:
@@ -320,7 +368,8 @@ class BaseCommandRunner(object):
         """
         with self.timing:
             try:
-                self.return_code = self()
+                with cprofiled(self.cprofile_path('main')):
+                    self.return_code = self()
             except Exception as err: # pylint: disable=broad-except
                 self.summary['exception'] = dict(
                     message=str(err),
@@ -329,8 +378,37 @@ class BaseCommandRunner(object):
             finally:
                 self.finish()
         
+        if self._cprofile_prefix:
+            self.merge_cprofiles()
+        
         return (self.return_code, self.summary)
     
+    def cprofile_path(self, name):
+        """Returns the path of the cProfile stats file for the process with
+        the given name, or None if cProfile profiling (--cprofile) is not
+        enabled. All the stats files written during a run share a prefix that
+        includes the PID of the main process.
+        
+        Args:
+            name: The process name (e.g. 'main', 'worker1'). May contain
+                format placeholders, which are filled in by the process.
+        """
+        if self._cprofile_prefix:
+            return '{}.{}.prof'.format(self._cprofile_prefix, name)
+    
+    def merge_cprofiles(self):
+        """Merge the cProfile stats files written by the main, worker and
+        writer processes into '<prefix>.prof'.
+        """
+        paths = glob.glob('{}.*.prof'.format(self._cprofile_prefix))
+        if not paths:
+            return
+        outfile = '{}.prof'.format(self._cprofile_prefix)
+        merge_cprofiles(paths, outfile)
+        logging.getLogger().info(
+            "Wrote combined profile of %d processes to %s", len(paths),
+            outfile)
+    
     def __call__(self):
         """Execute the command. Must be implemented within the command
         module.
@@ -112,6 +112,12 @@ class BaseCommandParser(object):
             choices=('bar', 'msg'), default=None,
             help="Show progress. bar = show progress bar; msg = show a status "
                  "message. (no)")
+        self.parser.add_argument(
+            "--cprofile",
+            type=writeable_dir, default=None, metavar="DIR",
+            help="Profile the main process and all worker/writer processes "
+                 "using cProfile. The stats of each process, and their "
+                 "combination, are written as .prof files to DIR. (no)")
         self.parser.add_argument(
             "--quiet",
             action='store_true', default=False,
@@ -190,6 +196,13 @@ class BaseCommandParser(object):
             "--subsample",
             type=probability, default=None, metavar="PROB",
             help="Subsample a fraction of reads. (no)")
+        group.add_argument(
+            "--sample-reads",
+            action="store_true", default=False,
+            help="Process a uniform random sample of --max-reads reads/pairs "
+                 "from the whole input (reservoir sampling) rather than the "
+                 "first --max-reads reads/pairs. The sample is held in memory "
+                 "until the input has been read. (no)")
         group.add_argument(
             "--subsample-seed",
             type=int, default=None, metavar="SEED",
@@ -290,6 +303,9 @@ class BaseCommandParser(object):
         if options.input_read is None:
             options.input_read = PAIRED if options.paired else SINGLE
         
+        if options.sample_reads and not options.max_reads:
+            parser.error("--sample-reads requires --max-reads")
+        
         # Set sample ID from the input file name(s)
         if options.sample_id is None:
             if options.sra_reader:
@@ -459,6 +475,11 @@ writeable_file = AccessiblePath('f', 'w')
 is in a writeable directory.
 """
 
+writeable_dir = AccessiblePath('d', 'w')
+"""Test that a directory 1) exists and is writeable, or 2) does not exist but
+is in a writeable directory.
+"""
+
 readwriteable_file = ReadwriteableFile()
 """Test that a file is both readable and writeable."""
 
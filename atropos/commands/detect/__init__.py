@@ -4,11 +4,14 @@ from collections import defaultdict
 import logging
 import math
 import re
-from atropos.align import Aligner, SEMIGLOBAL
+from atropos.align import Aligner, PackedSequence, SEMIGLOBAL
 from atropos.commands.base import (
     BaseCommandRunner, Pipeline, SingleEndPipelineMixin, PairedEndPipelineMixin)
 from atropos.util import (
-    reverse_complement, sequence_complexity, enumerate_range, run_interruptible)
+    Mergeable, reverse_complement, sequence_complexity, enumerate_range,
+    run_interruptible)
+from .kmers import (
+    np, CountMinSketch, find_overrepresented_kmers, iter_chunks)
 
 # TODO: Test whether using rc=True in parse_known_contaminants is as fast
 # and as accurate as testing both the forward and reverse complement
@@ -16,17 +19,12 @@ from atropos.util import (
 # Also, offer an option of whether to test the reverse complement, with
 # the default being false.
 
-# TODO: Look at CountTable in khmer 2.1. Otherwise move to pymer.
-# pymer https://github.com/kdmurray91/pymer/tree/master/pymer
-
 # TODO: In KnownContaminantDetector, accept template sequences with wildcards
 # to match against.
 
 # TODO: Re-download sequencing_adapters.fa if it has been updated since last
 # download.
 
-# TODO: parallelize adapter detection for multiple input files.
-
 class CommandRunner(BaseCommandRunner):
     name = 'detect'
     
@@ -43,10 +41,10 @@ class CommandRunner(BaseCommandRunner):
         if not detector:
             if known_contaminants and include == 'known':
                 detector = 'known'
-            elif n_reads <= 50000:
+            elif n_reads <= 50000 or np is not None:
                 detector = 'heuristic'
             else:
-                detector = 'khmer'
+                detector = 'sketch'
         
         if detector == 'known':
             logging.getLogger().debug(
@@ -56,22 +54,27 @@ class CommandRunner(BaseCommandRunner):
             logging.getLogger().debug(
                 "Detecting contaminants using the heuristic algorithm")
             detector_class = HeuristicDetector
-        elif detector == 'khmer':
+        elif detector in ('sketch', 'khmer'):
             logging.getLogger().debug(
                 "Detecting contaminants using the kmer-based algorithm")
-            detector_class = KhmerDetector
+            detector_class = SketchDetector
         
         summary_args = dict(
             kmer_size=kmer_size, n_reads=n_reads, 
             overrep_cutoff=overrep_cutoff, include=include,
             past_end_bases=self.past_end_bases)
         detector_args = dict(
-            known_contaminants=known_contaminants, **summary_args)
+            known_contaminants=known_contaminants,
+            early_stop=self.early_stop,
+            early_stop_interval=self.early_stop_interval, **summary_args)
         
         if self.paired:
-            detector = PairedDetector(detector_class, **detector_args)
+            pipeline_class = PairedDetector
+            pipeline_args = dict(
+                detector_class=detector_class, **detector_args)
         else:
-            detector = detector_class(**detector_args)
+            pipeline_class = detector_class
+            pipeline_args = detector_args
         
         self.summary['detect'] = summary_args
         if known_contaminants:
@@ -82,9 +85,52 @@ class CommandRunner(BaseCommandRunner):
             "Detecting adapters and other potential contaminant "
             "sequences based on %d-mers in %d reads", kmer_size, n_reads)
         
-        # currently only single-threaded operation is supproted
-        self.summary.update(mode='serial', threads=1)
-        return run_interruptible(detector, self, raise_on_error=True)
+        if self.threads is None:
+            self.summary.update(mode='serial', threads=1)
+            detector = pipeline_class(**pipeline_args)
+            retcode = run_interruptible(detector, self, raise_on_error=True)
+            if self.early_stop is not None:
+                self.summary['detect']['early_stop'] = dict(
+                    tolerance=self.early_stop,
+                    interval=self.early_stop_interval,
+                    stopped=detector.stopped,
+                    reads=sum(detector.record_counts.values()))
+            return retcode
+        else:
+            self.summary.update(mode='parallel', threads=self.threads)
+            return self.run_parallel(pipeline_class, pipeline_args)
+    
+    def run_parallel(self, pipeline_class, pipeline_args):
+        """Execute detect in parallel mode. Worker processes filter the reads
+        and return their :class:`DetectorState`s, which are merged; the
+        contaminants are then detected in the main process.
+        
+        Args:
+            pipeline_class: Pipeline class to instantiate.
+            pipeline_args: Arguments to pass to Pipeline constructor.
+        
+        Returns:
+            The return code.
+        """
+        from atropos.commands.multicore import (
+            ParallelPipelineMixin, ParallelPipelineRunner)
+        
+        logging.getLogger().debug(
+            "Starting atropos detect in parallel mode with threads=%d, "
+            "timeout=%d", self.threads, self.process_timeout)
+        
+        if self.threads < 2:
+            raise ValueError("'threads' must be >= 2")
+        
+        pipeline_class = type(
+            'DetectorImpl', (ParallelPipelineMixin, pipeline_class), {})
+        pipeline = pipeline_class(**pipeline_args)
+        runner = ParallelPipelineRunner(self, pipeline)
+        retcode = runner.run()
+        if retcode == 0:
+            pipeline.state = self.summary['detect'].pop('state')
+            pipeline.add_matches(self.summary)
+        return retcode
 
 class Match(object):
     """A contaminant match.
@@ -197,6 +243,28 @@ class Match(object):
                 known_seqs=self.known_seqs)
         return summary
 
+# Largest kmer that fits in a single word of a PackedSequence.
+MAX_PACKED_KMER_SIZE = 32
+
+def get_kmers(seq, kmer_size):
+    """Returns the set of kmers in a sequence. Kmers of up to
+    `MAX_PACKED_KMER_SIZE` are extracted from the 2-bit packed sequence, and
+    ACGT-only kmers are represented as ints rather than strings.
+    
+    Args:
+        seq: A string or :class:`PackedSequence`.
+        kmer_size: kmer size.
+    
+    Returns:
+        A set of kmers.
+    """
+    if kmer_size <= MAX_PACKED_KMER_SIZE:
+        if not isinstance(seq, PackedSequence):
+            seq = PackedSequence(seq)
+        return set(seq.kmers(kmer_size))
+    seq = str(seq)
+    return set(seq[i:(i+kmer_size)] for i in range(len(seq) - kmer_size + 1))
+
 class ContaminantMatcher(object):
     """Matches a known contaminant against other sequences.
     
@@ -208,9 +276,7 @@ class ContaminantMatcher(object):
     def __init__(self, seq, names, kmer_size):
         self.seq = seq
         self.names = names
-        self.kmers = set(
-            seq[i:(i+kmer_size)]
-            for i in range(len(seq) - kmer_size + 1))
+        self.kmers = get_kmers(seq, kmer_size)
         self.n_kmers = len(self.kmers)
         self.kmer_size = kmer_size
         self.matches = 0
@@ -227,33 +293,120 @@ class ContaminantMatcher(object):
             that match, f2 is the fraction of sequence kmers that match, and
             seq is the best matching sequence (either `seq` or `seqrc`).
         """
-        fw_kmers = set(
-            seq[i:(i+self.kmer_size)]
-            for i in range(len(seq) - self.kmer_size + 1))
-        fw_matches = float(len(self.kmers & fw_kmers))
+        packed = PackedSequence(seq)
+        fw_kmers = get_kmers(packed, self.kmer_size)
+        rv_kmers = get_kmers(packed.reverse_complement(), self.kmer_size)
+        return self.add_match(
+            len(self.kmers & fw_kmers), len(self.kmers & rv_kmers),
+            len(fw_kmers), len(rv_kmers), seq, seqrc)
+    
+    def add_match(
+            self, fw_matches, rv_matches, n_fw_kmers, n_rv_kmers, seq, seqrc):
+        """Add the matches of the contaminant kmers in the forward and reverse
+        complement kmers of a sequence, and score the better of the two.
         
-        rv_kmers = set(
-            seqrc[i:(i+self.kmer_size)]
-            for i in range(len(seqrc) - self.kmer_size + 1))
-        rv_matches = float(len(self.kmers & rv_kmers))
+        Args:
+            fw_matches, rv_matches: The number of contaminant kmers that match
+                `seq` and `seqrc`.
+            n_fw_kmers, n_rv_kmers: The number of kmers in `seq` and `seqrc`.
+            seq: The sequence to match.
+            seqrc: The reverse complement of `seq`, or a callable that returns
+                it.
         
+        Returns:
+            Tuple (f1, f2, seq), as returned by :meth:`match`.
+        """
         if fw_matches >= rv_matches:
-            n_matches = fw_matches
-            kmers = fw_kmers
+            n_matches = float(fw_matches)
+            n_kmers = n_fw_kmers
             compare_seq = seq
         else:
-            n_matches = rv_matches
-            kmers = rv_kmers
-            compare_seq = seqrc
+            n_matches = float(rv_matches)
+            n_kmers = n_rv_kmers
+            compare_seq = seqrc() if callable(seqrc) else seqrc
         
         self.matches += n_matches
         match_frac1 = match_frac2 = 0
         if self.n_kmers > 0:
             match_frac1 = n_matches / self.n_kmers
-        if len(kmers) > 0:
-            match_frac2 = n_matches / len(kmers)
+        if n_kmers > 0:
+            match_frac2 = n_matches / n_kmers
         return (match_frac1, match_frac2, compare_seq)
 
+class ContaminantIndex(object):
+    """An inverted index from kmers to the known contaminants that contain
+    them, for matching a sequence against all known contaminants with a single
+    pass over its kmers.
+    
+    Args:
+        contaminants: A dict of {seq:names}.
+        kmer_size: The kmer size.
+    """
+    def __init__(self, contaminants, kmer_size):
+        self.kmer_size = kmer_size
+        self.matchers = create_contaminant_matchers(contaminants, kmer_size)
+        self.index = defaultdict(list)
+        for contam_idx, contam in enumerate(self.matchers):
+            for kmer in contam.kmers:
+                self.index[kmer].append(contam_idx)
+    
+    def __len__(self):
+        return len(self.matchers)
+    
+    def __iter__(self):
+        return iter(self.matchers)
+    
+    def _count_matches(self, kmers):
+        counts = defaultdict(int)
+        index = self.index
+        for kmer in kmers:
+            if kmer in index:
+                for contam_idx in index[kmer]:
+                    counts[contam_idx] += 1
+        return counts
+    
+    def match(self, seq, seqrc=None, min_match_frac=0):
+        """Match a sequence against all the contaminants. This is equivalent
+        to calling :meth:`ContaminantMatcher.match` for each contaminant, but
+        the kmers of `seq` are only extracted once, and contaminants that do
+        not share any kmers with `seq` are skipped (unless `min_match_frac`
+        is <= 0).
+        
+        Args:
+            seq: The sequence to match.
+            seqrc: The reverse complement of `seq`; computed if needed when
+                None.
+            min_match_frac: The minimum fraction of contaminant kmers that must
+                match.
+        
+        Returns:
+            A list of tuples (contaminant, f1, f2, seq), where contaminant is
+            a :class:`ContaminantMatcher` and the other values are as returned
+            by :meth:`ContaminantMatcher.match`, in the order of the
+            contaminants.
+        """
+        packed = PackedSequence(seq)
+        fw_kmers = get_kmers(packed, self.kmer_size)
+        rv_kmers = get_kmers(packed.reverse_complement(), self.kmer_size)
+        fw_counts = self._count_matches(fw_kmers)
+        rv_counts = self._count_matches(rv_kmers)
+        if min_match_frac > 0:
+            contam_idxs = sorted(set(fw_counts) | set(rv_counts))
+        else:
+            contam_idxs = range(len(self.matchers))
+        if seqrc is None:
+            seqrc = lambda: reverse_complement(seq)
+        
+        matches = []
+        for contam_idx in contam_idxs:
+            contam = self.matchers[contam_idx]
+            match = contam.add_match(
+                fw_counts.get(contam_idx, 0), rv_counts.get(contam_idx, 0),
+                len(fw_kmers), len(rv_kmers), seq, seqrc)
+            if match[0] >= min_match_frac:
+                matches.append((contam,) + match)
+        return matches
+
 def create_contaminant_matchers(contaminants, kmer_size):
     """Create :class:`ContaminantMatcher`s from sequences.
     
@@ -269,6 +422,37 @@ def create_contaminant_matchers(contaminants, kmer_size):
         for seq, names in contaminants.iter_sequences()
     ]
 
+class DetectorState(Mergeable):
+    """The filtered read sequences accumulated by a :class:`Detector`. The
+    states accumulated by worker processes are merged by taking the union of
+    the read sequences.
+    """
+    def __init__(self):
+        self.read_length = None
+        # Index of the batch from which the read length was taken; when
+        # merging, the read length from the earliest batch is used.
+        self.read_length_batch = None
+        self.read_sequences = set()
+    
+    def set_read_length(self, read_length, batch_index=0):
+        """Set the (expected) read length.
+        """
+        assert self.read_length is None
+        self.read_length = read_length
+        self.read_length_batch = batch_index
+    
+    def merge(self, other):
+        if not isinstance(other, DetectorState):
+            raise ValueError(
+                "Cannot merge object of type {}".format(type(other)))
+        if other.read_length is not None and (
+                self.read_length is None or
+                other.read_length_batch < self.read_length_batch):
+            self.read_length = other.read_length
+            self.read_length_batch = other.read_length_batch
+        self.read_sequences |= other.read_sequences
+        return self
+
 class Detector(SingleEndPipelineMixin, Pipeline):
     """Base class for contaminant detectors.
     
@@ -283,19 +467,29 @@ class Detector(SingleEndPipelineMixin, Pipeline):
             that is shorter than the read length + adapter length. Those
             bases will be removed from any sequencers before looking for 
             matching contaminants.
+        early_stop: If not None, the contaminants are periodically detected
+            while reads are being collected, and reading stops once the
+            top contaminants and their frequencies have not changed by more
+            than this (relative) tolerance between two successive checks.
+        early_stop_interval: The number of reads after which contaminants are
+            first checked; the interval doubles after each check.
     """
     def __init__(
             self, kmer_size=12, n_reads=10000, overrep_cutoff=100,
-            include='all', known_contaminants=None, past_end_bases=('A',)):
+            include='all', known_contaminants=None, past_end_bases=('A',),
+            early_stop=None, early_stop_interval=1000):
         super().__init__()
         self.kmer_size = kmer_size
         self.n_reads = n_reads
         self.overrep_cutoff = overrep_cutoff
         self.include = include
         self.known_contaminants = known_contaminants
-        self._read_length = None
-        self._read_sequences = set()
+        self.early_stop = early_stop
+        self.state = DetectorState()
         self._matches = None
+        self._next_check = early_stop_interval
+        self._checked_matches = None
+        self._checked_freqs = None
         self._past_end_regexp = None
         if past_end_bases:
             if len(past_end_bases[0]) > 1:
@@ -312,16 +506,37 @@ class Detector(SingleEndPipelineMixin, Pipeline):
         """
         raise NotImplementedError()
     
-    def set_read_length(self, record):
-        assert self._read_length is None
-        self._read_length = len(record.sequence)
+    @property
+    def _read_length(self):
+        return self.state.read_length
+    
+    @_read_length.setter
+    def _read_length(self, read_length):
+        self.state.read_length = read_length
+    
+    @property
+    def _read_sequences(self):
+        return self.state.read_sequences
+    
+    @_read_sequences.setter
+    def _read_sequences(self, read_sequences):
+        self.state.read_sequences = read_sequences
+    
+    def set_read_length(self, record, batch_index=0):
+        """Set the read length from the first record of the first batch.
+        """
+        self.state.set_read_length(len(record.sequence), batch_index)
     
     def handle_records(self, context, records):
         if context['size'] == 0:
             return
         if self._read_length is None:
-            self.set_read_length(records[0])
+            self.set_read_length(records[0], context['index'])
         super().handle_records(context, records)
+        if self.early_stop is not None:
+            n_reads = sum(self.record_counts.values())
+            if self.check_early_stop(n_reads):
+                self.stop_early(n_reads)
     
     def handle_reads(self, context, read1, read2=None):
         seq = self._filter_seq(read1.sequence)
@@ -346,9 +561,70 @@ class Detector(SingleEndPipelineMixin, Pipeline):
             self._filter_and_sort(**kwargs)
         return self._matches
     
+    def check_early_stop(self, n_reads):
+        """Detect contaminants in the reads collected so far, if a check is
+        due, and compare them to those found by the previous check.
+        
+        Args:
+            n_reads: The number of reads read so far.
+        
+        Returns:
+            True if the top contaminants, and their frequencies, have not
+            changed (within the `early_stop` tolerance) since the previous
+            check.
+        """
+        if n_reads < self._next_check:
+            return False
+        self._next_check = 2 * n_reads
+        
+        max_reads = self.n_reads
+        self.n_reads = n_reads
+        try:
+            self._filter_and_sort(estimate_abundance=False)
+        finally:
+            self.n_reads = max_reads
+            self._checked_matches = self._matches
+            self._matches = None
+        
+        freqs = dict(
+            (match.seq, self._match_frequency(match, n_reads))
+            for match in self._checked_matches)
+        prev_freqs = self._checked_freqs
+        self._checked_freqs = freqs
+        converged = (
+            prev_freqs is not None and
+            freqs.keys() == prev_freqs.keys() and
+            all(
+                abs(freq - prev_freqs[seq]) <= self.early_stop * prev_freqs[seq]
+                for seq, freq in freqs.items()))
+        
+        logging.getLogger().debug(
+            "Detected %d contaminants in %d reads; converged = %s",
+            len(freqs), n_reads, converged)
+        return converged
+    
+    def _match_frequency(self, match, n_reads):
+        """Returns the count of a match, normalized so that it is comparable
+        between different numbers of reads.
+        """
+        return match.count / n_reads
+    
+    def stop_early(self, n_reads):
+        """Stop reading, and use the matches from the last check as the result.
+        
+        Args:
+            n_reads: The number of reads read so far, which becomes the number
+                of sampled reads.
+        """
+        self.n_reads = n_reads
+        self._matches = self._checked_matches
+        for match in self._matches:
+            match.estimate_abundance(self._read_sequences)
+        self.stopped = True
+    
     def _filter_and_sort(
             self, min_len=None, min_complexity=1.1, min_match_frac=0.1, 
-            limit=20):
+            limit=20, estimate_abundance=True):
         """Identify, filter, and sort contaminants.
         
         Args:
@@ -356,15 +632,14 @@ class Detector(SingleEndPipelineMixin, Pipeline):
             min_complexity: Minimum sequence complexity.
             min_match_frac: Minimum fraction of matching kmers.
             limit: Maximum number of contaminants to return.
+            estimate_abundance: Whether to estimate the abundance of the
+                returned contaminants.
         """
         if min_len is None:
             min_len = self.kmer_size
         
         matches = self._get_contaminants()
         
-        for match in matches:
-            match.estimate_abundance(self._read_sequences)
-        
         def _filter(match):
             if match.count < self.min_report_freq:
                 return False
@@ -388,6 +663,12 @@ class Detector(SingleEndPipelineMixin, Pipeline):
         if limit is not None:
             matches = matches[:limit]
         
+        # Abundance is not used for filtering or sorting, so it is only
+        # estimated for the matches that are returned.
+        if estimate_abundance:
+            for match in matches:
+                match.estimate_abundance(self._read_sequences)
+        
         self._matches = matches
     
     def _get_contaminants(self):
@@ -398,8 +679,18 @@ class Detector(SingleEndPipelineMixin, Pipeline):
         """
         raise NotImplementedError()
     
-    def finish(self, summary, **kwargs):
+    def finish(self, summary, worker=None, **kwargs):
         super().finish(summary)
+        if worker is None:
+            self.add_matches(summary, **kwargs)
+        else:
+            # Contaminants are detected by the main process once the states
+            # of all the workers have been merged.
+            summary['detect'] = dict(state=self.state)
+    
+    def add_matches(self, summary, **kwargs):
+        """Add the summaries of the current matches to `summary`.
+        """
         summary['detect']['matches'] = ([
             match.summarize()
             for match in self.matches(**kwargs)
@@ -414,22 +705,51 @@ class PairedDetector(PairedEndPipelineMixin, Pipeline):
         self.read2_detector = detector_class(**kwargs)
         self._read_length_set = False
     
+    @property
+    def state(self):
+        """The tuple of read1 and read2 :class:`DetectorState`s.
+        """
+        return (self.read1_detector.state, self.read2_detector.state)
+    
+    @state.setter
+    def state(self, state):
+        self.read1_detector.state, self.read2_detector.state = state
+    
     def handle_records(self, context, records):
         if context['size'] == 0:
             return
         if not self._read_length_set:
             read1, read2 = records[0]
-            self.read1_detector.set_read_length(read1)
-            self.read2_detector.set_read_length(read2)
+            self.read1_detector.set_read_length(read1, context['index'])
+            self.read2_detector.set_read_length(read2, context['index'])
             self._read_length_set = True
         super().handle_records(context, records)
+        if self.read1_detector.early_stop is not None:
+            n_reads = sum(self.record_counts.values())
+            detectors = (self.read1_detector, self.read2_detector)
+            # Both detectors must be checked at every interval.
+            converged = [
+                detector.check_early_stop(n_reads) for detector in detectors]
+            if all(converged):
+                for detector in detectors:
+                    detector.stop_early(n_reads)
+                self.stopped = True
     
     def handle_reads(self, context, read1, read2):
         self.read1_detector.handle_reads(context, read1)
         self.read2_detector.handle_reads(context, read2)
     
-    def finish(self, summary, **kwargs):
+    def finish(self, summary, worker=None, **kwargs):
         super().finish(summary)
+        if worker is None:
+            self.add_matches(summary, **kwargs)
+        else:
+            summary['detect'] = dict(state=self.state)
+    
+    def add_matches(self, summary, **kwargs):
+        """Add the summaries of the current read1 and read2 matches to
+        `summary`.
+        """
         summary['detect']['matches'] = ([
             match.summarize()
             for match in self.read1_detector.matches(**kwargs)
@@ -440,7 +760,7 @@ class PairedDetector(PairedEndPipelineMixin, Pipeline):
 
 class KnownContaminantDetector(Detector):
     """Test known contaminants against reads. This has linear complexity and is
-    more specific than the khmer matcher, but less specific than the heuristic
+    more specific than the sketch matcher, but less specific than the heuristic
     matcher. It's also less sensitive since it does not try to detect unknown
     contaminants.
     
@@ -466,15 +786,14 @@ class KnownContaminantDetector(Detector):
         return None
     
     def _get_contaminants(self):
-        contaminant_matchers = create_contaminant_matchers(
+        contaminant_index = ContaminantIndex(
             self.known_contaminants, self.kmer_size)
         counts = defaultdict(lambda: 0)
 
         for seq in self._read_sequences:
-            seqrc = reverse_complement(seq)
-            for contam in contaminant_matchers:
-                match = contam.match(seq, seqrc)
-                if match[0] > self.min_match_frac:
+            for contam, match_frac, _, _ in contaminant_index.match(
+                    seq, min_match_frac=self.min_match_frac):
+                if match_frac > self.min_match_frac:
                     counts[contam] += 1
         
         min_count = math.ceil(
@@ -491,8 +810,10 @@ class KnownContaminantDetector(Detector):
 
 class HeuristicDetector(Detector):
     """Use a heuristic iterative algorithm to arrive at likely contaminants.
-    This is the most accurate algorithm overall, but it has quadratic complexity
-    and becomes too slow/memory-intenstive when n_reads > 50k.
+    This is the most accurate algorithm overall. When numpy is available, kmers
+    are counted as integers (see :func:`find_overrepresented_kmers`), which
+    scales to millions of reads; the pure-python implementation has quadratic
+    complexity and becomes too slow/memory-intensive when n_reads > 50k.
     """
     def __init__(
             self, min_freq=0.001, min_contaminant_match_frac=0.9, **kwargs):
@@ -504,17 +825,44 @@ class HeuristicDetector(Detector):
     def min_report_freq(self):
         return 0.1 * self.n_reads
     
-    def _get_contaminants(self):
-        def _min_count(kmer_size):
-            return math.ceil(self.n_reads * max(
-                self.min_freq,
-                (self._read_length - kmer_size + 1) * self.overrep_cutoff /
-                float(4**kmer_size)))
+    def _min_count(self, kmer_size):
+        """The minimum count for a kmer of size `kmer_size` to be considered
+        over-represented.
+        """
+        return math.ceil(self.n_reads * max(
+            self.min_freq,
+            (self._read_length - kmer_size + 1) * self.overrep_cutoff /
+            float(4**kmer_size)))
+    
+    def _get_candidates(self):
+        """Identify candidate kmers for increasing values of k.
         
+        Returns:
+            A tuple (results, result_seqs), where results is a list of
+            (kmer, count) and result_seqs is a function that returns the
+            sequences that contain a given candidate kmer.
+        """
+        read_sequences = list(self._read_sequences)
+        candidates = None
+        if np is not None:
+            candidates = find_overrepresented_kmers(
+                read_sequences, self.kmer_size, self._min_count)
+        if candidates is None:
+            return self._get_candidates_python(read_sequences)
+        postings = dict(
+            (kmer, seq_idxs) for kmer, _, seq_idxs in candidates)
+        return (
+            [(kmer, count) for kmer, count, _ in candidates],
+            lambda kmer: [read_sequences[idx] for idx in postings[kmer]])
+    
+    def _get_candidates_python(self, read_sequences):
+        """Pure-python implementation of :method:`_get_candidates` that maps
+        each kmer string to the set of sequences that contain it.
+        """
         kmer_size = self.kmer_size
         kmers = defaultdict(lambda: [0, set()])
         
-        for seq in self._read_sequences:
+        for seq in read_sequences:
             for i in range(len(seq) - kmer_size + 1):
                 kmer = seq[i:(i+kmer_size)]
                 kmers[kmer][0] += 1
@@ -524,7 +872,7 @@ class HeuristicDetector(Detector):
         cur = {}
         results = {}
         result_seqs = defaultdict(set)
-        min_count = _min_count(kmer_size)
+        min_count = self._min_count(kmer_size)
         
         # Identify candidate kmers for increasing values of k
         while True:
@@ -553,11 +901,16 @@ class HeuristicDetector(Detector):
                     kmers[kmer][0] += 1
                     kmers[kmer][1].add(seq)
             
-            min_count = _min_count(kmer_size)
+            min_count = self._min_count(kmer_size)
             prev = cur
             cur = {}
         
-        results = list(results.items())
+        return list(results.items()), result_seqs.__getitem__
+    
+    def _get_contaminants(self):
+        results, result_seqs = self._get_candidates()
+        if len(results) == 0:
+            return []
         
         # Now merge overlapping sequences by length and frequency to eliminate
         # redundancy in the set of candidate kmers.
@@ -597,11 +950,11 @@ class HeuristicDetector(Detector):
         min_count = int(results[0][1] * 0.5)
         results = (x for x in results if x[1] >= min_count)
         # Convert to matches
-        matches = [Match(x[0], x[1], reads=result_seqs[x[0]]) for x in results]
+        matches = [Match(x[0], x[1], reads=result_seqs(x[0])) for x in results]
         
         if self.known_contaminants:
             # Match to known sequences
-            contaminants = create_contaminant_matchers(
+            contaminant_index = ContaminantIndex(
                 self.known_contaminants, self.kmer_size)
             known = {}
             unknown = []
@@ -609,10 +962,9 @@ class HeuristicDetector(Detector):
             def find_best_match(seq, best_matches, best_match_frac):
                 """Find best contaminant matches to `seq`.
                 """
-                seqrc = reverse_complement(seq)
-                for contam in contaminants:
-                    match_frac1, match_frac2, compare_seq = contam.match(
-                        seq, seqrc)
+                for contam, match_frac1, match_frac2, compare_seq in \
+                        contaminant_index.match(
+                            seq, min_match_frac=best_match_frac[0]):
                     if match_frac1 < best_match_frac[0]:
                         continue
                     if (
@@ -677,40 +1029,39 @@ class HeuristicDetector(Detector):
         
         return matches
 
-class KhmerDetector(Detector):
-    """Identify contaminants based on kmer frequency using a fast kmer counting
-    approach (as implemented in the khmer library). This approach is fast but
-    not as accurate as the other two.
+class SketchDetector(Detector):
+    """Identify contaminants based on kmer frequency using a fast approximate
+    kmer counting approach (a :class:`CountMinSketch` of kmer counts, in which
+    a sample of kmers is tagged as in the khmer library). This approach is
+    fast but not as accurate as the other two.
     """
     @property
     def min_report_freq(self):
         return 0.0001
     
+    def _match_frequency(self, match, n_reads):
+        # Counts are already relative to the number of kmers in the reads
+        return match.count
+    
     def _get_contaminants(self):
-        from khmer import Countgraph, khmer_args
+        if np is None:
+            raise ValueError("The sketch detector requires numpy")
         # assuming all sequences are same length
         n_win = self._read_length - self.kmer_size + 1
         tablesize = self.n_reads * n_win
-        countgraph = Countgraph(
-            self.kmer_size, tablesize, khmer_args.DEFAULT_N_TABLES)
-        countgraph.set_use_bigcount(True)
-        
-        for seq in self._read_sequences:
-            countgraph.consume_and_tag(seq)
-        
         n_expected = math.ceil(tablesize / float(4**self.kmer_size))
         min_count = n_expected * self.overrep_cutoff
-        if min_count >= 2**16:
+        if min_count >= 2**32:
             raise ValueError(
                 "The minimum count for an over-represented k-kmer {} is "
-                "greater than the max khmer count (2^16)".format(min_count))
-    
-        candidates = {}
+                "greater than the max sketch count (2^32)".format(min_count))
+        
+        sketch = CountMinSketch.for_detection(
+            tablesize, self.kmer_size, min_count)
+        for _, chunk in iter_chunks(list(self._read_sequences)):
+            sketch.consume_and_tag(chunk)
         
-        for tag in countgraph.get_tagset():
-            count = countgraph.get(tag)
-            if count >= min_count:
-                candidates[tag] = count
+        candidates = sketch.frequent_tags(min_count)
         
         if self.known_contaminants:
             matches = []
@@ -762,6 +1113,9 @@ class KhmerDetector(Detector):
         
         return matches
 
+# The sketch detector was previously implemented using khmer.
+KhmerDetector = SketchDetector
+
 def align(seq1, seq2, min_overlap_frac=0.9):
     """Align two sequences.
     
@@ -2,8 +2,8 @@
 """
 from atropos.io import STDOUT, STDERR
 from atropos.commands.cli import (
-    BaseCommandParser, positive, readable_url, writeable_file,
-    readwriteable_file)
+    BaseCommandParser, configure_threads, positive, probability, int_or_str,
+    readable_url, writeable_file, readwriteable_file)
 
 class CommandParser(BaseCommandParser):
     name = 'detect'
@@ -27,9 +27,9 @@ you don't know what are the adapter sequences.
         group.add_argument(
             "-d",
             "--detector",
-            choices=('known', 'heuristic', 'khmer'), default=None,
-            help="Which detector to use. (automatically choose based on other "
-                 "options)")
+            choices=('known', 'heuristic', 'sketch', 'khmer'), default=None,
+            help="Which detector to use. 'khmer' is an alias for 'sketch'. "
+                 "(automatically choose based on other options)")
         group.add_argument(
             "-k",
             "--kmer-size",
@@ -44,6 +44,21 @@ you don't know what are the adapter sequences.
                  "length. Those bases will be removed from any sequencers "
                  "before looking for matching contaminants. Can also be a "
                  "regular expression.")
+        group.add_argument(
+            "--early-stop",
+            type=probability, nargs="?", const=0.1, default=None,
+            metavar="TOLERANCE",
+            help="Periodically detect contaminants while reading, and stop "
+                 "reading (before --max-reads) once the top contaminants and "
+                 "their frequencies change by no more than TOLERANCE "
+                 "(relative) between two successive checks. Not supported "
+                 "with --threads. (no; 0.1 if TOLERANCE is omitted)")
+        group.add_argument(
+            "--early-stop-interval",
+            type=positive(), default=1000, metavar="N",
+            help="Number of reads after which contaminants are first checked "
+                 "with --early-stop; the interval doubles after each check. "
+                 "(1000)")
         group.add_argument(
             "-i",
             "--include-contaminants",
@@ -115,9 +130,38 @@ you don't know what are the adapter sequences.
             type=positive(), default=None,
             help="The maximum number of candidate adapters to report. "
                  "(report all)")
+        
+        group = self.add_group(
+            "Parallel", title="Parallel (multi-core) options")
+        group.add_argument(
+            "-T",
+            "--threads",
+            type=positive(int, True), default=None, metavar="THREADS",
+            help="Number of threads to use for filtering reads. Set to 0 to "
+                 "use max available threads. (Do not use multithreading)")
+        group.add_argument(
+            "--process-timeout",
+            type=positive(int, True), default=60, metavar="SECONDS",
+            help="Number of seconds process should wait before escalating "
+                 "messages to ERROR level. (60)")
+        group.add_argument(
+            "--read-queue-size",
+            type=int_or_str, default=None, metavar="SIZE",
+            help="Size of queue for batches of reads to be processed. "
+                 "(THREADS * 100)")
     
     def validate_command_options(self, options):
         options.report_file = options.output
+        if options.threads is not None:
+            if options.early_stop is not None:
+                self.parser.error("--early-stop cannot be used with --threads")
+            threads = configure_threads(options, self.parser)
+            if options.read_queue_size is None:
+                options.read_queue_size = threads * 100
+            elif (
+                    options.read_queue_size > 0 and
+                    options.read_queue_size < threads):
+                self.parser.error("Read queue size must be >= than 'threads'")
         is_std = options.report_file in (STDOUT, STDERR)
         if options.fasta:
             if is_std and 'perinput' in options.fasta:
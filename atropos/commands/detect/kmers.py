@@ -0,0 +1,471 @@
+# coding: utf-8
+"""Counting of over-represented kmers using integer-encoded kmers and NumPy
+sort-and-count, and a count-min sketch of kmer counts. Requires numpy.
+"""
+from atropos.util import Mergeable, sequence_complexity
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Number of reads that are encoded at a time when counting the initial kmers.
+CHUNK_SIZE = 50000
+
+# Maximum number of bits in an encoded kmer (keys are signed 64-bit ints).
+MAX_KEY_BITS = 62
+
+# Maximum number of counters in each row of a CountMinSketch.
+MAX_SKETCH_WIDTH = 2**28
+
+def iter_chunks(sequences, chunk_size=CHUNK_SIZE):
+    """Yields (offset, chunk) tuples, where chunk is a list of at most
+    `chunk_size` sequences.
+    """
+    for start in range(0, len(sequences), chunk_size):
+        yield start, sequences[start:(start + chunk_size)]
+
+def get_alphabet(sequences, chunk_size=CHUNK_SIZE):
+    """Determine the characters that occur in `sequences`.
+    
+    Args:
+        sequences: List of sequence strings.
+        chunk_size: Number of sequences to scan at a time.
+    
+    Returns:
+        A tuple (table, radix), where table is an array that maps each byte
+        value to a code in [0, radix), and radix is the number of distinct
+        characters.
+    """
+    counts = np.zeros(256, dtype=np.int64)
+    for _, chunk in iter_chunks(sequences, chunk_size):
+        counts += np.bincount(_as_bytes(chunk), minlength=256)
+    present = counts > 0
+    table = np.zeros(256, dtype=np.uint8)
+    table[present] = np.arange(np.count_nonzero(present))
+    return table, max(1, int(np.count_nonzero(present)))
+
+def acgt_table():
+    """Returns a table that maps A, C, G and T to 0-3, and all other byte
+    values to 4.
+    """
+    table = np.full(256, 4, dtype=np.uint8)
+    for code, base in enumerate('ACGT'):
+        table[ord(base)] = code
+    return table
+
+ACGT_TABLE = acgt_table() if np is not None else None
+
+def encode(sequences, table):
+    """Concatenate and encode `sequences`.
+    
+    Returns:
+        A tuple (codes, offsets, lengths) of arrays.
+    """
+    lengths = np.fromiter(
+        (len(seq) for seq in sequences), dtype=np.int64, count=len(sequences))
+    offsets = np.cumsum(lengths) - lengths
+    return table[_as_bytes(sequences)], offsets, lengths
+
+def _as_bytes(sequences):
+    return np.frombuffer(''.join(sequences).encode('latin-1'), dtype=np.uint8)
+
+def kmer_occurrences(lengths, kmer_size):
+    """Enumerate the kmers in a set of sequences.
+    
+    Args:
+        lengths: Array of sequence lengths.
+        kmer_size: The kmer size.
+    
+    Returns:
+        A tuple (seq_idxs, positions) of arrays, with one element for each kmer.
+    """
+    n_kmers = np.maximum(lengths - kmer_size + 1, 0)
+    total = int(n_kmers.sum())
+    seq_idxs = np.repeat(np.arange(len(lengths)), n_kmers)
+    positions = (
+        np.arange(total, dtype=np.int64) -
+        np.repeat(np.cumsum(n_kmers) - n_kmers, n_kmers))
+    return seq_idxs, positions
+
+def kmer_keys(codes, starts, kmer_size, bits):
+    """Pack kmers into integers, `bits` bits per base.
+    
+    Args:
+        codes: Array of encoded bases.
+        starts: Array of kmer start positions within `codes`.
+        kmer_size: The kmer size.
+        bits: The number of bits per base.
+    
+    Returns:
+        An int64 array of kmer keys.
+    """
+    keys = np.zeros(len(starts), dtype=np.int64)
+    for i in range(kmer_size):
+        keys <<= bits
+        keys |= codes[starts + i]
+    return keys
+
+def find_overrepresented_kmers(sequences, kmer_size, min_count):
+    """Find over-represented kmers of increasing size, as in the heuristic
+    algorithm of :class:`atropos.commands.detect.HeuristicDetector`:
+    
+    1. Count the kmers (of the initial size) in all sequences. Those with a
+       count greater than `min_count(kmer_size)` are frequent.
+    2. Count the kmers of size + 1 in the sequences that contain a frequent
+       kmer.
+    3. Repeat until no kmers are frequent.
+    
+    Frequent kmers of each size (except the largest) become candidates.
+    
+    The initial kmers are packed into integers and counted in chunks, so memory
+    is bounded by the number of distinct kmers. The kmers of size k+1 are
+    identified by (rank of the k-prefix, next base). Only occurrences whose
+    k-prefix could itself be frequent at some larger size are extended, since
+    the count of a kmer is never greater than the count of its prefix.
+    Sequences are tracked by index (postings) rather than by value.
+    
+    Args:
+        sequences: List of sequence strings.
+        kmer_size: The initial kmer size.
+        min_count: Function that returns the minimum count for a kmer of the
+            given size to be considered frequent.
+    
+    Returns:
+        A list of (kmer, count, seq_idxs), where seq_idxs is an array of the
+        indexes of the sequences that contain the kmer; or None if the initial
+        kmers do not fit in 64-bit ints.
+    """
+    table, radix = get_alphabet(sequences)
+    bits = max(1, (radix - 1).bit_length())
+    if kmer_size * bits > MAX_KEY_BITS:
+        return None
+    
+    max_len = max(len(seq) for seq in sequences) if sequences else 0
+    # min_count is non-increasing in the kmer size, but take the minimum
+    # anyway; a kmer can only extend to a frequent kmer if its count is
+    # greater than this
+    extend_counts = [
+        min(min_count(larger) for larger in range(size + 1, max_len + 2))
+        for size in range(kmer_size, max_len + 1)]
+    
+    def extend_count(size):
+        idx = size - kmer_size
+        return extend_counts[idx] if idx < len(extend_counts) else None
+    
+    # Count the initial kmers.
+    keys = counts = None
+    for _, chunk in iter_chunks(sequences):
+        chunk_keys = _chunk_kmer_keys(chunk, table, kmer_size, bits)[0]
+        chunk_keys, chunk_counts = np.unique(chunk_keys, return_counts=True)
+        if keys is None:
+            keys, counts = chunk_keys, chunk_counts
+        else:
+            keys, inverse = np.unique(
+                np.concatenate((keys, chunk_keys)), return_inverse=True)
+            counts = np.bincount(
+                inverse, weights=np.concatenate((counts, chunk_counts))
+            ).astype(np.int64)
+    if keys is None or extend_count(kmer_size) is None:
+        return []
+    
+    # Locate the kmers that are frequent or that may extend to frequent kmers.
+    keep = counts > min(extend_count(kmer_size), min_count(kmer_size))
+    keys = keys[keep]
+    id_counts = counts[keep]
+    if len(keys) == 0:
+        return []
+    seq_idxs = []
+    positions = []
+    kmer_ids = []
+    for start, chunk in iter_chunks(sequences):
+        chunk_keys, chunk_seqs, chunk_pos = _chunk_kmer_keys(
+            chunk, table, kmer_size, bits)
+        idxs = np.minimum(np.searchsorted(keys, chunk_keys), len(keys) - 1)
+        hits = keys[idxs] == chunk_keys
+        seq_idxs.append(chunk_seqs[hits] + start)
+        positions.append(chunk_pos[hits])
+        kmer_ids.append(idxs[hits])
+    seq_idxs = np.concatenate(seq_idxs)
+    positions = np.concatenate(positions)
+    kmer_ids = np.concatenate(kmer_ids)
+    
+    # From here on, only the sequences that contain a frequent kmer are needed.
+    frequent = id_counts > min_count(kmer_size)
+    subset = np.unique(seq_idxs[frequent[kmer_ids]])
+    if len(subset) == 0:
+        return []
+    in_subset = np.isin(seq_idxs, subset)
+    seq_idxs = np.searchsorted(subset, seq_idxs[in_subset])
+    positions = positions[in_subset]
+    kmer_ids = kmer_ids[in_subset]
+    subset_seqs = [sequences[idx] for idx in subset.tolist()]
+    codes, offsets, lengths = encode(subset_seqs, table)
+    
+    candidates = []
+    prev = None
+    size = kmer_size
+    while True:
+        frequent = id_counts > min_count(size)
+        is_frequent = frequent[kmer_ids]
+        if not is_frequent.any():
+            break
+        
+        if prev:
+            # Candidates at the previous size are rejected if they occur in a
+            # sequence that is itself a frequent kmer at this size.
+            whole = seq_idxs[
+                is_frequent & (positions == 0) & (lengths[seq_idxs] == size)]
+            for kmer, count, kmer_seqs in prev:
+                if (
+                        not (len(whole) and np.isin(kmer_seqs, whole).any())
+                        and sequence_complexity(kmer) > 1.0):
+                    candidates.append((kmer, count, subset[kmer_seqs]))
+        
+        prev = _describe_frequent(
+            subset_seqs, size, id_counts, kmer_ids[is_frequent],
+            seq_idxs[is_frequent], positions[is_frequent])
+        
+        next_count = extend_count(size)
+        if next_count is None:
+            break
+        in_frequent_seq = np.zeros(len(subset_seqs), dtype=bool)
+        in_frequent_seq[seq_idxs[is_frequent]] = True
+        keep = (
+            in_frequent_seq[seq_idxs] &
+            (id_counts[kmer_ids] > next_count) &
+            (positions + size < lengths[seq_idxs]))
+        seq_idxs = seq_idxs[keep]
+        positions = positions[keep]
+        next_bases = codes[offsets[seq_idxs] + positions + size]
+        _, kmer_ids, id_counts = np.unique(
+            kmer_ids[keep] * radix + next_bases, return_inverse=True,
+            return_counts=True)
+        size += 1
+    
+    return candidates
+
+def _chunk_kmer_keys(chunk, table, kmer_size, bits):
+    codes, offsets, lengths = encode(chunk, table)
+    seq_idxs, positions = kmer_occurrences(lengths, kmer_size)
+    keys = kmer_keys(codes, offsets[seq_idxs] + positions, kmer_size, bits)
+    return keys, seq_idxs, positions
+
+def _describe_frequent(sequences, size, id_counts, kmer_ids, seq_idxs, positions):
+    """Returns a list of (kmer, count, seq_idxs) for the frequent kmers.
+    """
+    ids, first = np.unique(kmer_ids, return_index=True)
+    # unique (kmer, sequence) pairs, grouped by kmer
+    n_seqs = len(sequences)
+    pairs = np.unique(kmer_ids * n_seqs + seq_idxs)
+    pair_seqs = np.split(
+        pairs % n_seqs, np.flatnonzero(np.diff(pairs // n_seqs)) + 1)
+    result = []
+    for kmer_id, idx, kmer_seqs in zip(
+            ids.tolist(), first.tolist(), pair_seqs):
+        seq = sequences[int(seq_idxs[idx])]
+        pos = int(positions[idx])
+        result.append((
+            seq[pos:(pos + size)], int(id_counts[kmer_id]), kmer_seqs))
+    return result
+
+# Default number of kmers between tags (same as khmer's default tag density).
+DEFAULT_TAG_DENSITY = 40
+
+# Multipliers for the multiply-shift hash function of each sketch row.
+HASH_MULTIPLIERS = (
+    0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9,
+    0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53)
+
+def canonical_kmer_keys(sequences, kmer_size):
+    """Pack the kmers in `sequences` that consist only of A, C, G and T into
+    2-bit integer keys. A kmer and its reverse complement have the same
+    (canonical) key: the smaller of the two.
+    
+    Args:
+        sequences: List of sequence strings.
+        kmer_size: The kmer size (at most 32).
+    
+    Returns:
+        A tuple (keys, valid, seq_idxs, positions) of arrays, with one
+        element for each kmer. `valid` is False for kmers that contain another
+        character, whose keys are meaningless.
+    """
+    codes, offsets, lengths = encode(sequences, ACGT_TABLE)
+    seq_idxs, positions = kmer_occurrences(lengths, kmer_size)
+    starts = offsets[seq_idxs] + positions
+    invalid = np.concatenate(((0,), np.cumsum(codes > 3)))
+    valid = invalid[starts + kmer_size] == invalid[starts]
+    codes = np.minimum(codes, 3).astype(np.uint64)
+    forward = np.zeros(len(starts), dtype=np.uint64)
+    reverse = np.zeros(len(starts), dtype=np.uint64)
+    two = np.uint64(2)
+    for i in range(kmer_size):
+        code = codes[starts + i]
+        forward <<= two
+        forward |= code
+        reverse |= (np.uint64(3) - code) << np.uint64(2 * i)
+    return np.minimum(forward, reverse), valid, seq_idxs, positions
+
+def decode_kmer_key(key, kmer_size):
+    """Returns the kmer string for a 2-bit packed key.
+    """
+    key = int(key)
+    return ''.join(
+        'ACGT'[(key >> (2 * (kmer_size - i - 1))) & 3]
+        for i in range(kmer_size))
+
+def tag_positions(n_kmers, tag_density=DEFAULT_TAG_DENSITY):
+    """Select the kmers to tag in each sequence, spaced as in khmer's
+    `consume_and_tag`: the first tag is half way into the first window, tags
+    are `tag_density - 1` kmers apart, and the last kmer is tagged if it is
+    at least half a window past the last tag. Unlike khmer, tags are not
+    re-synchronized to previously seen tags, so the tags of a sequence do not
+    depend on the order in which sequences are consumed.
+    
+    Args:
+        n_kmers: Array with the number of kmers in each sequence.
+        tag_density: The spacing between tags.
+    
+    Returns:
+        A tuple (seq_idxs, positions) of arrays, with one element per tag.
+    """
+    since_start = tag_density // 2 + 1
+    first = tag_density - since_start - 1
+    period = tag_density - 1
+    n_tags = np.where(n_kmers > first, (n_kmers - 1 - first) // period + 1, 0)
+    seq_idxs = np.repeat(np.arange(len(n_kmers)), n_tags)
+    offsets = np.cumsum(n_tags) - n_tags
+    positions = first + period * (
+        np.arange(len(seq_idxs), dtype=np.int64) -
+        np.repeat(offsets, n_tags))
+    # the 'since' counter after the last kmer
+    last_tag = first + period * (n_tags - 1)
+    since_end = np.where(
+        n_tags > 0, n_kmers - last_tag, since_start + n_kmers)
+    tag_last = (n_kmers > 0) & (since_end >= tag_density // 2 - 1)
+    last_idxs = np.flatnonzero(tag_last)
+    return (
+        np.concatenate((seq_idxs, last_idxs)),
+        np.concatenate((positions, n_kmers[last_idxs] - 1)))
+
+class CountMinSketch(Mergeable):
+    """Approximate counts of (canonical) kmers, plus a set of tagged kmers
+    that are candidates for being reported as frequent. This is a replacement
+    for khmer's `Countgraph`.
+    
+    Each kmer is counted in one cell of each of `depth` rows; its count is the
+    minimum of those cells, which can over-estimate, but never
+    under-estimate, the true count.
+    
+    Args:
+        kmer_size: The kmer size (at most 32).
+        width: The number of counters in each row; rounded up to a power of 2.
+        depth: The number of rows.
+        tag_density: The spacing between tagged kmers.
+    """
+    def __init__(
+            self, kmer_size, width, depth=4,
+            tag_density=DEFAULT_TAG_DENSITY):
+        if kmer_size > 32:
+            raise ValueError("kmer_size must be <= 32")
+        if depth > len(HASH_MULTIPLIERS):
+            raise ValueError("depth must be <= {}".format(
+                len(HASH_MULTIPLIERS)))
+        self.kmer_size = kmer_size
+        self.width_bits = max(1, (int(width) - 1).bit_length())
+        self.depth = depth
+        self.tag_density = tag_density
+        self.counts = np.zeros((depth, 1 << self.width_bits), dtype=np.uint32)
+        self.tags = np.zeros(0, dtype=np.uint64)
+        self.n_consumed = 0
+    
+    @classmethod
+    def for_detection(cls, n_kmers, kmer_size, min_count, **kwargs):
+        """Create a sketch for finding the kmers that occur at least
+        `min_count` times among `n_kmers` kmers. The width is chosen such that
+        the expected over-estimate of a count is at most a tenth of
+        `min_count`.
+        """
+        width = min(
+            10 * n_kmers / max(min_count, 1), 4**kmer_size, MAX_SKETCH_WIDTH)
+        return cls(kmer_size, max(width, 1), **kwargs)
+    
+    @property
+    def width(self):
+        """The number of counters in each row.
+        """
+        return self.counts.shape[1]
+    
+    def _cells(self, keys, row):
+        return (
+            (keys * np.uint64(HASH_MULTIPLIERS[row])) >>
+            np.uint64(64 - self.width_bits)).astype(np.int64)
+    
+    def consume_and_tag(self, sequences):
+        """Count all the kmers in `sequences` and tag a sample of them.
+        
+        Args:
+            sequences: List of sequence strings.
+        """
+        keys, valid, seq_idxs, positions = canonical_kmer_keys(
+            sequences, self.kmer_size)
+        kmer_keys = keys[valid]
+        self.n_consumed += len(kmer_keys)
+        for row in range(self.depth):
+            self.counts[row] += np.bincount(
+                self._cells(kmer_keys, row), minlength=self.width
+            ).astype(np.uint32)
+        
+        n_kmers = np.bincount(seq_idxs, minlength=len(sequences))
+        tag_seqs, tag_pos = tag_positions(n_kmers, self.tag_density)
+        # kmers are enumerated in order, so the index of a tagged kmer is the
+        # number of kmers in the preceding sequences plus its position
+        tag_idxs = (np.cumsum(n_kmers) - n_kmers)[tag_seqs] + tag_pos
+        tag_idxs = tag_idxs[valid[tag_idxs]]
+        self.tags = np.union1d(self.tags, keys[tag_idxs])
+    
+    def get_counts(self, keys):
+        """Returns the estimated counts of an array of kmer keys.
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        counts = self.counts[0][self._cells(keys, 0)]
+        for row in range(1, self.depth):
+            counts = np.minimum(counts, self.counts[row][self._cells(keys, row)])
+        return counts
+    
+    def get(self, kmer):
+        """Returns the estimated count of a kmer string.
+        """
+        if len(kmer) != self.kmer_size:
+            raise ValueError("kmer must be of length {}".format(
+                self.kmer_size))
+        keys, valid, _, _ = canonical_kmer_keys([kmer], self.kmer_size)
+        if not valid[0]:
+            return 0
+        return int(self.get_counts(keys)[0])
+    
+    def get_tagset(self):
+        """Returns the list of tagged kmers (in canonical orientation).
+        """
+        return [decode_kmer_key(key, self.kmer_size) for key in self.tags]
+    
+    def frequent_tags(self, min_count):
+        """Returns a dict {kmer: count} of the tagged kmers with an estimated
+        count of at least `min_count`.
+        """
+        counts = self.get_counts(self.tags)
+        frequent = counts >= min_count
+        return dict(
+            (decode_kmer_key(key, self.kmer_size), int(count))
+            for key, count in zip(self.tags[frequent], counts[frequent]))
+    
+    def merge(self, other):
+        if not (
+                isinstance(other, CountMinSketch) and
+                other.kmer_size == self.kmer_size and
+                other.counts.shape == self.counts.shape):
+            raise ValueError("Cannot merge {} with {}".format(other, self))
+        self.counts += other.counts
+        self.tags = np.union1d(self.tags, other.tags)
+        self.n_consumed += other.n_consumed
+        return self
@@ -29,6 +29,14 @@ def generate_reports(outstream, summary):
     """
     names = summary['input']['input_names'] or repeat(None)
     n_reads = summary['record_counts'][0]
+    early_stop = summary['detect'].get('early_stop')
+    if early_stop and early_stop['stopped']:
+        _print = Printer(outstream)
+        _print.newline()
+        _print(
+            "Stopped early after {} reads: the detected contaminants were "
+            "stable to within {:.0%}.".format(
+                early_stop['reads'], early_stop['tolerance']))
     for input_idx, (matches, name) in enumerate(zip(summary['detect']['matches'], names), 1):
         generate_detector_report(outstream, input_idx, n_reads, matches, name)
 
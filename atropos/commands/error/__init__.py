@@ -1,13 +1,22 @@
 """Estimate the empircal error rate.
 """
-from collections import defaultdict
+from collections import Counter, defaultdict
+import copy
 import csv
+import logging
+import math
 import re
 from atropos import AtroposError
 from atropos.commands.base import (
     BaseCommandRunner, Pipeline, SingleEndPipelineMixin, PairedEndPipelineMixin)
+from atropos.commands.stats import BaseCountingArray, BaseCountingDicts
 from atropos.io import open_output
-from atropos.util import qual2prob, run_interruptible
+from atropos.util import PHRED_PROBS, Mergeable, run_interruptible
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 class CommandRunner(BaseCommandRunner):
     name = 'error'
@@ -24,35 +33,121 @@ class CommandRunner(BaseCommandRunner):
         
         estimator_args = dict(max_read_len=self.max_bases)
         if self.paired:
-            estimator = PairedErrorEstimator(
+            pipeline_class = PairedErrorEstimator
+            pipeline_args = dict(
                 estimator_class=estimator_class, **estimator_args)
         else:
-            estimator = estimator_class(**estimator_args)
+            pipeline_class = estimator_class
+            pipeline_args = estimator_args
         
         self.summary['errorrate'] = estimator_args
         
-        # currently only single-threaded operation is supproted
-        self.summary.update(mode='serial', threads=1)
-        return run_interruptible(estimator, self, raise_on_error=True)
+        if self.threads is None:
+            self.summary.update(mode='serial', threads=1)
+            estimator = pipeline_class(**pipeline_args)
+            return run_interruptible(estimator, self, raise_on_error=True)
+        else:
+            self.summary.update(mode='parallel', threads=self.threads)
+            return self.run_parallel(pipeline_class, pipeline_args)
+    
+    def run_parallel(self, pipeline_class, pipeline_args):
+        """Execute error estimation in parallel mode. Worker processes count
+        the reads, and the states of their estimators are merged; the error
+        rates are then estimated in the main process.
+        
+        Args:
+            pipeline_class: Pipeline class to instantiate.
+            pipeline_args: Arguments to pass to Pipeline constructor.
+        
+        Returns:
+            The return code.
+        """
+        from atropos.commands.multicore import (
+            ParallelPipelineMixin, ParallelPipelineRunner)
+        
+        logging.getLogger().debug(
+            "Starting atropos error in parallel mode with threads=%d, "
+            "timeout=%d", self.threads, self.process_timeout)
+        
+        if self.threads < 2:
+            raise ValueError("'threads' must be >= 2")
+        
+        pipeline_class = type(
+            'ErrorEstimatorImpl', (ParallelPipelineMixin, pipeline_class),
+            dict(state_class=pipeline_class))
+        pipeline = pipeline_class(**pipeline_args)
+        runner = ParallelPipelineRunner(self, pipeline)
+        retcode = runner.run()
+        if retcode == 0:
+            pipeline.state = self.summary['errorrate'].pop('state')
+            pipeline.add_estimates(self.summary)
+        return retcode
 
-class ErrorEstimator(SingleEndPipelineMixin, Pipeline):
-    """Base class for error estimators.
+class ErrorEstimator(Mergeable, SingleEndPipelineMixin, Pipeline):
+    """Base class for error estimators. Estimators only accumulate counts,
+    so the estimators of worker processes can be merged before the error rate
+    is estimated.
     """
+    # The class of the estimator's state; set for the (unpicklable) classes
+    # that are created dynamically in parallel mode.
+    state_class = None
+    
     def __init__(self, max_read_len):
         super().__init__()
         self.total_len = 0
         self.max_read_len = max_read_len
     
+    @property
+    def state(self):
+        """A copy of the estimator with the counts accumulated so far, which
+        is an instance of `state_class` if it is set.
+        """
+        state = copy.copy(self)
+        if self.state_class is not None:
+            state.__class__ = self.state_class
+        return state
+    
+    @state.setter
+    def state(self, state):
+        self.__dict__.update(state.__dict__)
+    
+    def handle_records(self, context, records):
+        self.add_reads([
+            self.record_reads(context, record)[0] for record in records])
+    
     def handle_reads(self, context, read1, read2=None):
         raise NotImplementedError()
     
+    def add_reads(self, reads):
+        """Add a batch of reads.
+        """
+        for read in reads:
+            self.handle_reads(None, read)
+    
+    def merge(self, other):
+        if type(other) is not type(self):
+            raise ValueError(
+                "Cannot merge object of type {}".format(type(other)))
+        self.total_len += other.total_len
+        return self
+    
     def estimate(self):
         """Returns an estimate of the error rate.
         """
         raise NotImplementedError()
     
-    def finish(self, summary, **kwargs):
+    def finish(self, summary, worker=None, **kwargs):
         super().finish(summary)
+        if worker is None:
+            self.add_estimates(summary)
+        else:
+            # Error rates are estimated by the main process once the states
+            # of all the workers have been merged.
+            summary['errorrate'] = dict(state=self.state)
+    
+    def add_estimates(self, summary):
+        """Add the error rate estimate to `summary`.
+        """
         estimate, details = self.estimate()
         summary['errorrate'].update(
             estimate=(estimate,), 
@@ -63,22 +158,61 @@ class BaseQualityErrorEstimator(ErrorEstimator):
     """Simple error estimation using base qualities. It is well-known that base
     qualities significantly overestimate true error rates, so take the estimate
     with a grain of salt.
+    
+    The quality characters are counted at each cycle (in a
+    :class:`BaseCountingArray` when numpy is available, otherwise in
+    :class:`BaseCountingDicts`), rather than summing their error
+    probabilities, so memory use only depends on the read length, and the
+    estimate does not depend on the order in which reads are processed. The
+    details of the estimate are the per-cycle error rates.
     """
     def __init__(self, max_read_len=None):
         super().__init__(max_read_len)
-        self.total_qual = 0.0
+        if np is None:
+            self.base_qualities = BaseCountingDicts(is_qualities=True)
+        else:
+            self.base_qualities = BaseCountingArray(is_qualities=True)
     
     def handle_reads(self, context, read1, read2=None):
-        quals = read1.qualities
-        readlen = len(quals)
-        if self.max_read_len and self.max_read_len < readlen:
-            readlen = self.max_read_len
-            quals = quals[:readlen]
-        self.total_qual += sum(qual2prob(qchar) for qchar in quals)
-        self.total_len += readlen
+        self.add_reads((read1,))
+    
+    def add_reads(self, reads):
+        quals = [read.qualities for read in reads]
+        if self.max_read_len:
+            quals = [qual[:self.max_read_len] for qual in quals]
+        if np is None:
+            for qual in quals:
+                for cycle, qchar in enumerate(qual):
+                    self.base_qualities[cycle][qchar] += 1
+                self.total_len += len(qual)
+            return
+        lengths = np.fromiter(
+            (len(qual) for qual in quals), dtype=np.int64, count=len(quals))
+        total = int(lengths.sum())
+        if total == 0:
+            return
+        starts = np.cumsum(lengths) - lengths
+        cycles = np.arange(total, dtype=np.int64) - np.repeat(starts, lengths)
+        codes = np.frombuffer(''.join(quals).encode('latin-1'), dtype=np.uint8)
+        self.base_qualities.add(cycles, codes, int(lengths.max()))
+        self.total_len += total
+    
+    def merge(self, other):
+        super().merge(other)
+        self.base_qualities.merge(other.base_qualities)
+        return self
     
     def estimate(self):
-        return (self.total_qual / self.total_len, None)
+        table = self.base_qualities.summarize()
+        probs = [PHRED_PROBS[qual] for qual in table['columns']]
+        total_prob = 0.0
+        per_cycle = []
+        for cycle, counts in table['rows'].items():
+            cycle_prob = sum(
+                prob * count for prob, count in zip(probs, counts))
+            per_cycle.append([cycle, cycle_prob / sum(counts)])
+            total_prob += cycle_prob
+        return (total_prob / self.total_len, dict(per_cycle=per_cycle))
 
 # Error estimation using shadow counts
 
@@ -93,11 +227,187 @@ write.table(errorRates$cycleER, "{per_cycle}", sep="\t", quote=F, col.names=F,
             row.names=T)
 """
 
+def shadow_counts(seqs, counts):
+    """Count the shadows of each sequence, i.e. the reads that differ from it
+    by a single substitution and occur less often.
+    
+    Sequences of the same length are hashed with each position masked in turn;
+    sequences with the same masked hash are then grouped exactly, and each
+    group contains all the sequences that differ only at that position.
+    
+    Args:
+        seqs: A sequence of distinct read sequences.
+        counts: The number of times each sequence was read.
+    
+    Returns:
+        Tuple (is_shadow, shadows), where `is_shadow` is a boolean array that
+        is True for sequences that differ by a single substitution from a
+        more frequent sequence, and `shadows` is a tuple of arrays (seq_idx,
+        cycle, count) with the number of shadows of each sequence that differ
+        from it at each (0-based) cycle. Only non-zero counts are included.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    is_shadow = np.zeros(len(seqs), dtype=bool)
+    shadow_idxs = []
+    shadow_cycles = []
+    shadow_values = []
+    by_length = defaultdict(list)
+    for seq_idx, seq in enumerate(seqs):
+        by_length[len(seq)].append(seq_idx)
+    
+    for seqlen, seq_idxs in by_length.items():
+        if seqlen == 0 or len(seq_idxs) < 2:
+            continue
+        seq_idxs = np.array(seq_idxs)
+        seq_counts = counts[seq_idxs]
+        bases = np.frombuffer(
+            ''.join(seqs[i] for i in seq_idxs).encode('ascii'),
+            dtype=np.uint8).reshape(len(seq_idxs), seqlen)
+        weights = np.random.RandomState(seqlen).randint(
+            0, 2**63, size=seqlen, dtype=np.uint64) * np.uint64(2) + \
+            np.uint64(1)
+        weighted = bases.astype(np.uint64) * weights
+        hashes = weighted.sum(axis=1, dtype=np.uint64)
+        for cycle in range(seqlen):
+            # Find candidate neighbors by hash, then group them exactly.
+            masked = hashes - weighted[:, cycle]
+            order = np.argsort(masked, kind='mergesort')
+            sorted_hashes = masked[order]
+            dup = sorted_hashes[1:] == sorted_hashes[:-1]
+            if not dup.any():
+                continue
+            candidate = np.zeros(len(order), dtype=bool)
+            candidate[1:] |= dup
+            candidate[:-1] |= dup
+            members = order[candidate]
+            if seqlen == 1:
+                group = np.zeros(len(members), dtype=np.int64)
+            else:
+                masked_bases = np.ascontiguousarray(
+                    np.delete(bases[members], cycle, axis=1))
+                _, group = np.unique(
+                    masked_bases.view(np.dtype((np.void, seqlen - 1))),
+                    return_inverse=True)
+                group = group.ravel()
+            member_counts = seq_counts[members]
+            order = np.lexsort((member_counts, group))
+            members = members[order]
+            group = group[order]
+            member_counts = member_counts[order]
+            
+            size = len(members)
+            positions = np.arange(size)
+            group_start = np.ones(size, dtype=bool)
+            group_start[1:] = group[1:] != group[:-1]
+            tie_start = group_start.copy()
+            tie_start[1:] |= member_counts[1:] != member_counts[:-1]
+            group_first = np.maximum.accumulate(
+                np.where(group_start, positions, 0))
+            tie_first = np.maximum.accumulate(
+                np.where(tie_start, positions, 0))
+            before = np.cumsum(member_counts) - member_counts
+            smaller = before[tie_first] - before[group_first]
+            group_max = np.maximum.reduceat(
+                member_counts, np.flatnonzero(group_start))
+            larger = member_counts < group_max[np.cumsum(group_start) - 1]
+            
+            is_shadow[seq_idxs[members[larger]]] = True
+            nonzero = smaller > 0
+            shadow_idxs.append(seq_idxs[members[nonzero]])
+            shadow_cycles.append(np.full(nonzero.sum(), cycle, dtype=np.int64))
+            shadow_values.append(smaller[nonzero])
+    
+    if shadow_idxs:
+        shadows = tuple(
+            np.concatenate(arrays)
+            for arrays in (shadow_idxs, shadow_cycles, shadow_values))
+    else:
+        shadows = tuple(np.zeros(0, dtype=np.int64) for _ in range(3))
+    return (is_shadow, shadows)
+
+def shadow_regression(counts, is_shadow, shadows):
+    """Estimate the per-read and per-cycle error rates by regressing the shadow
+    counts of sequences on their read counts. Sequences that are themselves
+    shadows of more frequent sequences are excluded.
+    
+    If errors occur independently with probability E at a given cycle, a
+    sequence that is read N times without errors is read N * E / (1 - E) times
+    with a single error at that cycle, so the error rate at each cycle is
+    slope / (1 + slope), where slope is that of the shadows at the cycle. The
+    per-read error rate is the probability of at least one error. Standard
+    errors are approximated from those of the slopes.
+    
+    Args:
+        counts: The number of times each sequence was read.
+        is_shadow, shadows: As returned by :func:`shadow_counts`.
+    
+    Returns:
+        Tuple (per_read, per_cycle), where `per_read` is a dict with the
+        'error rate', 'standard error', and the 'slope' and 'intercept' of the
+        regression of all shadows, and `per_cycle` is a list of [cycle, error
+        rate, standard error], with 1-based cycles.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    founders = ~is_shadow
+    x = counts[founders]
+    num = len(x)
+    x_mean = x.mean() if num else 0.0
+    ssx = ((x - x_mean) ** 2).sum()
+    if num < 3 or ssx == 0:
+        raise AtroposError(
+            "Too few duplicate reads to estimate the error rate by shadow "
+            "regression")
+    
+    seq_idxs, cycles, values = shadows
+    keep = founders[seq_idxs]
+    seq_idxs = seq_idxs[keep]
+    cycles = cycles[keep]
+    values = values[keep].astype(np.float64)
+    num_cycles = int(cycles.max()) + 1 if len(cycles) else 0
+    
+    # per-cycle regressions
+    sum_y = np.bincount(cycles, weights=values, minlength=num_cycles)
+    sum_xy = np.bincount(
+        cycles, weights=values * counts[seq_idxs], minlength=num_cycles)
+    sum_yy = np.bincount(cycles, weights=values ** 2, minlength=num_cycles)
+    sxy = sum_xy - x_mean * sum_y
+    ssy = sum_yy - sum_y ** 2 / num
+    cycle_slopes = sxy / ssx
+    cycle_sse = np.maximum(ssy - cycle_slopes * sxy, 0)
+    cycle_slope_se = np.sqrt(cycle_sse / (num - 2) / ssx)
+    
+    # per-read regression
+    y = np.bincount(seq_idxs, weights=values, minlength=len(counts))[founders]
+    slope = cycle_slopes.sum()
+    intercept = y.mean() - slope * x_mean
+    sse = ((y - intercept - slope * x) ** 2).sum()
+    slope_se = math.sqrt(sse / (num - 2) / ssx)
+    
+    cycle_slopes = np.maximum(cycle_slopes, 0)
+    cycle_errors = cycle_slopes / (1 + cycle_slopes)
+    cycle_error_se = cycle_slope_se / (1 + cycle_slopes) ** 2
+    no_error = np.prod(1 - cycle_errors)
+    per_read = {
+        'error rate': float(1 - no_error),
+        'standard error': float(no_error * slope_se),
+        'slope': float(slope),
+        'intercept': float(intercept)
+    }
+    per_cycle = [
+        [cycle + 1, float(error), float(se)]
+        for cycle, (error, se) in enumerate(zip(cycle_errors, cycle_error_se))
+    ]
+    return (per_read, per_cycle)
+
 class ShadowRegressionErrorEstimator(ErrorEstimator):
     """Re-implementation of the shadow regression method described in:
     Wang et al., "Estimation of sequencing error rates in short reads",
         BMC Bioinformatics 2012 13:185, DOI: 10.1186/1471-2105-13-185
     
+    Substitution error rates are estimated natively (with numpy). Other
+    methods, or the absence of numpy, require R and the ShadowRegression
+    package.
+    
     Args:
         method: The differences that are considered in the error rate
             calculation; sub = substitutions, indel = insertions and
@@ -107,7 +417,7 @@ class ShadowRegressionErrorEstimator(ErrorEstimator):
     """
     def __init__(self, method='sub', max_read_len=None, rscript_exe="Rscript"):
         super().__init__(max_read_len)
-        self.seqs = defaultdict(lambda: 0)
+        self.seqs = Counter()
         self.method = method
         self.rscript_exe = rscript_exe
     
@@ -122,10 +432,28 @@ class ShadowRegressionErrorEstimator(ErrorEstimator):
         self.seqs[seq] += 1
         self.total_len += readlen
     
+    def merge(self, other):
+        super().merge(other)
+        self.seqs.update(other.seqs)
+        return self
+    
     def estimate(self):
-        # This is a temporary solution that requires R and the
-        # ShadowRegression package. Eventually, this will be
-        # replaced with a pure-python implementation.
+        if np is None or self.method != 'sub':
+            return self._estimate_rscript()
+        # Sort the sequences so that the estimate does not depend on the order
+        # in which they were read.
+        items = sorted(self.seqs.items())
+        seqs = [seq for seq, count in items]
+        counts = [count for seq, count in items]
+        per_read_error, per_cycle_error = shadow_regression(
+            counts, *shadow_counts(seqs, counts))
+        return (
+            per_read_error["error rate"],
+            dict(per_read=per_read_error, per_cycle=per_cycle_error))
+    
+    def _estimate_rscript(self):
+        """Estimate error rates using the ShadowRegression R package.
+        """
         import os
         import subprocess
         import tempfile
@@ -175,7 +503,7 @@ class ShadowRegressionErrorEstimator(ErrorEstimator):
     def _write_read_counts(self, fileobj):
         writer = csv.writer(fileobj, delimiter=" ")
         writer.writerows(sorted(
-            self.seqs.items(), reverse=True, key=lambda i: i[1]))
+            sorted(self.seqs.items()), reverse=True, key=lambda i: i[1]))
 
 class PairedErrorEstimator(PairedEndPipelineMixin, Pipeline):
     """Estimator for a pair of input files.
@@ -186,17 +514,36 @@ class PairedErrorEstimator(PairedEndPipelineMixin, Pipeline):
         self.estimator1 = estimator_class(**kwargs)
         self.estimator2 = estimator_class(**kwargs)
     
+    @property
+    def state(self):
+        """The tuple of read1 and read2 estimators.
+        """
+        return (self.estimator1, self.estimator2)
+    
+    @state.setter
+    def state(self, state):
+        self.estimator1, self.estimator2 = state
+    
+    def handle_records(self, context, records):
+        for record in records:
+            self.record_reads(context, record)
+        self.estimator1.add_reads([read1 for read1, _ in records])
+        self.estimator2.add_reads([read2 for _, read2 in records])
+    
     def handle_reads(self, context, read1, read2):
         self.estimator1.handle_reads(context, read1)
         self.estimator2.handle_reads(context, read2)
     
-    def finish(self, summary, **kwargs):
-        """Estimate error rates.
-        
-        Returns:
-            Tuple (read1_estimate, read2_estimate).
-        """
+    def finish(self, summary, worker=None, **kwargs):
         super().finish(summary)
+        if worker is None:
+            self.add_estimates(summary)
+        else:
+            summary['errorrate'] = dict(state=self.state)
+    
+    def add_estimates(self, summary):
+        """Estimate the read1 and read2 error rates and add them to `summary`.
+        """
         estimate1, details1 = self.estimator1.estimate()
         estimate2, details2 = self.estimator2.estimate()
         summary['errorrate'].update(
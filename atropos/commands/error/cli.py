@@ -1,6 +1,8 @@
 """Command-line interface for the error command.
 """
-from atropos.commands.cli import BaseCommandParser, writeable_file
+from atropos.commands.cli import (
+    BaseCommandParser, configure_threads, positive, int_or_str,
+    writeable_file)
 from atropos.io import STDOUT
 
 class CommandParser(BaseCommandParser):
@@ -28,8 +30,8 @@ error rate."""
             "--algorithm",
             choices=('quality', 'shadow'), default="quality",
             help="Method for estimating error rates; quality = base qualities, "
-                 "shadow = shadow regression. Be advised that the 'shadow' "
-                 "method is incredibly slow.")
+                 "shadow = shadow regression. The 'shadow' method requires "
+                 "numpy, and reads with many duplicates (e.g. amplicons).")
         group.add_argument(
             "-m",
             "--max-bases",
@@ -54,6 +56,33 @@ error rate."""
                  "file extension. Supported formats are: txt, json, yaml, "
                  "pickle. See the documentation for a  full description of "
                  "the structured output (json/yaml/pickle formats).")
+        
+        group = self.add_group(
+            "Parallel", title="Parallel (multi-core) options")
+        group.add_argument(
+            "-T",
+            "--threads",
+            type=positive(int, True), default=None, metavar="THREADS",
+            help="Number of threads to use for counting reads. Set to 0 to "
+                 "use max available threads. (Do not use multithreading)")
+        group.add_argument(
+            "--process-timeout",
+            type=positive(int, True), default=60, metavar="SECONDS",
+            help="Number of seconds process should wait before escalating "
+                 "messages to ERROR level. (60)")
+        group.add_argument(
+            "--read-queue-size",
+            type=int_or_str, default=None, metavar="SIZE",
+            help="Size of queue for batches of reads to be processed. "
+                 "(THREADS * 100)")
     
     def validate_command_options(self, options):
         options.report_file = options.output
+        if options.threads is not None:
+            threads = configure_threads(options, self.parser)
+            if options.read_queue_size is None:
+                options.read_queue_size = threads * 100
+            elif (
+                    options.read_queue_size > 0 and
+                    options.read_queue_size < threads):
+                self.parser.error("Read queue size must be >= than 'threads'")
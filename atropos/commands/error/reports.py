@@ -51,12 +51,38 @@ def generate_estimator_report(
     _print("Error rate: {:.2%}".format(estimate))
     if details:
         _print("Details:\n")
-        per_read = details['per_read']
-        per_cycle = details['per_cycle']
-        
-        _print_indent("StdErr: {:.2%}".format(per_read['standard error']))
+        per_read = details.get('per_read')
+        if per_read:
+            _print_indent("StdErr: {:.2%}".format(
+                float(per_read['standard error'])))
         _print_indent("Per-cycle rates:")
-        for cycle in per_cycle:
-            _print_indent(
-                "Cycle: {}, Error: {:.2%}, StdErr: {:.2%}".format(*cycle), 
-                indent=2)
+        print_error_profile(details['per_cycle'], _print_indent)
+
+def print_error_profile(per_cycle, _print, plot_width=50):
+    """Print a table of per-cycle error rates (and standard errors, if
+    available), with a bar plot of the error rates.
+    
+    Args:
+        per_cycle: Sequence of [cycle, error] or [cycle, error, stderr].
+        _print: The Printer to use.
+        plot_width: The width of the bar of the largest error rate.
+    """
+    if not per_cycle:
+        return
+    rows = [
+        (int(row[0]),) + tuple(float(value) for value in row[1:])
+        for row in per_cycle]
+    columns = ('Cycle', 'Error', 'StdErr')[:len(rows[0])]
+    cycle_width = max(len(columns[0]), len(str(rows[-1][0])))
+    header = ["{:>{}}".format(columns[0], cycle_width)] + [
+        "{:>7}".format(column) for column in columns[1:]]
+    _print(' '.join(header), indent=2)
+    _print(' '.join('-' * len(column) for column in header), indent=2)
+    max_error = max(row[1] for row in rows)
+    for row in rows:
+        bar_width = 0
+        if max_error > 0:
+            bar_width = round(max(row[1], 0) * plot_width / max_error)
+        fields = ["{:>{}}".format(row[0], cycle_width)] + [
+            "{:>7.2%}".format(value) for value in row[1:]]
+        _print(' '.join(fields + ['#' * bar_width]).rstrip(), indent=2)
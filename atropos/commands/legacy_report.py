@@ -3,6 +3,7 @@
 text-based reports. This will eventually be deprecated in favor of the Jinja2
 and MultiQC reports.
 """
+from collections import Sequence
 import math
 import textwrap
 from atropos.io import open_output
@@ -241,6 +242,8 @@ def generate_report(summary, outfile):
         print_pre_trim_report(summary, outfile)
     if 'post' in summary:
         print_post_trim_report(summary, outfile)
+    if 'profile' in summary:
+        print_profile_report(summary, outfile)
 
 def print_summary_report(summary, outfile):
     """Print the top-level summary report.
@@ -364,6 +367,17 @@ def print_trim_report(summary, outfile):
             "Pairs corrected:", corrected['records_corrected'],
             corrected['fraction_records_corrected'], pct=True)
     
+    if adapter_cutter and 'cache_hits' in adapter_cutter:
+        def _total(value):
+            if isinstance(value, Sequence):
+                return sum(val for val in value if val)
+            return value
+        cache_hits = _total(adapter_cutter['cache_hits'])
+        cache_lookups = cache_hits + _total(adapter_cutter['cache_misses'])
+        _print(
+            "Match cache hits (of lookups):", cache_hits,
+            cache_hits / cache_lookups if cache_lookups else 0.0, pct=True)
+    
     _print()
     _print("Base pairs", 'bp', 'fraction', header=True)
     
@@ -687,6 +701,35 @@ def print_post_trim_report(summary, outfile):
             _print()
             print_stats_report(data, outfile)
 
+def print_profile_report(summary, outfile):
+    """Print the pipeline profile (see --profile-pipeline). Times are summed
+    over all worker processes.
+    
+    Args:
+        summary: The summary dict.
+        outfile: The output file.
+    """
+    profile = summary['profile']
+    _print_title = TitlePrinter(outfile)
+    _print = RowPrinter(outfile, justification=('<', '<', '>'))
+    _print_title("Pipeline profile", level=1)
+    total_time = sum(
+        timer['time']
+        for timers in profile.values()
+        for timer in timers.values())
+    rows = []
+    for section, timers in profile.items():
+        for name, timer in timers.items():
+            calls, time = timer['calls'], timer['time']
+            rows.append((
+                section, name, calls, "{:.3f}".format(time),
+                "{:.2f}".format(1E6 * time / calls) if calls else '-',
+                "{:.1%}".format(time / total_time) if total_time else '-'))
+    _print.print_rows(
+        *rows, header=(
+            'Section', 'Name', 'Calls', 'Time (s)', 'us/call', 'Fraction'))
+    _print()
+
 def print_stats_report(data, outfile):
     """Print stats.
     
@@ -7,7 +7,7 @@ import os
 from queue import Empty, Full
 import time
 from atropos import AtroposError
-from atropos.util import run_interruptible
+from atropos.util import cprofiled, run_interruptible
 
 RETRY_INTERVAL = 5
 """Max time to wait between retrying operations."""
@@ -161,19 +161,31 @@ class WorkerProcess(Process):
         pipeline: The pipeline to execute.
         summary_queue: Queue where summary information is written.
         timeout: Time to wait upon queue full/empty.
+        cprofile_path: Path template (with a placeholder for the index) of
+            the file to which cProfile stats are written, or None to disable
+            profiling.
     """
-    def __init__(self, index, input_queue, pipeline, summary_queue, timeout):
+    def __init__(
+            self, index, input_queue, pipeline, summary_queue, timeout,
+            cprofile_path=None):
         super().__init__(name="Worker process {}".format(index))
         self.index = index
         self.input_queue = input_queue
         self.pipeline = pipeline
         self.summary_queue = summary_queue
         self.timeout = timeout
+        self.cprofile_path = cprofile_path
     
     def run(self):
         logging.getLogger().debug(
             "%s running under pid %d", self.name, os.getpid())
-        
+        cprofile_path = None
+        if self.cprofile_path:
+            cprofile_path = self.cprofile_path.format(self.index)
+        with cprofiled(cprofile_path):
+            self._run()
+    
+    def _run(self):
         summary = {}
         
         def iter_batches():
@@ -283,7 +295,8 @@ class ParallelPipelineRunner(object):
         # Start worker processes, reserve a thread for the reader process,
         # which we will get back after it completes
         worker_args = (
-            self.input_queue, self.pipeline, self.summary_queue, self.timeout)
+            self.input_queue, self.pipeline, self.summary_queue, self.timeout,
+            self.command_runner.cprofile_path('worker{}'))
         self.worker_processes = launch_workers(self.threads - 1, worker_args)
         
         self.num_batches = enqueue_all(
@@ -22,6 +22,10 @@ class QcPipeline(Pipeline):
             self.stats[source] = self.read_statistics_class(**self.stats_kwargs)
         return self.stats[source]
     
+    def handle_records(self, context, records):
+        self._get_stats(context['source']).collect_batch([
+            self.record_reads(context, record) for record in records])
+    
     def handle_reads(self, context, read1, read2=None):
         self._get_stats(context['source']).collect(read1, read2)
     
@@ -4,7 +4,11 @@
 import re
 from atropos.util import (
     CountingDict, NestedDict, Histogram, Mergeable, Summarizable, ordered_dict, 
-    qual2int)
+    qual2int, qual_sums)
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 DEFAULT_TILE_KEY_REGEXP = r"^(?:[^\:]+\:){4}([^\:]+)"
 """Regexp for the default Illumina read name format."""
@@ -109,9 +113,84 @@ class BaseNestedDicts(PositionDicts):
                     for key1 in keys1))
                 for idx, dict_item in enumerate(self.dicts, 1)))
 
+class BaseCountingArray(Mergeable, Summarizable):
+    """Counts the items associated with each nucleotide base in a dense
+    (position x character code) array. Counts are added for a whole batch of
+    reads at a time, and arrays are merged by addition. Summarizes to the same
+    table as :class:`BaseCountingDicts`. Requires numpy.
+    
+    Args:
+        is_qualities: Whether values are base qualities.
+        quality_base: Base for quality values.
+    """
+    def __init__(self, is_qualities=False, quality_base=33):
+        self.counts = np.zeros((0, 256), dtype=np.int64)
+        self.is_qualities = is_qualities
+        self.quality_base = quality_base
+    
+    def __len__(self):
+        return self.counts.shape[0]
+    
+    def extend(self, size):
+        """Extend the number of bases to `size`.
+        """
+        diff = size - len(self)
+        if diff > 0:
+            self.counts = np.vstack((
+                self.counts, np.zeros((diff, 256), dtype=np.int64)))
+    
+    def add(self, positions, codes, size):
+        """Count characters by position.
+        
+        Args:
+            positions: Array of 0-based positions.
+            codes: Array of character codes, the same length as `positions`.
+            size: One more than the largest position.
+        """
+        self.extend(size)
+        counts = np.bincount(positions * 256 + codes, minlength=size * 256)
+        self.counts[:size] += counts.reshape(size, 256)
+    
+    def merge(self, other):
+        if not isinstance(other, BaseCountingArray):
+            raise ValueError(
+                "Cannot merge object of type {}".format(type(other)))
+        self.extend(len(other))
+        self.counts[:len(other)] += other.counts
+        return self
+    
+    def summarize(self):
+        """Flatten into a table with N rows (where N is the size of the
+        sequence) and the columns are counts by nucleotide.
+        
+        Returns:
+            A tuple of (columns, [rows]), where each row is
+            (position, (base_counts...))
+        """
+        codes = np.flatnonzero(self.counts.sum(axis=0)).tolist()
+        if self.is_qualities:
+            columns = tuple(
+                qual2int(chr(code), self.quality_base) for code in codes)
+        else:
+            acgt = tuple(ord(base) for base in 'ACGT')
+            n_val = (ord('N'),)
+            codes = (
+                acgt + tuple(code for code in codes if code not in acgt + n_val)
+                + n_val)
+            columns = tuple(chr(code) for code in codes)
+        rows = self.counts[:, codes].tolist()
+        return dict(
+            columns=columns,
+            rows=ordered_dict(
+                (idx, tuple(row)) for idx, row in enumerate(rows, 1)))
+
 class ReadStatistics(object):
     """Accumulates statistics on sequencing reads.
     
+    Per-position counts are accumulated in :class:`BaseCountingArray`s when
+    numpy is available and tile statistics are not collected; otherwise they
+    are accumulated one base at a time in :class:`BaseCountingDicts`.
+    
     Args:
         qualities: Whether to collect base quality statistics.
         tiles: Whether to collect tile-level statistics. If True, the default
@@ -128,8 +207,6 @@ class ReadStatistics(object):
         self.sequence_lengths = Histogram()
         # per-sequence GC percentage
         self.sequence_gc = Histogram()
-        # per-position base composition
-        self.bases = BaseCountingDicts()
         
         # whether to collect base quality stats
         self.qualities = qualities
@@ -144,16 +221,29 @@ class ReadStatistics(object):
             if isinstance(tile_key_regexp, str):
                 tile_key_regexp = re.compile(tile_key_regexp)
             self.tile_key_regexp = tile_key_regexp
+        
+        # whether to accumulate per-position counts in arrays
+        self.use_arrays = np is not None and self.tile_key_regexp is None
+        # per-position base composition
+        self.bases = self._position_counts()
+        
+        if qualities:
             self._init_qualities()
         
         # cache of computed values
         self._cache = {}
     
+    def _position_counts(self, **kwargs):
+        if self.use_arrays:
+            return BaseCountingArray(**kwargs)
+        else:
+            return BaseCountingDicts(**kwargs)
+    
     def _init_qualities(self):
         # per-sequence mean qualities
         self.sequence_qualities = Histogram()
         # per-position quality composition
-        self.base_qualities = BaseCountingDicts(
+        self.base_qualities = self._position_counts(
             is_qualities=True, quality_base=self.quality_base)
         if self.tile_key_regexp:
             self.tile_base_qualities = BaseNestedDicts(
@@ -194,10 +284,12 @@ class ReadStatistics(object):
     def collect_record(self, record):
         """Collect stats on a single sequence record.
         """
-        if self.qualities is None and record.qualities:
-            self.qualities = True
-            self._init_qualities()
-        
+        self.collect_records((record,))
+    
+    def _collect_record(self, record, read_qual_sum):
+        """Collect stats on a single sequence record, given the sum of its
+        base qualities (None if qualities are not being collected).
+        """
         seq = record.sequence
         seqlen = len(seq)
         
@@ -218,8 +310,7 @@ class ReadStatistics(object):
                 # mean read quality
                 # NOTE: we use round here, as opposed to FastQC which uses
                 # floor, resulting in slightly different quality profiles
-                meanqual = round(
-                    sum(ord(q) - self.quality_base for q in quals) / seqlen)
+                meanqual = round(read_qual_sum / seqlen)
                 self.sequence_qualities[meanqual] += 1
                 # tile ID
                 if self.track_tiles:
@@ -237,6 +328,80 @@ class ReadStatistics(object):
         
         # TODO: positional k-mer profiles
     
+    def collect_records(self, records):
+        """Collect stats on a batch of sequence records. When arrays are used,
+        the bases (and qualities) of all the records are concatenated and
+        counted with a single bincount per statistic.
+        """
+        if not records:
+            return
+        
+        if self.qualities is None and records[0].qualities:
+            self.qualities = True
+            self._init_qualities()
+        
+        if not self.use_arrays:
+            if self.qualities:
+                read_qual_sums = qual_sums(
+                    [record.qualities for record in records],
+                    self.quality_base)
+            else:
+                read_qual_sums = [None] * len(records)
+            for record, read_qual_sum in zip(records, read_qual_sums):
+                self._collect_record(record, read_qual_sum)
+            return
+        
+        lengths = np.fromiter(
+            (len(record.sequence) for record in records), dtype=np.int64,
+            count=len(records))
+        self.count += len(records)
+        self._add_histogram(self.sequence_lengths, lengths)
+        
+        ends = np.cumsum(lengths)
+        total = int(ends[-1])
+        if total == 0:
+            return
+        starts = ends - lengths
+        nonempty = lengths > 0
+        # per-read sums are differences of the cumulative sum at the read
+        # boundaries, which (unlike np.add.reduceat) handles empty reads
+        def read_sums(values):
+            cumsum = np.concatenate(((0,), np.cumsum(values)))
+            return (cumsum[ends] - cumsum[starts])[nonempty]
+        
+        # position of each base within its read
+        positions = (
+            np.arange(total, dtype=np.int64) - np.repeat(starts, lengths))
+        max_len = int(lengths.max())
+        self.max_read_len = max(self.max_read_len, max_len)
+        
+        seq = np.frombuffer(
+            ''.join(record.sequence for record in records).encode('latin-1'),
+            dtype=np.uint8)
+        gc_count = read_sums((seq == ord('C')) | (seq == ord('G')))
+        gc_pct = np.rint(gc_count * 100 / lengths[nonempty]).astype(np.int64)
+        self._add_histogram(self.sequence_gc, gc_pct)
+        self.bases.add(positions, seq, max_len)
+        
+        if self.qualities:
+            quals = np.frombuffer(
+                ''.join(record.qualities for record in records).encode(
+                    'latin-1'),
+                dtype=np.uint8)
+            # mean read quality, rounded as in collect_record
+            read_qual_sums = read_sums(
+                quals.astype(np.int64) - self.quality_base)
+            meanqual = np.rint(
+                read_qual_sums / lengths[nonempty]).astype(np.int64)
+            self._add_histogram(self.sequence_qualities, meanqual)
+            self.base_qualities.add(positions, quals, max_len)
+    
+    @staticmethod
+    def _add_histogram(hist, values):
+        values, counts = np.unique(values, return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            hist[value] += count
+    
     def collect(self, read1, read2=None):
         """Collect statistics on a pair of reads.
         """
@@ -287,6 +452,11 @@ class SingleEndReadStatistics(ReadStatistics):
     def collect(self, read1, read2=None):
         self.collect_record(read1)
     
+    def collect_batch(self, records):
+        """Collect statistics on a batch of (read1,) tuples.
+        """
+        self.collect_records([record[0] for record in records])
+    
     def summarize(self):
         return dict(read1=super().summarize())
 
@@ -303,6 +473,12 @@ class PairedEndReadStatistics(object):
         self.read1.collect_record(read1)
         self.read2.collect_record(read2)
     
+    def collect_batch(self, records):
+        """Collect statistics on a batch of (read1, read2) tuples.
+        """
+        self.read1.collect_records([record[0] for record in records])
+        self.read2.collect_records([record[1] for record in records])
+    
     def summarize(self):
         """Returns a summary dict.
         """
@@ -12,7 +12,8 @@ from atropos.commands.stats import (
     SingleEndReadStatistics, PairedEndReadStatistics)
 from atropos.adapters import AdapterParser, BACK
 from atropos.io import STDOUT
-from atropos.util import RandomMatchProbability, Const, run_interruptible
+from atropos.util import (
+    RandomMatchProbability, Const, Profiler, cprofiled, run_interruptible)
 from .modifiers import (
     AdapterCutter, DoubleEncoder, InsertAdapterCutter, LengthTagModifier,
     MergeOverlapping, MinCutter, NEndTrimmer, NextseqQualityTrimmer,
@@ -32,20 +33,33 @@ class TrimPipeline(Pipeline):
     Args:
         record_handler:
         result_handler:
+        profiler: A :class:`atropos.util.Profiler` with which to time the
+            modifiers, filters, formatters and result handler, or None.
     """
-    def __init__(self, record_handler, result_handler):
+    def __init__(self, record_handler, result_handler, profiler=None):
         super().__init__()
         self.record_handler = record_handler
         self.result_handler = result_handler
+        self.profiler = profiler
     
     def start(self, worker=None):
+        if self.profiler:
+            # Components are instrumented here rather than when the pipeline
+            # is created, since (in parallel mode) this is called in the
+            # worker process, and the timed functions cannot be pickled.
+            self.record_handler.profile(self.profiler)
+            self.result_handler.write_result = self.profiler.wrap(
+                self.result_handler.write_result, 'results', 'write_result')
         self.result_handler.start(worker)
     
     def add_to_context(self, context):
         context['results'] = defaultdict(lambda: [])
     
     def handle_records(self, context, records):
-        super().handle_records(context, records)
+        # Reads are modified and formatted one at a time, but filtered as a
+        # batch.
+        self.record_handler.handle_records(context, [
+            self.record_reads(context, record) for record in records])
         self.result_handler.write_result(context['index'], context['results'])
     
     def handle_reads(self, context, read1, read2=None):
@@ -55,6 +69,8 @@ class TrimPipeline(Pipeline):
         self.result_handler.finish()
         super().finish(summary)
         summary.update(self.record_handler.summarize())
+        if self.profiler:
+            summary['profile'] = self.profiler.summarize()
 
 class RecordHandler(object):
     """Base class for record handlers.
@@ -72,6 +88,35 @@ class RecordHandler(object):
         self.formatters.format(context['results'], dest, *reads)
         return (dest, reads)
     
+    def handle_records(self, context, records):
+        """Handle a batch of records.
+        
+        Args:
+            context: The pipeline context (dict).
+            records: Sequence of tuples (read1,) or (read1, read2).
+        
+        Returns:
+            A list of (dest, reads) tuples, one for each record.
+        """
+        modify = self.modifiers.modify
+        reads = [modify(*record) for record in records]
+        dests = self.filters.filter_batch(reads)
+        results = context['results']
+        for dest, record_reads in zip(dests, reads):
+            self.formatters.format(results, dest, *record_reads)
+        return list(zip(dests, reads))
+    
+    def profile(self, profiler):
+        """Time the modifiers, filters and formatters.
+        
+        Args:
+            profiler: A :class:`atropos.util.Profiler`.
+        """
+        self.modifiers.profile(profiler)
+        self.filters.profile(profiler)
+        self.formatters.format = profiler.wrap(
+            self.formatters.format, 'formatters', 'format')
+    
     def summarize(self):
         """Returns a summary dict.
         """
@@ -118,6 +163,33 @@ class StatsRecordHandlerWrapper(object):
                 self.post[dest], context['source'], *reads, **self.post_kwargs)
         return (dest, reads)
     
+    def handle_records(self, context, records):
+        """Handle a batch of records.
+        """
+        if self.pre is not None:
+            self.collect_batch(
+                self.pre, context['source'], records, **self.pre_kwargs)
+        results = self.record_handler.handle_records(context, records)
+        if self.post is not None:
+            dest_reads = defaultdict(list)
+            for dest, reads in results:
+                dest_reads[dest].append(reads)
+            for dest, reads in dest_reads.items():
+                if dest not in self.post:
+                    self.post[dest] = {}
+                self.collect_batch(
+                    self.post[dest], context['source'], reads,
+                    **self.post_kwargs)
+        return results
+    
+    def profile(self, profiler):
+        """Time the wrapped record handler and the statistics collection.
+        """
+        self.record_handler.profile(profiler)
+        self.collect = profiler.wrap(self.collect, 'stats', 'collect')
+        self.collect_batch = profiler.wrap(
+            self.collect_batch, 'stats', 'collect_batch')
+    
     def collect(self, stats, source, read1, read2=None, **kwargs):
         """Collect stats on a pair of reads.
         
@@ -130,6 +202,18 @@ class StatsRecordHandlerWrapper(object):
             stats[source] = self.read_statistics_class(**kwargs)
         stats[source].collect(read1, read2)
     
+    def collect_batch(self, stats, source, records, **kwargs):
+        """Collect stats on a batch of reads.
+        
+        Args:
+            stats: The :class:`ReadStatistics` object.
+            source: The source file(s).
+            records: Sequence of tuples (read1,) or (read1, read2).
+        """
+        if source not in stats:
+            stats[source] = self.read_statistics_class(**kwargs)
+        stats[source].collect_batch(records)
+    
     def summarize(self):
         """Returns a summary dict.
         """
@@ -275,13 +359,18 @@ class TrimSummary(Summary):
 
 class CommandRunner(BaseCommandRunner):
     name = 'trim'
+    # Unchanged reads are written from the text of their input records
+    keep_raw_records = True
     
     def __init__(self, options):
         super().__init__(options, TrimSummary)
     
     def __call__(self):
         options = self.options
+        # Build the random-match probability table up-front so that it is
+        # shared with worker processes.
         match_probability = RandomMatchProbability()
+        match_probability.precompute()
         
         # Create Adapters
         
@@ -377,16 +466,18 @@ class CommandRunner(BaseCommandRunner):
                         max_adapter_mismatch_frac=\
                             options.insert_match_adapter_error_rate,
                         match_probability=match_probability,
-                        insert_max_rmp=options.insert_max_rmp)
+                        insert_max_rmp=options.insert_max_rmp,
+                        cache_size=options.match_cache_size)
                 else:
-                    a1_args = dict(
-                        adapters=adapters1,
+                    cutter_args = dict(
                         times=options.times,
-                        action=options.action) if adapters1 else None
-                    a2_args = dict(
-                        adapters=adapters2,
-                        times=options.times,
-                        action=options.action) if adapters2 else None
+                        action=options.action,
+                        cache_size=options.match_cache_size)
+                    a1_args = a2_args = None
+                    if adapters1:
+                        a1_args = dict(adapters=adapters1, **cutter_args)
+                    if adapters2:
+                        a2_args = dict(adapters=adapters2, **cutter_args)
                     modifiers.add_modifier_pair(AdapterCutter, a1_args, a2_args)
             elif oper == 'C' and (options.cut or options.cut2):
                 modifiers.add_modifier_pair(
@@ -464,6 +555,9 @@ class CommandRunner(BaseCommandRunner):
                 error_rate=options.merge_error_rate,
                 mismatch_action=options.correct_mismatches)
         
+        # Fuse consecutive trimmers now that the order is fixed
+        modifiers.compile()
+        
         # Create Filters and Formatters
         
         min_affected = 2 if options.pair_filter == 'both' else 1
@@ -585,7 +679,8 @@ class CommandRunner(BaseCommandRunner):
             result_handler = WorkerResultHandler(WriterResultHandler(writers))
             pipeline_class = type(
                 'TrimPipelineImpl', (mixin_class, TrimPipeline), {})
-            pipeline = pipeline_class(record_handler, result_handler)
+            pipeline = pipeline_class(
+                record_handler, result_handler, self.create_profiler())
             self.summary.update(mode='serial', threads=1)
             return run_interruptible(pipeline, self, raise_on_error=True)
         else:
@@ -593,6 +688,12 @@ class CommandRunner(BaseCommandRunner):
             self.summary.update(mode='parallel', threads=options.threads)
             return self.run_parallel(record_handler, writers, mixin_class)
     
+    def create_profiler(self):
+        """Returns a :class:`Profiler` if pipeline profiling is enabled,
+        otherwise None.
+        """
+        return Profiler() if self.options.profile_pipeline else None
+    
     def run_parallel(self, record_handler, writers, mixin_class):
         """Parallel implementation of run_atropos. Works as follows:
         
@@ -802,13 +903,18 @@ class CommandRunner(BaseCommandRunner):
                 queue: Input queue.
                 control: A shared value for communcation with the main process.
                 timeout: Seconds to wait for next batch before complaining.
+                cprofile_path: File to which cProfile stats are written, or
+                    None to disable profiling.
             """
-            def __init__(self, result_handler, queue, control, timeout=60):
+            def __init__(
+                    self, result_handler, queue, control, timeout=60,
+                    cprofile_path=None):
                 super().__init__(name="Result process")
                 self.result_handler = result_handler
                 self.queue = queue
                 self.control = control
                 self.timeout = timeout
+                self.cprofile_path = cprofile_path
                 self.seen_batches = set()
                 self.num_batches = None
             
@@ -816,7 +922,10 @@ class CommandRunner(BaseCommandRunner):
                 logging.getLogger().debug(
                     "Writer process %s running under pid %d",
                     self.name, os.getpid())
-                
+                with cprofiled(self.cprofile_path):
+                    self._run()
+            
+            def _run(self):
                 def fail_callback():
                     """Raises Done if the expected number of batches has been
                     seen.
@@ -878,7 +987,7 @@ class CommandRunner(BaseCommandRunner):
             """
             def __init__(
                     self, writers, compression, preserve_order, result_queue,
-                    timeout):
+                    timeout, cprofile_path=None):
                 # result handler
                 if preserve_order:
                     writer_result_handler = OrderPreservingWriterResultHandler(
@@ -893,7 +1002,7 @@ class CommandRunner(BaseCommandRunner):
                 # writer process
                 self.writer_process = ResultProcess(
                     writer_result_handler, result_queue, self.writer_control,
-                    timeout)
+                    timeout, cprofile_path)
                 self.writer_process.start()
             
             def is_active(self):
@@ -955,7 +1064,7 @@ class CommandRunner(BaseCommandRunner):
                     QueueResultHandler(result_queue))
             writer_manager = WriterManager(
                 writers, compression, self.preserve_order, result_queue,
-                timeout)
+                timeout, self.cprofile_path('writer'))
         else:
             worker_result_handler = WorkerResultHandler(
                 WriterResultHandler(writers, use_suffix=True))
@@ -963,7 +1072,8 @@ class CommandRunner(BaseCommandRunner):
         pipeline_class = type(
             'TrimPipelineImpl',
             (ParallelPipelineMixin, mixin_class, TrimPipeline), {})
-        pipeline = pipeline_class(record_handler, worker_result_handler)
+        pipeline = pipeline_class(
+            record_handler, worker_result_handler, self.create_profiler())
         runner = ParallelTrimPipelineRunner(
             self, pipeline, threads, writer_manager)
         return runner.run()
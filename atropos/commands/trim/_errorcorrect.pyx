@@ -0,0 +1,175 @@
+# kate: syntax Python;
+# cython: profile=False, emit_code_comments=False
+"""
+Correction of mismatches between overlapping read pairs.
+"""
+from cpython.mem cimport PyMem_Malloc, PyMem_Free
+from atropos.util import BASE_COMPLEMENTS
+
+cdef char COMPLEMENTS[256]
+
+def _init_complements():
+    """
+    Fill in the table of base complements. Characters without a complement
+    are mapped to zero.
+    """
+    cdef int i
+    for i in range(256):
+        COMPLEMENTS[i] = 0
+    for base, comp in BASE_COMPLEMENTS.items():
+        COMPLEMENTS[ord(base)] = ord(comp)
+
+_init_complements()
+
+cdef inline char _complement(char base) except 0:
+    cdef char comp = COMPLEMENTS[<unsigned char>base]
+    if comp == 0:
+        raise KeyError(chr(<unsigned char>base))
+    return comp
+
+cdef double _mean_qual(const char* qual, int length, int start, int end) except? -1:
+    """
+    Mean of the (ASCII) qualities in qual[start:end], with start and end
+    clipped to the string as by slicing.
+    """
+    cdef int i
+    cdef long total = 0
+    start = min(start, length)
+    end = min(end, length)
+    if end <= start:
+        raise ValueError("Cannot determine the mode of an empty sequence")
+    for i in range(start, end):
+        total += qual[i]
+    return <double>total / (end - start)
+
+def correct_mismatches(
+        str seq1, str qual1, str seq2, str qual2, int r1_start, int r1_end,
+        int r2_start, int r2_end, str mismatch_action, int min_qual_difference):
+    """
+    Correct mismatches between the overlapping portions of two reads. The
+    sequences and qualities are copied into byte buffers that are modified in
+    place, and are only converted back to strings if they were changed.
+    
+    Position i of read1 (starting at r1_start) is compared to the complement
+    of position j of read2 (starting at r2_end - 1 and moving backwards
+    towards r2_start). For mismatch_action 'N', both bases are replaced with
+    N. Otherwise, an N in either read is replaced with the base from the
+    other read, and if the reads have qualities, the base with the lower
+    quality is replaced if the qualities differ by at least
+    min_qual_difference. For mismatch_action 'liberal', the remaining
+    mismatches are corrected in favor of the read with the higher mean
+    quality over the overlap (if the means differ by more than 1).
+    
+    Returns a tuple (r1_changed, r2_changed, seq1, qual1, seq2, qual2),
+    where r1_changed and r2_changed are the numbers of corrected bases.
+    qual1 and qual2 may be None, in which case no quality-based correction is
+    done.
+    """
+    cdef int len1 = len(seq1)
+    cdef int len2 = len(seq2)
+    cdef int size = min(r1_end - r1_start, r2_end - 1 - r2_start)
+    if size <= 0:
+        return (0, 0, seq1, qual1, seq2, qual2)
+    if r1_start < 0 or r1_start + size > len1 or r2_end - size < 0 or r2_end > len2:
+        raise IndexError("Overlap is out of range of the read sequences")
+    
+    cdef bint has_quals = qual1 is not None and qual2 is not None
+    cdef bint n_action = mismatch_action == 'N'
+    cdef bint liberal = mismatch_action == 'liberal'
+    cdef bytearray seq1_buf = bytearray(seq1, 'ascii')
+    cdef bytearray seq2_buf = bytearray(seq2, 'ascii')
+    cdef bytearray qual1_buf, qual2_buf
+    cdef char* s1 = seq1_buf
+    cdef char* s2 = seq2_buf
+    cdef char* q1 = NULL
+    cdef char* q2 = NULL
+    if has_quals:
+        qual1_buf = bytearray(qual1, 'ascii')
+        qual2_buf = bytearray(qual2, 'ascii')
+        q1 = qual1_buf
+        q2 = qual2_buf
+    
+    cdef int r1_changed = 0
+    cdef int r2_changed = 0
+    cdef int num_equal = 0
+    cdef int* equal = NULL
+    cdef int k, i, j, diff
+    cdef char base1, base2
+    cdef double mean_diff
+    
+    if liberal and has_quals:
+        # Offsets of mismatches whose qualities are too close to call.
+        equal = <int*> PyMem_Malloc(size * sizeof(int))
+        if not equal:
+            raise MemoryError()
+    
+    try:
+        for k in range(size):
+            i = r1_start + k
+            j = r2_end - 1 - k
+            base1 = s1[i]
+            base2 = _complement(s2[j])
+            if base1 == base2:
+                continue
+            if n_action:
+                s1[i] = b'N'
+                s2[j] = b'N'
+                r1_changed += 1
+                r2_changed += 1
+            elif base1 == b'N':
+                s1[i] = base2
+                if has_quals:
+                    q1[i] = q2[j]
+                r1_changed += 1
+            elif base2 == b'N':
+                s2[j] = _complement(base1)
+                if has_quals:
+                    q2[j] = q1[i]
+                r2_changed += 1
+            elif has_quals:
+                diff = q1[i] - q2[j]
+                if diff >= min_qual_difference:
+                    s2[j] = _complement(base1)
+                    q2[j] = q1[i]
+                    r2_changed += 1
+                elif diff <= -min_qual_difference:
+                    s1[i] = base2
+                    q1[i] = q2[j]
+                    r1_changed += 1
+                elif liberal:
+                    equal[num_equal] = k
+                    num_equal += 1
+        
+        if num_equal > 0:
+            mean_diff = (
+                _mean_qual(q1, len1, r1_start, r1_end) -
+                _mean_qual(q2, len2, r2_start, r2_end))
+            # Only make the corrections if one read is significantly better
+            # than the other.
+            if mean_diff > 1:
+                for k in range(num_equal):
+                    i = r1_start + equal[k]
+                    j = r2_end - 1 - equal[k]
+                    s2[j] = _complement(s1[i])
+                    q2[j] = q1[i]
+                    r2_changed += 1
+            elif mean_diff < -1:
+                for k in range(num_equal):
+                    i = r1_start + equal[k]
+                    j = r2_end - 1 - equal[k]
+                    s1[i] = _complement(s2[j])
+                    q1[i] = q2[j]
+                    r1_changed += 1
+    finally:
+        PyMem_Free(equal)
+    
+    if r1_changed:
+        seq1 = seq1_buf.decode('ascii')
+        if has_quals:
+            qual1 = qual1_buf.decode('ascii')
+    if r2_changed:
+        seq2 = seq2_buf.decode('ascii')
+        if has_quals:
+            qual2 = qual2_buf.decode('ascii')
+    
+    return (r1_changed, r2_changed, seq1, qual1, seq2, qual2)
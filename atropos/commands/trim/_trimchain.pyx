@@ -0,0 +1,579 @@
+# kate: syntax Python;
+# cython: profile=False, emit_code_comments=False
+"""
+Fused application of consecutive trimming modifiers, and screening of reads
+that the modifiers leave unchanged.
+"""
+from cpython.mem cimport PyMem_Malloc, PyMem_Free
+
+# Kinds of trimmers that can be fused.
+DEF UNCONDITIONAL = 0
+DEF MINIMUM = 1
+DEF QUALITY = 2
+DEF NEXTSEQ = 3
+DEF N_END = 4
+
+UNCONDITIONAL_CUTTER = UNCONDITIONAL
+MIN_CUTTER = MINIMUM
+QUALITY_TRIMMER = QUALITY
+NEXTSEQ_TRIMMER = NEXTSEQ
+N_END_TRIMMER = N_END
+
+ctypedef struct _Step:
+    int kind
+    int front_length  # UNCONDITIONAL, MINIMUM
+    int back_length
+    bint count_trimmed  # MINIMUM
+    bint only_trimmed
+    int cutoff_front  # QUALITY; NEXTSEQ uses cutoff_back
+    int cutoff_back
+    int base
+    long trimmed_bases  # bases trimmed from the current read
+
+cdef inline int _clamp(int idx, int length) nogil:
+    """Normalize a slice index as Python does (for step 1)."""
+    if idx < 0:
+        idx += length
+        if idx < 0:
+            idx = 0
+    elif idx > length:
+        idx = length
+    return idx
+
+cdef void _quality_trim(
+        const char* qual, int length, int cutoff_front, int cutoff_back,
+        int base, int* start, int* stop) nogil:
+    """Same as atropos.commands.trim.qualtrim.quality_trim_index."""
+    cdef int s = 0
+    cdef int max_qual = 0
+    cdef int i
+    start[0] = 0
+    stop[0] = length
+    for i in range(length):
+        s += cutoff_front - (qual[i] - base)
+        if s < 0:
+            break
+        if s > max_qual:
+            max_qual = s
+            start[0] = i + 1
+    max_qual = 0
+    s = 0
+    for i in range(length - 1, -1, -1):
+        s += cutoff_back - (qual[i] - base)
+        if s < 0:
+            break
+        if s > max_qual:
+            max_qual = s
+            stop[0] = i
+    if start[0] >= stop[0]:
+        start[0] = stop[0] = 0
+
+cdef int _nextseq_trim(
+        const char* seq, const char* qual, int length, int cutoff,
+        int base) nogil:
+    """Same as atropos.commands.trim.qualtrim.nextseq_trim_index."""
+    cdef int s = 0
+    cdef int max_qual = 0
+    cdef int max_i = length
+    cdef int i, q
+    for i in range(length - 1, -1, -1):
+        q = qual[i] - base
+        if seq[i] == b'G':
+            q = cutoff - 1
+        s += cutoff - q
+        if s < 0:
+            break
+        if s > max_qual:
+            max_qual = s
+            max_i = i
+    return max_i
+
+cdef class TrimChain:
+    """
+    Applies a run of consecutive trimmers to a read in a single call. The
+    trim coordinates and the read's clipped counts are kept in C integers
+    while the trimmers are applied, and the trimmed read is created once, at
+    the end. The result, including the clipped counts of the read and the
+    trimmed_bases statistics of the trimmers, is the same as calling the
+    trimmers one after the other.
+    
+    Args:
+        steps: Sequence of (kind, trimmer) tuples, where kind is one of
+            UNCONDITIONAL_CUTTER, MIN_CUTTER, QUALITY_TRIMMER, NEXTSEQ_TRIMMER
+            and N_END_TRIMMER, and trimmer is the corresponding modifier
+            instance (which provides the parameters and receives the
+            trimmed_bases counts).
+    """
+    cdef _Step* steps
+    cdef int num_steps
+    cdef readonly tuple trimmers
+    cdef tuple _args
+    cdef bint needs_qualities
+    
+    def __cinit__(self, steps):
+        cdef int i
+        cdef _Step* step
+        steps = tuple(steps)
+        self._args = steps
+        self.num_steps = len(steps)
+        self.trimmers = tuple(trimmer for _, trimmer in steps)
+        self.steps = <_Step*> PyMem_Malloc(self.num_steps * sizeof(_Step))
+        if not self.steps:
+            raise MemoryError()
+        self.needs_qualities = False
+        for i, (kind, trimmer) in enumerate(steps):
+            step = &self.steps[i]
+            step.kind = kind
+            step.trimmed_bases = 0
+            if kind == UNCONDITIONAL or kind == MINIMUM:
+                step.front_length = trimmer.front_length
+                step.back_length = trimmer.back_length
+                if kind == MINIMUM:
+                    step.count_trimmed = trimmer.count_trimmed
+                    step.only_trimmed = trimmer.only_trimmed
+            elif kind == QUALITY:
+                step.cutoff_front = trimmer.cutoff_front
+                step.cutoff_back = trimmer.cutoff_back
+                step.base = trimmer.base
+                self.needs_qualities = True
+            elif kind == NEXTSEQ:
+                step.cutoff_back = trimmer.cutoff
+                step.base = trimmer.base
+                self.needs_qualities = True
+            elif kind != N_END:
+                raise ValueError("Invalid trimmer kind: {}".format(kind))
+    
+    def __reduce__(self):
+        return (TrimChain, (self._args,))
+    
+    def __call__(self, read):
+        cdef str sequence = read.sequence
+        cdef str qualities = read.qualities
+        cdef bytes seq_bytes = sequence.encode('ascii')
+        cdef bytes qual_bytes
+        cdef const char* seq = seq_bytes
+        cdef const char* qual = NULL
+        cdef int length = len(sequence)
+        cdef int start = 0
+        cdef int stop = length
+        cdef int clipped[4]
+        cdef int orig_clipped[4]
+        cdef int offset = 2 if read.match else 0
+        cdef int front_rsize = 0
+        cdef int back_rsize = 0
+        cdef int i, cur_len, front, back, trimmed, new_start, new_stop
+        cdef bint has_match = bool(read.match)
+        cdef bint trim_front, trim_back
+        cdef _Step* step
+        
+        if self.needs_qualities and qualities is not None:
+            qual_bytes = qualities.encode('ascii')
+            qual = qual_bytes
+        read_clipped = read.clipped
+        for i in range(4):
+            clipped[i] = orig_clipped[i] = read_clipped[i]
+        if has_match:
+            for info in read.match_info:
+                if info.is_front:
+                    front_rsize += info.rsize_total
+                else:
+                    back_rsize += info.rsize_total
+        
+        for i in range(self.num_steps):
+            step = &self.steps[i]
+            cur_len = stop - start
+            if step.kind == UNCONDITIONAL or step.kind == MINIMUM:
+                front = step.front_length
+                back = step.back_length
+                if step.kind == MINIMUM:
+                    trim_front = trim_back = True
+                    if step.only_trimmed:
+                        if not has_match:
+                            continue
+                        # With only_trimmed, the decision depends on where
+                        # the adapters matched, which MinCutter determines
+                        # from read.match_info.
+                        is_front = [info.is_front for info in read.match_info]
+                        if not any(is_front):
+                            trim_front = False
+                        elif all(is_front):
+                            trim_back = False
+                    if trim_front:
+                        front = max(front - _min_trimmed(
+                            clipped, 0, step.count_trimmed, has_match,
+                            front_rsize), 0)
+                    else:
+                        front = 0
+                    if trim_back:
+                        back = min(_min_trimmed(
+                            clipped, 1, step.count_trimmed, has_match,
+                            back_rsize) + back, 0)
+                    else:
+                        back = 0
+                # Trimmer.clip/Sequence.clip
+                if not ((front or back) and cur_len > 0):
+                    continue
+                new_start = _clamp(front, cur_len)
+                if back < 0:
+                    new_stop = max(_clamp(back, cur_len), new_start)
+                    back = -back
+                else:
+                    new_stop = cur_len
+                if front:
+                    clipped[offset] += front
+                if back:
+                    clipped[offset + 1] += back
+                step.trimmed_bases += front + back
+                stop = start + new_stop
+                start += new_start
+            elif step.kind == N_END:
+                if cur_len == 0:
+                    continue
+                new_start = 0
+                while new_start < cur_len and seq[start + new_start] == b'N':
+                    new_start += 1
+                new_stop = cur_len
+                while new_stop > 0 and seq[start + new_stop - 1] == b'N':
+                    new_stop -= 1
+                _subseq(clipped, offset, step, &start, &stop, new_start, new_stop)
+            else:
+                if cur_len == 0:
+                    continue
+                if qual == NULL:
+                    raise TypeError("Quality trimming requires qualities")
+                if step.kind == QUALITY:
+                    _quality_trim(
+                        qual + start, cur_len, step.cutoff_front,
+                        step.cutoff_back, step.base, &new_start, &new_stop)
+                else:
+                    new_start = 0
+                    new_stop = _nextseq_trim(
+                        seq + start, qual + start, cur_len, step.cutoff_back,
+                        step.base)
+                _subseq(clipped, offset, step, &start, &stop, new_start, new_stop)
+        
+        for i in range(self.num_steps):
+            if self.steps[i].trimmed_bases:
+                self.trimmers[i].trimmed_bases += self.steps[i].trimmed_bases
+                self.steps[i].trimmed_bases = 0
+        
+        if start == 0 and stop == length:
+            for i in range(4):
+                if clipped[i] != orig_clipped[i]:
+                    break
+            else:
+                return read
+        new_read = read[start:stop]
+        new_read.clipped = (clipped[0], clipped[1], clipped[2], clipped[3])
+        return new_read
+    
+    def __dealloc__(self):
+        PyMem_Free(self.steps)
+
+cdef inline int _min_trimmed(
+        int* clipped, int offset, bint count_trimmed, bint has_match,
+        int rsize):
+    """Number of bases already trimmed from one end, as in MinCutter."""
+    if count_trimmed:
+        return clipped[offset] + clipped[offset + 2] + (rsize if has_match else 0)
+    elif has_match:
+        return clipped[offset + 2]
+    else:
+        return clipped[offset]
+
+cdef inline void _subseq(
+        int* clipped, int offset, _Step* step, int* start, int* stop,
+        int new_start, int new_stop):
+    """Trimmer.subseq/Sequence.subseq with begin=new_start, end=new_stop."""
+    cdef int cur_len = stop[0] - start[0]
+    cdef int end_bases = cur_len - new_stop
+    if new_start:
+        clipped[offset] += new_start
+    if end_bases:
+        clipped[offset + 1] += end_bases
+    step.trimmed_bases += new_start + end_bases
+    stop[0] = start[0] + max(new_start, new_stop)
+    start[0] += new_start
+
+# Kind of modifier that ReadScreen accepts in addition to the trimmers.
+DEF ADAPTER = 5
+ADAPTER_CUTTER = ADAPTER
+
+# Seeds are packed into an unsigned int, 2 bits per base.
+DEF MAX_SEED_LENGTH = 16
+
+cdef signed char _BASE_CODES[256]
+_BASE_CODES[:] = [-1] * 256
+for _i, _bases in enumerate(('Aa', 'Cc', 'Gg', 'Tt')):
+    for _base in _bases:
+        _BASE_CODES[ord(_base)] = _i
+
+ctypedef struct _Seeds:
+    int length  # bases per seed
+    int window  # bases at the 3' end of the read to search; -1 = whole read
+    int offset  # offset of the seed codes in ReadScreen.codes
+    int num_codes
+
+ctypedef struct _Tail:
+    const char* prefix  # the adapter
+    int shortest  # range of overlaps that must match exactly
+    int longest
+
+cdef int _max_errors(int overlap, double max_error_rate):
+    """Largest number of errors allowed in an adapter match of the given
+    length, by either of the checks used by the aligner and the adapter."""
+    cdef int errors = <int> (overlap * max_error_rate)
+    while (
+            errors + 1 <= overlap * max_error_rate or
+            (errors + 1) / <double> overlap <= max_error_rate):
+        errors += 1
+    return errors
+
+def back_adapter_seeds(str sequence, double max_error_rate, int min_overlap):
+    """
+    Computes the seeds, at least one of which occurs (without errors) in any
+    read that a regular 3' adapter can be matched to. A match of the first o
+    bases of the adapter may have at most k = o * max_error_rate errors, so
+    if those bases are split into k + 1 pieces, one of the pieces occurs in
+    the read. Overlaps are grouped by k. Overlaps that are shorter than the
+    adapter end at the 3' end of the read, so their pieces only need to be
+    searched within the last o + k bases; a full-length match may be
+    anywhere in the read.
+    
+    Returns a tuple (seeds, tail), where seeds is a list of (pieces, window)
+    tuples (window is the number of bases at the end of the read to search,
+    or -1 for the whole read), and tail is the range (shortest, longest) of
+    overlaps that must match the end of the read exactly, or None.
+    """
+    cdef int length = len(sequence)
+    cdef int overlap, errors, piece_length, num_pieces
+    groups = {}
+    for overlap in range(min_overlap, length):
+        errors = _max_errors(overlap, max_error_rate)
+        if errors in groups:
+            groups[errors][1] = overlap
+        else:
+            groups[errors] = [overlap, overlap]
+    tail = None
+    seeds = []
+    full = (length, length, _max_errors(length, max_error_rate), -1)
+    for shortest, longest, errors, window in [
+            (shortest, longest, errors, longest + errors)
+            for errors, (shortest, longest) in sorted(groups.items())
+    ] + [full]:
+        if errors == 0 and window >= 0:
+            tail = (shortest, longest)
+            continue
+        piece_length = shortest // (errors + 1)
+        if piece_length == 0:
+            raise ValueError(
+                "Adapter {} cannot be screened at error rate {}".format(
+                    sequence, max_error_rate))
+        num_pieces = longest // piece_length
+        pieces = []
+        for i in range(num_pieces):
+            piece = sequence[
+                i * piece_length:
+                i * piece_length + min(piece_length, MAX_SEED_LENGTH)]
+            if piece not in pieces:
+                pieces.append(piece)
+        seeds.append((pieces, window))
+    return (seeds, tail)
+
+cdef class ReadScreen:
+    """
+    Identifies the reads that a sequence of modifiers leaves unchanged, so
+    that those reads can skip the modifiers. A read passes the screen only if
+    none of the trimmers would trim it (quality and NextSeq trimming use the
+    same computation as the trimmers, which stops at the first high-quality
+    base from each end) and none of the adapters can match it: a match
+    requires at least one of the adapter's seeds (see back_adapter_seeds) to
+    occur in the read. The screen never passes a read that the modifiers
+    would change, but some unchanged reads (e.g. those that share a seed with
+    an adapter) do not pass. Reads that already have an adapter match do not
+    pass either.
+    
+    Args:
+        steps: Sequence of (kind, modifier) tuples, where kind is one of
+            QUALITY_TRIMMER, NEXTSEQ_TRIMMER, N_END_TRIMMER and
+            ADAPTER_CUTTER. The adapters of an ADAPTER_CUTTER must be regular
+            3' adapters of A, C, G and T, with max_error_rate < 1. Modifiers
+            that are never applied to reads without adapter matches (e.g.
+            MinCutter with only_trimmed) need not be included.
+    """
+    cdef _Step* steps
+    cdef int num_steps
+    cdef _Seeds* seeds
+    cdef int num_seeds
+    cdef unsigned int* codes
+    cdef _Tail* tails
+    cdef int num_tails
+    cdef tuple _args
+    cdef tuple _prefixes
+    cdef bint needs_qualities
+    cdef bint read_wildcards
+    
+    def __cinit__(self, steps):
+        cdef int i, num_codes = 0
+        cdef unsigned int code
+        cdef _Step* step
+        steps = tuple(steps)
+        self._args = steps
+        trimmer_steps = []
+        all_seeds = []
+        tails = []
+        self.read_wildcards = False
+        for kind, modifier in steps:
+            if kind == ADAPTER:
+                for adapter in modifier.adapters:
+                    seeds, tail = back_adapter_seeds(
+                        adapter.sequence, adapter.max_error_rate,
+                        adapter.min_overlap)
+                    all_seeds.extend(seeds)
+                    if tail:
+                        tails.append((adapter.sequence.encode('ascii'),) + tail)
+                    if adapter.read_wildcards:
+                        self.read_wildcards = True
+            elif kind in (QUALITY, NEXTSEQ, N_END):
+                trimmer_steps.append((kind, modifier))
+            else:
+                raise ValueError("Invalid modifier kind: {}".format(kind))
+        
+        self.num_steps = len(trimmer_steps)
+        self.num_seeds = len(all_seeds)
+        self.num_tails = len(tails)
+        self._prefixes = tuple(tail[0] for tail in tails)
+        self.steps = <_Step*> PyMem_Malloc(self.num_steps * sizeof(_Step))
+        self.seeds = <_Seeds*> PyMem_Malloc(self.num_seeds * sizeof(_Seeds))
+        self.codes = <unsigned int*> PyMem_Malloc(
+            sum(len(pieces) for pieces, _ in all_seeds) * sizeof(unsigned int))
+        self.tails = <_Tail*> PyMem_Malloc(self.num_tails * sizeof(_Tail))
+        if not (self.steps and self.seeds and self.codes and self.tails):
+            raise MemoryError()
+        
+        self.needs_qualities = False
+        for i, (kind, trimmer) in enumerate(trimmer_steps):
+            step = &self.steps[i]
+            step.kind = kind
+            if kind == QUALITY:
+                step.cutoff_front = trimmer.cutoff_front
+                step.cutoff_back = trimmer.cutoff_back
+                step.base = trimmer.base
+                self.needs_qualities = True
+            elif kind == NEXTSEQ:
+                step.cutoff_back = trimmer.cutoff
+                step.base = trimmer.base
+                self.needs_qualities = True
+        for i, (pieces, window) in enumerate(all_seeds):
+            self.seeds[i].length = len(pieces[0])
+            self.seeds[i].window = window
+            self.seeds[i].offset = num_codes
+            self.seeds[i].num_codes = len(pieces)
+            for piece in pieces:
+                code = 0
+                for base in piece:
+                    code = (code << 2) | _BASE_CODES[ord(base)]
+                self.codes[num_codes] = code
+                num_codes += 1
+        for i, (prefix, shortest, longest) in enumerate(tails):
+            self.tails[i].prefix = self._prefixes[i]
+            self.tails[i].shortest = shortest
+            self.tails[i].longest = longest
+    
+    def __reduce__(self):
+        return (ReadScreen, (self._args,))
+    
+    def __call__(self, read):
+        """Returns True if the read is unchanged by the modifiers."""
+        cdef str sequence = read.sequence
+        cdef str qualities
+        cdef bytes seq_bytes = sequence.encode('ascii')
+        cdef bytes qual_bytes
+        cdef const char* seq = seq_bytes
+        cdef const char* qual = NULL
+        cdef int length = len(sequence)
+        cdef int i, start, stop
+        cdef _Step* step
+        
+        if read.match is not None:
+            return False
+        if self.needs_qualities and length > 0:
+            qualities = read.qualities
+            if qualities is None:
+                return False
+            qual_bytes = qualities.encode('ascii')
+            qual = qual_bytes
+        
+        if length > 0:
+            for i in range(self.num_steps):
+                step = &self.steps[i]
+                if step.kind == N_END:
+                    if seq[0] == b'N' or seq[length - 1] == b'N':
+                        return False
+                elif step.kind == QUALITY:
+                    _quality_trim(
+                        qual, length, step.cutoff_front, step.cutoff_back,
+                        step.base, &start, &stop)
+                    if start != 0 or stop != length:
+                        return False
+                elif _nextseq_trim(
+                        seq, qual, length, step.cutoff_back,
+                        step.base) != length:
+                    return False
+        
+        if self.read_wildcards:
+            for i in range(length):
+                if _BASE_CODES[<unsigned char> seq[i]] < 0:
+                    return False
+        for i in range(self.num_tails):
+            if _matches_tail(seq, length, &self.tails[i]):
+                return False
+        for i in range(self.num_seeds):
+            if _has_seed(seq, length, &self.seeds[i], self.codes):
+                return False
+        return True
+    
+    def __dealloc__(self):
+        PyMem_Free(self.steps)
+        PyMem_Free(self.seeds)
+        PyMem_Free(self.codes)
+        PyMem_Free(self.tails)
+
+cdef bint _matches_tail(const char* seq, int length, _Tail* tail):
+    """Whether the read ends with an adapter prefix of an overlap length in
+    the tail's range."""
+    cdef int overlap, i
+    cdef signed char code
+    for overlap in range(tail.shortest, min(tail.longest, length) + 1):
+        for i in range(overlap):
+            code = _BASE_CODES[<unsigned char> seq[length - overlap + i]]
+            if code < 0 or code != _BASE_CODES[<unsigned char> tail.prefix[i]]:
+                break
+        else:
+            return True
+    return False
+
+cdef bint _has_seed(
+        const char* seq, int length, _Seeds* seeds, unsigned int* codes):
+    """Whether any of the seeds occurs within the search window."""
+    cdef int start = 0
+    cdef int filled = 0
+    cdef int i, j
+    cdef signed char base
+    cdef unsigned int code = 0
+    cdef unsigned int mask = <unsigned int> (
+        (<unsigned long long> 1 << (2 * seeds.length)) - 1)
+    if seeds.window >= 0 and seeds.window < length:
+        start = length - seeds.window
+    for i in range(start, length):
+        base = _BASE_CODES[<unsigned char> seq[i]]
+        if base < 0:
+            filled = 0
+            continue
+        code = ((code << 2) | base) & mask
+        filled += 1
+        if filled >= seeds.length:
+            for j in range(seeds.offset, seeds.offset + seeds.num_codes):
+                if codes[j] == code:
+                    return True
+    return False
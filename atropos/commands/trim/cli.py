@@ -175,6 +175,14 @@ standard output.
             help="If no minimum overlap (-O) is specified, then adapters are "
                  "only matched when the probabilty of observing k out of n "
                  "matching bases is <= PROB. (1E-6)")
+        group.add_argument(
+            "--match-cache-size",
+            type=positive(int, True), default=0, metavar="SIZE",
+            help="Cache the adapter/insert matches for up to SIZE distinct "
+                 "read sequences, and re-use them for duplicate reads. This "
+                 "speeds up trimming of libraries with high sequence "
+                 "duplication, such as amplicon or small RNA libraries. Not "
+                 "supported in colorspace. (0 = no cache)")
         
         # Arguments for insert match
         group.add_argument(
@@ -410,6 +418,13 @@ standard output.
                  "'pre:tiles=<regexp>' means to use the specified regular "
                  "expression to extract key portions of read names to "
                  "collect the tile statistics.")
+        group.add_argument(
+            "--profile-pipeline",
+            action="store_true", default=False,
+            help="Count the calls to, and time spent in, each modifier and "
+                 "filter, the formatters and the output writing, and add a "
+                 "profile section to the report. Trimmers are not fused when "
+                 "profiling. (no)")
         
         group = self.add_group("Colorspace options")
         group.add_argument(
@@ -786,6 +801,8 @@ standard output.
                     "author).")
             if options.match_read_wildcards:
                 parser.error('IUPAC wildcards not supported in colorspace')
+            if options.match_cache_size:
+                parser.error('--match-cache-size not supported in colorspace')
             options.match_adapter_wildcards = False
         else:
             if options.trim_primer:
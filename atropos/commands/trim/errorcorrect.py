@@ -0,0 +1,110 @@
+# coding: utf-8
+"""Correction of mismatches between overlapping read pairs.
+"""
+from atropos.util import BASE_COMPLEMENTS, mean, quals2ints
+
+def _correct_mismatches_python(
+        seq1, qual1, seq2, qual2, r1_start, r1_end, r2_start, r2_end,
+        mismatch_action, min_qual_difference):
+    """Correct mismatches between the overlapping portions of two reads.
+    
+    Args:
+        seq1, seq2: The read sequences.
+        qual1, qual2: The read qualities, or None if the reads lack quality
+            information.
+        r1_start, r1_end: The overlapping interval of read1.
+        r2_start, r2_end: The overlapping interval of read2 (which is
+            reverse-complemented with respect to read1).
+        mismatch_action: 'N', 'liberal' or 'conservative'.
+        min_qual_difference: The minimum difference in base quality between
+            read1 and read2 required to perform a correction.
+    
+    Returns:
+        Tuple (r1_changed, r2_changed, seq1, qual1, seq2, qual2), where
+        r1_changed and r2_changed are the numbers of corrected bases.
+    """
+    r1_seq = list(seq1)
+    r2_seq = list(seq2)
+    has_quals = qual1 is not None and qual2 is not None
+    if has_quals:
+        r1_qual = list(qual1)
+        r2_qual = list(qual2)
+    
+    r1_changed = 0
+    r2_changed = 0
+    quals_equal = []
+    
+    for i, j in zip(
+            range(r1_start, r1_end), range(r2_end - 1, r2_start, -1)):
+        base1 = r1_seq[i]
+        base2 = BASE_COMPLEMENTS[r2_seq[j]]
+        if base1 == base2:
+            continue
+        if mismatch_action == 'N':
+            r1_seq[i] = 'N'
+            r2_seq[j] = 'N'
+            r1_changed += 1
+            r2_changed += 1
+        elif base1 == 'N':
+            r1_seq[i] = base2
+            if has_quals:
+                r1_qual[i] = r2_qual[j]
+            r1_changed += 1
+        elif base2 == 'N':
+            r2_seq[j] = BASE_COMPLEMENTS[base1]
+            if has_quals:
+                r2_qual[j] = r1_qual[i]
+            r2_changed += 1
+        elif has_quals:
+            diff = ord(r1_qual[i]) - ord(r2_qual[j])
+            if diff >= min_qual_difference:
+                r2_seq[j] = BASE_COMPLEMENTS[base1]
+                r2_qual[j] = r1_qual[i]
+                r2_changed += 1
+            elif diff <= -min_qual_difference:
+                r1_seq[i] = base2
+                r1_qual[i] = r2_qual[j]
+                r1_changed += 1
+            elif mismatch_action == 'liberal':
+                quals_equal.append((i, j, base1, base2))
+    
+    if quals_equal:
+        mean_qual1 = mean(quals2ints(''.join(r1_qual[r1_start:r1_end]), 0))
+        mean_qual2 = mean(quals2ints(''.join(r2_qual[r2_start:r2_end]), 0))
+        # Only make the corrections if one read is significantly better
+        # than the other.
+        # TODO: this method of determining whether one read is better
+        # than the other is crude - come up with something better.
+        diff = mean_qual1 - mean_qual2
+        if diff > 1:
+            # read1 is better than read2
+            for i, j, base1, base2 in quals_equal:
+                r2_seq[j] = BASE_COMPLEMENTS[base1]
+                r2_qual[j] = r1_qual[i]
+                r2_changed += 1
+        elif diff < -1:
+            # read2 is better than read1
+            for i, j, base1, base2 in quals_equal:
+                r1_seq[i] = base2
+                r1_qual[i] = r2_qual[j]
+                r1_changed += 1
+    
+    if r1_changed:
+        seq1 = ''.join(r1_seq)
+        if has_quals:
+            qual1 = ''.join(r1_qual)
+    if r2_changed:
+        seq2 = ''.join(r2_seq)
+        if has_quals:
+            qual2 = ''.join(r2_qual)
+    
+    return (r1_changed, r2_changed, seq1, qual1, seq2, qual2)
+
+# Import cythonized function, defaulting to pure python implementation.
+try:
+    from ._errorcorrect import correct_mismatches
+except ImportError:
+    import logging
+    logging.getLogger().debug(
+        "Import failed for cythonized error correction function")
+    correct_mismatches = _correct_mismatches_python
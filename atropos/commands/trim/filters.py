@@ -9,9 +9,20 @@ what happens to a read, a list of Wrappers with different filters is created and
 each Wrapper is called in turn until one returns True. The main program will
 determine whether and where to write the read(s) based on whether it was rejected
 by a filter, and which one.
+
+Filters can also be applied to a whole batch of records at once (see
+:meth:`Filters.filter_batch`). Filters that define a `filter_batch` method
+evaluate the batch using arrays of per-read features (such as lengths and N
+counts) that are computed once per batch; other filters are called on each
+read. Batch filtering requires numpy.
 """
 from collections import OrderedDict
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Constants used when returning from a Filter’s __call__ method to improve
 # readability (it is unintuitive that "return True" means "discard the read").
 DISCARD = True
@@ -40,6 +51,34 @@ class FilterWrapper(object):
         """
         raise NotImplementedError()
     
+    def filter_batch(self, batch, indexes):
+        """Call the filter on a subset of the records in a batch.
+        
+        Args:
+            batch: A :class:`ReadBatch`.
+            indexes: Array of the indexes of the records to filter.
+        
+        Returns:
+            A boolean array with the same length as `indexes` that is True for
+            the records to discard.
+        """
+        if hasattr(self.filter, 'filter_batch'):
+            discard = self._filter_batch(batch)[indexes]
+            self.filtered += int(np.count_nonzero(discard))
+            return discard
+        return np.fromiter(
+            (self(*batch.records[i]) for i in indexes), dtype=bool,
+            count=len(indexes))
+    
+    def _filter_batch(self, batch):
+        """Call the filter's batch function.
+        
+        Returns:
+            A boolean array that is True for the records in `batch` that fail
+            the filter.
+        """
+        raise NotImplementedError()
+    
     @property
     def name(self):
         """The filter name.
@@ -62,6 +101,9 @@ class SingleWrapper(FilterWrapper):
     """
     def _filter(self, read1, read2=None):
         return self.filter(read1)
+    
+    def _filter_batch(self, batch):
+        return self.filter.filter_batch(batch, 0)
 
 class PairedWrapper(FilterWrapper):
     """This is for paired-end reads, using the 'new-style' filtering where both
@@ -88,6 +130,23 @@ class PairedWrapper(FilterWrapper):
                 (read2 is None or self.filter(read2))):
             failures += 1
         return failures >= self.min_affected
+    
+    def filter_batch(self, batch, indexes):
+        if not batch.paired:
+            # Missing mates count as failures, which only the per-read
+            # implementation handles
+            return np.fromiter(
+                (self(*batch.records[i]) for i in indexes), dtype=bool,
+                count=len(indexes))
+        return super().filter_batch(batch, indexes)
+    
+    def _filter_batch(self, batch):
+        failed1 = self.filter.filter_batch(batch, 0)
+        failed2 = self.filter.filter_batch(batch, 1)
+        if self.min_affected == 1:
+            return failed1 | failed2
+        else:
+            return failed1 & failed2
 
 class FilterFactory(object):
     """Factor that creates filters and wraps them in the appropriate
@@ -122,6 +181,9 @@ class TooShortReadFilter(object):
     
     def __call__(self, read):
         return len(read) < self.minimum_length
+    
+    def filter_batch(self, batch, read):
+        return batch.lengths(read) < self.minimum_length
 
 class TooLongReadFilter(object):
     """Returns True if the read sequence is longer than `maximum_length`.
@@ -133,6 +195,9 @@ class TooLongReadFilter(object):
     
     def __call__(self, read):
         return len(read) > self.maximum_length
+    
+    def filter_batch(self, batch, read):
+        return batch.lengths(read) > self.maximum_length
 
 class NContentFilter(object):
     """Discards a reads that has a number of 'N's over a given threshold. It
@@ -155,13 +220,21 @@ class NContentFilter(object):
     def __call__(self, read):
         """Return True when the read should be discarded.
         """
-        n_count = read.sequence.lower().count('n')
+        n_count = count_n(read.sequence)
         if self.is_proportion:
             if len(read) == 0:
                 return False
             return n_count / len(read) > self.cutoff
         else:
             return n_count > self.cutoff
+    
+    def filter_batch(self, batch, read):
+        n_counts = batch.n_counts(read)
+        if self.is_proportion:
+            # Empty reads are never discarded; 0 / 1 is never > cutoff
+            return n_counts / np.maximum(batch.lengths(read), 1) > self.cutoff
+        else:
+            return n_counts > self.cutoff
 
 class UntrimmedFilter(object):
     """Returns True if read is untrimmed.
@@ -183,6 +256,48 @@ class NoFilter(object):
     def __call__(self, read):
         return False
 
+def count_n(sequence):
+    """Count the Ns (upper- or lower-case) in a sequence.
+    """
+    return sequence.count('N') + sequence.count('n')
+
+class ReadBatch(object):
+    """A batch of records to filter, along with arrays of per-read features
+    that are computed on demand and then shared by all the filters.
+    
+    Args:
+        records: Sequence of tuples (read1,) or (read1, read2).
+    """
+    def __init__(self, records):
+        self.records = records
+        self.paired = all(
+            len(record) > 1 and record[1] is not None for record in records)
+        self._lengths = [None, None]
+        self._n_counts = [None, None]
+    
+    def __len__(self):
+        return len(self.records)
+    
+    def lengths(self, read):
+        """Returns an array of the lengths of read1 (read=0) or read2 (read=1)
+        of all the records.
+        """
+        if self._lengths[read] is None:
+            self._lengths[read] = np.fromiter(
+                (len(record[read]) for record in self.records),
+                dtype=np.intp, count=len(self.records))
+        return self._lengths[read]
+    
+    def n_counts(self, read):
+        """Returns an array of the N counts of read1 (read=0) or read2 (read=1)
+        of all the records.
+        """
+        if self._n_counts[read] is None:
+            self._n_counts[read] = np.fromiter(
+                (count_n(record[read].sequence) for record in self.records),
+                dtype=np.intp, count=len(self.records))
+        return self._n_counts[read]
+
 class Filters(object):
     """Manages multiple filters.
     
@@ -218,12 +333,49 @@ class Filters(object):
                 break
         return dest
     
+    def filter_batch(self, records):
+        """Filter a batch of records. The result, including the count of
+        records filtered by each filter, is the same as calling `filter` on
+        each record.
+        
+        Args:
+            records: Sequence of tuples (read1,) or (read1, read2).
+        
+        Returns:
+            A list with the destination (see `filter`) of each record.
+        """
+        if np is None:
+            return [self.filter(*record) for record in records]
+        dests = [NoFilter] * len(records)
+        batch = ReadBatch(records)
+        indexes = np.arange(len(records))
+        for filter_type, fltr in self.filters.items():
+            if len(indexes) == 0:
+                break
+            discard = fltr.filter_batch(batch, indexes)
+            for idx in indexes[discard].tolist():
+                dests[idx] = filter_type
+            indexes = indexes[~discard]
+        return dests
+    
     def __contains__(self, filter_type):
         return filter_type in self.filters
     
     def __getitem__(self, filter_type):
         return self.filters[filter_type]
     
+    def profile(self, profiler):
+        """Time each of the filters.
+        
+        Args:
+            profiler: A :class:`atropos.util.Profiler`.
+        """
+        for fltr in self.filters.values():
+            fltr._filter = profiler.wrap(fltr._filter, 'filters', fltr.name)
+            if hasattr(fltr.filter, 'filter_batch'):
+                fltr._filter_batch = profiler.wrap(
+                    fltr._filter_batch, 'filters', fltr.name)
+    
     def summarize(self):
         """Returns a summary dict.
         """
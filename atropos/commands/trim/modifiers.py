@@ -8,11 +8,23 @@ from collections import OrderedDict
 import copy
 import re
 from atropos import AtroposError
+from atropos.adapters import Adapter, LinkedMatch, BACK
 from atropos.align import (
-    Aligner, InsertAligner, SEMIGLOBAL, START_WITHIN_SEQ1, STOP_WITHIN_SEQ2)
-from atropos.util import BASE_COMPLEMENTS, reverse_complement, mean, quals2ints
+    Aligner, InsertAligner, Match, PackedSequence, SEMIGLOBAL,
+    START_WITHIN_SEQ1, STOP_WITHIN_SEQ2)
+from atropos.util import LRUCache, mean, quals2ints
+from .errorcorrect import correct_mismatches
 from .qualtrim import quality_trim_index, nextseq_trim_index
 
+try:
+    from ._trimchain import (
+        TrimChain, ReadScreen, UNCONDITIONAL_CUTTER, MIN_CUTTER,
+        QUALITY_TRIMMER, NEXTSEQ_TRIMMER, N_END_TRIMMER, ADAPTER_CUTTER)
+except ImportError:
+    import logging
+    logging.getLogger().debug("Import failed for cythonized trimming chain")
+    TrimChain = ReadScreen = None
+
 # Base classes
 
 class Modifier(object):
@@ -95,20 +107,36 @@ class AdapterCutter(Modifier):
         adapters: List of Adapter objects.
         times: Number of times to trim.
         action: What to do with a found adapter: None, 'trim', or 'mask'
+        cache_size: Maximum number of read sequences for which to cache the
+            best adapter match. Highly duplicated libraries (e.g. amplicon or
+            small RNA) benefit from caching. Set to 0 to disable the cache.
     """
-    def __init__(self, adapters=None, times=1, action='trim'):
+    def __init__(self, adapters=None, times=1, action='trim', cache_size=0):
         super(AdapterCutter, self).__init__()
         self.adapters = adapters or []
         self.times = times
         self.action = action
         self.with_adapters = 0
-
+        self.cache = LRUCache(cache_size) if cache_size else None
+    
     def _best_match(self, read):
-        """Find the best matching adapter in the given read.
+        """Find the best matching adapter in the given read. If the cache is
+        enabled, the match coordinates are looked up by read sequence, and the
+        Match is rebuilt against `read`.
         
         Returns:
             Either a Match instance or None if there are no matches.
         """
+        if self.cache is None:
+            return self._find_best_match(read)
+        coords = self.cache.get(read.sequence, _NOT_CACHED)
+        if coords is _NOT_CACHED:
+            match = self._find_best_match(read)
+            self.cache[read.sequence] = match_to_coords(match)
+            return match
+        return coords_to_match(coords, read)
+    
+    def _find_best_match(self, read):
         best = None
         for adapter in self.adapters:
             match = adapter.match_to(read)
@@ -189,9 +217,61 @@ class AdapterCutter(Modifier):
         adapters_summary = OrderedDict()
         for adapter in self.adapters:
             adapters_summary[adapter.name] = adapter.summarize()
-        return dict(
+        summary = dict(
             records_with_adapters=self.with_adapters,
             adapters=adapters_summary)
+        if self.cache is not None:
+            summary.update(
+                cache_hits=self.cache.hits,
+                cache_misses=self.cache.misses)
+        return summary
+
+_NOT_CACHED = object()
+
+def match_to_coords(match):
+    """Convert an adapter match to a tuple of coordinates that does not hold a
+    reference to the read.
+    
+    Args:
+        match: A :class:`Match`, :class:`LinkedMatch`, or None.
+    
+    Returns:
+        A tuple, or None if `match` is None.
+    """
+    if match is None:
+        return None
+    if isinstance(match, LinkedMatch):
+        return (
+            match.adapter,
+            match_to_coords(match.front_match),
+            match_to_coords(match.back_match))
+    return (
+        match.adapter, match.astart, match.astop, match.rstart, match.rstop,
+        match.matches, match.errors, match.front)
+
+def coords_to_match(coords, read):
+    """Rebuild a match from coordinates created by :func:`match_to_coords`.
+    
+    Args:
+        coords: The match coordinates.
+        read: The :class:`Sequence` to which the match applies.
+    
+    Returns:
+        A :class:`Match`, :class:`LinkedMatch`, or None.
+    """
+    if coords is None:
+        return None
+    if len(coords) == 3:
+        adapter, front_coords, back_coords = coords
+        front_match = coords_to_match(front_coords, read)
+        back_match = None
+        if back_coords is not None:
+            back_match = coords_to_match(
+                back_coords, read[front_match.rstop:])
+        return LinkedMatch(front_match, back_match, adapter)
+    adapter, astart, astop, rstart, rstop, matches, errors, front = coords
+    return Match(
+        astart, astop, rstart, rstop, matches, errors, front, adapter, read)
 
 # Other error correction approaches:
 # https://www.ncbi.nlm.nih.gov/pubmed/25161220
@@ -209,8 +289,7 @@ class ErrorCorrectorMixin(object):
     """
     def __init__(self, mismatch_action=None, min_qual_difference=1):
         self.mismatch_action = mismatch_action
-        self.r1r2_min_qual_difference = min_qual_difference
-        self.r2r1_min_qual_difference = -1 * min_qual_difference
+        self.min_qual_difference = min_qual_difference
         self.corrected_pairs = 0
         self.corrected_bp = [0, 0]
     
@@ -225,97 +304,35 @@ class ErrorCorrectorMixin(object):
         if read1.corrected > 0 or read2.corrected > 0:
             return
         
-        # read2 reverse-complement is the reference, read1 is the query
-        r1_seq = list(read1.sequence)
-        r2_seq = list(read2.sequence)
-        len2 = len(r2_seq)
-        
         has_quals = read1.qualities and read2.qualities
-        if has_quals:
-            r1_qual = list(read1.qualities)
-            r2_qual = list(read2.qualities)
-        elif self.mismatch_action in ('liberal', 'conservative'):
+        if not has_quals and self.mismatch_action in ('liberal', 'conservative'):
             raise ValueError(
                 "Cannot perform quality-based error correction on reads "
                 "lacking quality information")
         
-        r1_start = insert_match[2]
-        r1_end = insert_match[3]
-        r1_changed = 0
-        r2_start = len2 - insert_match[1]
-        r2_end = len2 - insert_match[0]
-        r2_changed = 0
-        quals_equal = []
-        
-        for i, j in zip(
-                range(r1_start, r1_end), range(r2_end - 1, r2_start, -1)):
-            base1 = r1_seq[i]
-            base2 = BASE_COMPLEMENTS[r2_seq[j]]
-            if base1 == base2:
-                continue
-            if self.mismatch_action == 'N':
-                r1_seq[i] = 'N'
-                r2_seq[j] = 'N'
-                r1_changed += 1
-                r2_changed += 1
-            elif base1 == 'N':
-                r1_seq[i] = base2
-                if has_quals:
-                    r1_qual[i] = r2_qual[j]
-                r1_changed += 1
-            elif base2 == 'N':
-                r2_seq[j] = BASE_COMPLEMENTS[base1]
-                if has_quals:
-                    r2_qual[j] = r1_qual[i]
-                r2_changed += 1
-            elif has_quals:
-                diff = ord(r1_qual[i]) - ord(r2_qual[j])
-                if diff >= self.r1r2_min_qual_difference:
-                    r2_seq[j] = BASE_COMPLEMENTS[base1]
-                    r2_qual[j] = r1_qual[i]
-                    r2_changed += 1
-                elif diff <= self.r2r1_min_qual_difference:
-                    r1_seq[i] = base2
-                    r1_qual[i] = r2_qual[j]
-                    r1_changed += 1
-                elif self.mismatch_action == 'liberal':
-                    quals_equal.append((i, j, base1, base2))
-        
-        if quals_equal:
-            mean_qual1 = mean([ord(b) for b in r1_qual[r1_start:r1_end]])
-            mean_qual2 = mean([ord(b) for b in r2_qual[r2_start:r2_end]])
-            # Only make the corrections if one read is significantly better
-            # than the other.
-            # TODO: this method of determining whether one read is better
-            # than the other is crude - come up with something better.
-            diff = mean_qual1 - mean_qual2
-            if diff > 1:
-                # read1 is better than read2
-                for i, j, base1, base2 in quals_equal:
-                    r2_seq[j] = BASE_COMPLEMENTS[base1]
-                    r2_qual[j] = r1_qual[i]
-                    r2_changed += 1
-            elif diff < -1:
-                # read2 is better than read1
-                for i, j, base1, base2 in quals_equal:
-                    r1_seq[i] = base2
-                    r1_qual[i] = r2_qual[j]
-                    r1_changed += 1
+        # read2 reverse-complement is the reference, read1 is the query
+        len2 = len(read2.sequence)
+        r1_changed, r2_changed, seq1, qual1, seq2, qual2 = correct_mismatches(
+            read1.sequence, read1.qualities if has_quals else None,
+            read2.sequence, read2.qualities if has_quals else None,
+            insert_match[2], insert_match[3],
+            len2 - insert_match[1], len2 - insert_match[0],
+            self.mismatch_action, self.min_qual_difference)
         
         if r1_changed or r2_changed:
             self.corrected_pairs += 1
             if r1_changed:
                 self.corrected_bp[0] += r1_changed
-                read1.sequence = ''.join(r1_seq)
+                read1.sequence = seq1
                 read1.corrected = r1_changed
                 if has_quals:
-                    read1.qualities = ''.join(r1_qual)
+                    read1.qualities = qual1
             if r2_changed:
                 self.corrected_bp[1] += r2_changed
-                read2.sequence = ''.join(r2_seq)
+                read2.sequence = seq2
                 read2.corrected = r2_changed
                 if has_quals:
-                    read2.qualities = ''.join(r2_qual)
+                    read2.qualities = qual2
     
     def summarize(self):
         """Returns a summary dict.
@@ -339,11 +356,14 @@ class InsertAdapterCutter(ReadPairModifier, ErrorCorrectorMixin):
             same place on overlapping reads.
         min_insert_overlap: Minimum overlap required between reads to be
             considered an insert match.
+        cache_size: Maximum number of read pair sequences for which to cache
+            the insert and adapter matches. Set to 0 to disable the cache.
         aligner_args: Additional arguments to :class:`InsertAligner`.
     """
     def __init__(
             self, adapter1, adapter2, action='trim', mismatch_action=None,
-            symmetric=True, min_insert_overlap=1, **aligner_args):
+            symmetric=True, min_insert_overlap=1, cache_size=0,
+            **aligner_args):
         ErrorCorrectorMixin.__init__(self, mismatch_action)
         self.adapter1 = adapter1
         self.adapter2 = adapter2
@@ -354,23 +374,22 @@ class InsertAdapterCutter(ReadPairModifier, ErrorCorrectorMixin):
         self.action = action
         self.symmetric = symmetric
         self.with_adapters = [0, 0]
+        self.cache = LRUCache(cache_size) if cache_size else None
     
     def __call__(self, read1, read2):
         read_lengths = [len(r) for r in (read1, read2)]
         if any(l < self.min_insert_len for l in read_lengths):
             return (read1, read2)
         
-        match = self.aligner.match_insert(read1.sequence, read2.sequence)
-        read1.insert_overlap = read2.insert_overlap = (match is not None)
-        insert_match = None
+        is_insert_match, insert_match, adapter_match1, adapter_match2 = \
+            self._match_pair(read1, read2)
+        read1.insert_overlap = read2.insert_overlap = is_insert_match
         correct_errors = False
         
-        if match:
-            insert_match, adapter_match1, adapter_match2 = match
+        if is_insert_match:
             correct_errors = self.mismatch_action and insert_match[5] > 0
         else:
-            adapter_match1 = self.adapter1.match_to(read1)
-            adapter_match2 = self.adapter2.match_to(read2)
+            insert_match = None
             # If the adapter matches are complementary, perform error correction
             if (
                     self.mismatch_action and adapter_match1 and
@@ -404,6 +423,37 @@ class InsertAdapterCutter(ReadPairModifier, ErrorCorrectorMixin):
             self.trim(read1, self.adapter1, adapter_match1, 0),
             self.trim(read2, self.adapter2, adapter_match2, 1))
     
+    def _match_pair(self, read1, read2):
+        """Find the insert and/or adapter matches for a read pair. If the cache
+        is enabled, matches are looked up by the pair of read sequences.
+        
+        Returns:
+            Tuple (is_insert_match, insert_match, adapter_match1,
+            adapter_match2). The adapter matches are always new objects that
+            may be modified by the caller.
+        """
+        if self.cache is None:
+            return self._find_matches(read1, read2)
+        key = (read1.sequence, read2.sequence)
+        result = self.cache.get(key, _NOT_CACHED)
+        if result is _NOT_CACHED:
+            result = self._find_matches(read1, read2)
+            self.cache[key] = result[:2] + tuple(
+                match_to_coords(match) for match in result[2:])
+            return result
+        return result[:2] + (
+            coords_to_match(result[2], read1),
+            coords_to_match(result[3], read2))
+    
+    def _find_matches(self, read1, read2):
+        match = self.aligner.match_insert(read1.sequence, read2.sequence)
+        if match:
+            return (True,) + match
+        return (
+            False, None,
+            self.adapter1.match_to(read1),
+            self.adapter2.match_to(read2))
+    
     def trim(self, read, adapter, match, read_idx):
         """Trim an adapter from a read.
         
@@ -456,6 +506,10 @@ class InsertAdapterCutter(ReadPairModifier, ErrorCorrectorMixin):
         summary = dict(
             records_with_adapters=self.with_adapters,
             adapters=adapters_summary)
+        if self.cache is not None:
+            summary.update(
+                cache_hits=self.cache.hits,
+                cache_misses=self.cache.misses)
         if self.mismatch_action:
             summary.update(ErrorCorrectorMixin.summarize(self))
         return summary
@@ -494,10 +548,10 @@ class OverwriteRead(ReadPairModifier):
             raise ValueError(
                 "OverwriteRead modifier does not work with reads "
                 "lacking base qualities.")
-        qual1 = list(quals2ints(read1.qualities[:self.window_size], self.base))
+        qual1 = quals2ints(read1.qualities[:self.window_size], self.base)
         summ1 = self.summary_fn(qual1)
         
-        qual2 = list(quals2ints(read2.qualities[:self.window_size], self.base))
+        qual2 = quals2ints(read2.qualities[:self.window_size], self.base)
         summ2 = self.summary_fn(qual2)
         
         if (
@@ -820,6 +874,13 @@ class MergeOverlapping(ReadPairModifier, ErrorCorrectorMixin):
         ErrorCorrectorMixin.__init__(self, mismatch_action)
         self.min_overlap = int(min_overlap) if min_overlap > 1 else min_overlap
         self.error_rate = error_rate
+        # Aligners are reused for every pair; only the reference (the read2
+        # reverse-complement) is swapped. The first is for when we've already
+        # determined that there is an insert overlap with a 3' overhang, in
+        # which case we can constrain our alignment.
+        self.insert_aligner = Aligner(
+            '', error_rate, START_WITHIN_SEQ1 | STOP_WITHIN_SEQ2)
+        self.aligner = Aligner('', error_rate, SEMIGLOBAL)
     
     def __call__(self, read1, read2):
         len1 = len(read1.sequence)
@@ -832,17 +893,11 @@ class MergeOverlapping(ReadPairModifier, ErrorCorrectorMixin):
             return (read1, read2)
         
         insert_matched = read1.insert_overlap and read2.insert_overlap
-        
-        if insert_matched:
-            # If we've already determined that there is an insert overlap
-            # with a 3' overhang, we can constrain our alignment
-            aflags = START_WITHIN_SEQ1 | STOP_WITHIN_SEQ2
-        else:
-            aflags = SEMIGLOBAL
+        aligner = self.insert_aligner if insert_matched else self.aligner
         # align read1 to read2 reverse-complement to be compatible with
         # InsertAligner
-        read2_rc = reverse_complement(read2.sequence)
-        aligner = Aligner(read2_rc, self.error_rate, aflags)
+        read2_rc = PackedSequence(read2.sequence).reverse_complement().sequence
+        aligner.reference = read2_rc
         alignment = aligner.locate(read1.sequence)
         
         if alignment:
@@ -856,34 +911,134 @@ class MergeOverlapping(ReadPairModifier, ErrorCorrectorMixin):
                         read1.corrected == 0 and read2.corrected == 0):
                     self.correct_errors(read1, read2, alignment)
                 
-                if r2_start == 0 and r2_stop == len2:
-                    # r2 is fully contained in r1
-                    pass
-                elif r1_start == 0 and r1_stop == len1:
-                    # r1 is fully contained in r2
-                    read1.sequence = read2_rc
-                    read1.qualities = "".join(reversed(read2.qualities))
-                elif r1_start > 0:
-                    read1.sequence += read2_rc[r2_stop:]
-                    if read1.qualities and read2.qualities:
-                        read1.qualities += "".join(
-                            reversed(read2.qualities))[r2_stop:]
-                elif r2_start > 0:
-                    read1.sequence = read2_rc + read1.sequence[r1_stop:]
-                    if read1.qualities and read2.qualities:
-                        read1.qualities = (
-                            "".join(reversed(read2.qualities)) +
-                            read1.qualities[r1_stop:])
-                else:
-                    raise AtroposError(
-                        "Invalid alignment while trying to merge read "
-                        "{}: {}".format(
-                            read1.name, ",".join(str(i) for i in alignment)))
-                
+                self.merge(read1, read2, read2_rc, alignment)
                 read1.merged = True
                 read2 = None
                 
         return (read1, read2)
+    
+    def merge(self, read1, read2, read2_rc, alignment):
+        """Merge read2 into read1. Each merged string is created with a single
+        concatenation of slices.
+        
+        Args:
+            read1, read2: The reads.
+            read2_rc: The reverse-complement of the read2 sequence.
+            alignment: The alignment of read1 (query) to `read2_rc`
+                (reference).
+        """
+        r2_start, r2_stop, r1_start, r1_stop = alignment[:4]
+        has_quals = read1.qualities and read2.qualities
+        if r2_start == 0 and r2_stop == len(read2_rc):
+            # r2 is fully contained in r1
+            pass
+        elif r1_start == 0 and r1_stop == len(read1.sequence):
+            # r1 is fully contained in r2
+            read1.sequence = read2_rc
+            if has_quals:
+                read1.qualities = read2.qualities[::-1]
+        elif r1_start > 0:
+            read1.sequence += read2_rc[r2_stop:]
+            if has_quals:
+                # equivalent to read2.qualities[::-1][r2_stop:]
+                read1.qualities += read2.qualities[-r2_stop-1::-1]
+        elif r2_start > 0:
+            read1.sequence = read2_rc + read1.sequence[r1_stop:]
+            if has_quals:
+                read1.qualities = (
+                    read2.qualities[::-1] + read1.qualities[r1_stop:])
+        else:
+            raise AtroposError(
+                "Invalid alignment while trying to merge read "
+                "{}: {}".format(
+                    read1.name, ",".join(str(i) for i in alignment)))
+
+# Trimmers that can be fused into a TrimChain, mapped to their kind. Only
+# exact types are fused, so that subclasses that override __call__ are applied
+# as-is.
+FUSIBLE_TRIMMERS = {}
+if TrimChain is not None:
+    FUSIBLE_TRIMMERS.update({
+        UnconditionalCutter: UNCONDITIONAL_CUTTER,
+        MinCutter: MIN_CUTTER,
+        RRBSTrimmer: MIN_CUTTER,
+        TruSeqBisulfiteTrimmer: MIN_CUTTER,
+        QualityTrimmer: QUALITY_TRIMMER,
+        NextseqQualityTrimmer: NEXTSEQ_TRIMMER,
+        NEndTrimmer: N_END_TRIMMER
+    })
+
+def fuse_trimmers(trimmers):
+    """Replace runs of consecutive fusible trimmers with TrimChains.
+    
+    Args:
+        trimmers: Sequence of modifiers (or None) applied to the same read.
+    
+    Returns:
+        A list of callables that is equivalent to applying `trimmers` in order.
+    """
+    stages = []
+    run = []
+    def end_run():
+        """Add the current run of fusible trimmers to stages.
+        """
+        if len(run) > 1:
+            stages.append(TrimChain(run))
+        elif run:
+            stages.append(run[0][1])
+        del run[:]
+    for trimmer in trimmers:
+        if trimmer is None:
+            continue
+        kind = FUSIBLE_TRIMMERS.get(type(trimmer))
+        if kind is None:
+            end_run()
+            stages.append(trimmer)
+        else:
+            run.append((kind, trimmer))
+    end_run()
+    return stages
+
+def screen_modifiers(modifiers):
+    """Create a ReadScreen that identifies the reads that a sequence of
+    modifiers leaves unchanged.
+    
+    Args:
+        modifiers: Sequence of modifiers (or None) applied to the same read.
+    
+    Returns:
+        A ReadScreen, or None if any of the modifiers cannot be screened.
+    """
+    steps = []
+    for modifier in modifiers:
+        if modifier is None:
+            continue
+        if type(modifier) is AdapterCutter:
+            # Cache statistics would differ if reads skipped the cutter
+            if modifier.cache is not None or not all(
+                    _is_screenable_adapter(adapter)
+                    for adapter in modifier.adapters):
+                return None
+            steps.append((ADAPTER_CUTTER, modifier))
+            continue
+        kind = FUSIBLE_TRIMMERS.get(type(modifier))
+        if kind in (UNCONDITIONAL_CUTTER, MIN_CUTTER):
+            # Only a no-op for reads without adapter matches
+            if not (
+                    (kind == MIN_CUTTER and modifier.only_trimmed) or
+                    (modifier.front_length == 0 and
+                     modifier.back_length == 0)):
+                return None
+        elif kind is not None:
+            steps.append((kind, modifier))
+        else:
+            return None
+    return ReadScreen(steps)
+
+def _is_screenable_adapter(adapter):
+    return (
+        type(adapter) is Adapter and adapter.where == BACK and
+        set(adapter.sequence) <= set('ACGT') and adapter.max_error_rate < 1)
 
 class Modifiers(object):
     """Base for classes that manage multiple modifiers.
@@ -891,6 +1046,8 @@ class Modifiers(object):
     def __init__(self):
         self.modifiers = []
         self.modifier_indexes = {}
+        self._stages = None
+        self._screen = None
     
     def add_modifier(self, mod_class, read=1|2, **kwargs):
         """Add a modifier of the specified type for one or both reads.
@@ -914,6 +1071,7 @@ class Modifiers(object):
         raise NotImplementedError()
     
     def _add_modifiers(self, mod_class, mods):
+        self._stages = self._screen = None
         idx = len(self.modifiers)
         self.modifiers.append(mods)
         if mod_class in self.modifier_indexes:
@@ -972,6 +1130,29 @@ class Modifiers(object):
             adapters[1] = [mod.adapter2]
         return adapters
     
+    def compile(self):
+        """Compile the registered modifiers into a sequence of stages in which
+        consecutive built-in trimmers are fused into a single TrimChain (if
+        the compiled extension is available). `modify` uses the stages until
+        another modifier is added. Summaries are unaffected, since the fused
+        trimmers keep their statistics.
+        
+        If all of the modifiers can be screened (see `screen_modifiers`),
+        `modify` also returns the reads that the modifiers would leave
+        unchanged without applying the modifiers to them.
+        """
+        raise NotImplementedError()
+    
+    def profile(self, profiler):
+        """Time each of the registered modifiers. This replaces any compiled
+        stages, since fused trimmers cannot be timed individually, and
+        disables read screening, so that every read is timed.
+        
+        Args:
+            profiler: A :class:`atropos.util.Profiler`.
+        """
+        raise NotImplementedError()
+    
     def modify(self, read1, read2=None):
         """Apply registered modifiers to a read/pair.
         
@@ -1000,9 +1181,27 @@ class SingleEndModifiers(Modifiers):
         if read1_args is not None:
             return self.add_modifier(mod_class, **read1_args)
     
+    def compile(self):
+        if TrimChain is None:
+            return
+        self._stages = fuse_trimmers(mods[0] for mods in self.modifiers)
+        self._screen = screen_modifiers(mods[0] for mods in self.modifiers)
+    
+    def profile(self, profiler):
+        self._stages = [
+            profiler.wrap(mods[0], 'modifiers', mods[0].name)
+            for mods in self.modifiers]
+        self._screen = None
+    
     def modify(self, read1, read2=None):
-        for mods in self.modifiers:
-            read1 = mods[0](read1)
+        if self._stages is not None:
+            if self._screen is not None and self._screen(read1):
+                return (read1,)
+            for stage in self._stages:
+                read1 = stage(read1)
+        else:
+            for mods in self.modifiers:
+                read1 = mods[0](read1)
         return (read1,)
     
     def summarize(self):
@@ -1048,7 +1247,66 @@ class PairedEndModifiers(Modifiers):
         if any(mods):
             return self._add_modifiers(mod_class, mods)
     
+    def compile(self):
+        if TrimChain is None:
+            return
+        stages = []
+        run = []
+        def end_run():
+            """Fuse the current run of per-read modifiers.
+            """
+            if run:
+                stages.append([
+                    fuse_trimmers(mods[0] for mods in run),
+                    fuse_trimmers(mods[1] for mods in run)])
+                del run[:]
+        for mods in self.modifiers:
+            if isinstance(mods, ReadPairModifier):
+                end_run()
+                stages.append(mods)
+            else:
+                run.append(mods)
+        end_run()
+        self._stages = stages
+        self._screen = None
+        if not any(
+                isinstance(mods, ReadPairModifier) for mods in self.modifiers):
+            screens = tuple(
+                screen_modifiers(mods[i] for mods in self.modifiers)
+                for i in (0, 1))
+            if None not in screens:
+                self._screen = screens
+    
+    def profile(self, profiler):
+        stages = []
+        for mods in self.modifiers:
+            if isinstance(mods, ReadPairModifier):
+                stages.append(profiler.wrap(mods, 'modifiers', mods.name))
+            else:
+                stages.append([
+                    [profiler.wrap(mod, 'modifiers', mod.name)]
+                    if mod is not None else []
+                    for mod in mods])
+        self._stages = stages
+        self._screen = None
+    
     def modify(self, read1, read2=None):
+        if self._stages is not None:
+            if (
+                    self._screen is not None and self._screen[0](read1) and
+                    self._screen[1](read2)):
+                return (read1, read2)
+            # Stages are either read-pair modifiers or lists of per-read
+            # modifiers for [read1, read2]
+            for stage in self._stages:
+                if isinstance(stage, list):
+                    for mod in stage[0]:
+                        read1 = mod(read1)
+                    for mod in stage[1]:
+                        read2 = mod(read2)
+                else:
+                    read1, read2 = stage(read1, read2)
+            return (read1, read2)
         for mods in self.modifiers:
             if isinstance(mods, ReadPairModifier):
                 read1, read2 = mods(read1, read2)
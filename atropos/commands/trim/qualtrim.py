@@ -7,7 +7,7 @@ try:
 
 except:
     import logging
-    from atropos.util import qual2int
+    from atropos.util import quals2ints
     
     logging.getLogger().debug("Import failed for cythonized qualtrim functions")
     
@@ -25,13 +25,13 @@ except:
         """
         start = 0
         stop = max_i = len(qualities)
+        qualities = quals2ints(qualities, base)
         
         # find trim position for 5' end
         score = 0
         max_qual = 0
         for idx in range(max_i):
-            qual = qual2int(qualities[idx], base)
-            score += cutoff_front - (qual - base)
+            score += cutoff_front - qualities[idx]
             if score < 0:
                 break
             if score > max_qual:
@@ -42,8 +42,7 @@ except:
         max_qual = 0
         score = 0
         for idx in reversed(range(max_i)):
-            qual = qual2int(qualities[idx], base)
-            score += cutoff_back - (qual - base)
+            score += cutoff_back - qualities[idx]
             if score < 0:
                 break
             if score > max_qual:
@@ -66,12 +65,12 @@ except:
         'G' bases as being equal to cutoff - 1.
         """
         bases = sequence.sequence
-        qualities = sequence.qualities
+        qualities = quals2ints(sequence.qualities, base)
         score = 0
         max_qual = 0
         max_i = len(qualities)
         for idx in reversed(range(max_i)):
-            qual = qual2int(qualities[idx], base)
+            qual = qualities[idx]
             if bases[idx] == 'G':
                 qual = cutoff - 1
             score += cutoff - qual
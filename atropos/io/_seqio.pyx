@@ -1,10 +1,23 @@
 # kate: syntax Python;
 # cython: profile=False, emit_code_comments=False
+cimport cython
+from cpython.slice cimport PySlice_Check, PySlice_GetIndicesEx
+from libc.string cimport memchr
 import copy
 from atropos.io import xopen
 from atropos.io.seqio import FormatError, SequenceReader
 from atropos.util import reverse_complement, truncate_string
 
+cdef extern from "Python.h":
+    int PyUnicode_KIND(object)
+    void* PyUnicode_DATA(object)
+    int PyUnicode_1BYTE_KIND
+
+# Bits of Sequence._flags
+DEF INSERT_OVERLAP = 1
+DEF MERGED = 2
+
+@cython.freelist(4096)
 cdef class Sequence(object):
     """
     A record in a FASTQ file. Also used for FASTA (then the qualities attribute
@@ -13,34 +26,63 @@ cdef class Sequence(object):
 
     If an adapter has been matched to the sequence, the 'match' attribute is
     set to the corresponding Match instance.
+
+    Slicing a Sequence does not copy the sequence and qualities strings.
+    Instead, the new Sequence is a view that shares the strings of the
+    original and tracks start/end offsets into them. The sliced strings are
+    only created (and then cached) when the sequence or qualities attributes
+    are accessed, e.g. at formatting time. Assigning to either attribute
+    detaches the Sequence from the strings it was viewing.
+    
+    Sequences created by a FastqReader with keep_raw=True also reference the
+    text of the record they were read from, which is returned by the raw
+    attribute as long as the record is unchanged, i.e. until the name, name2,
+    sequence or qualities are assigned, or a subsequence is taken.
+    
+    To keep the per-read overhead small, the clipped counts and the flags are
+    stored as C values, and match/match_info (which are only set for reads
+    with an adapter match) share a single field. The clipped attribute
+    returns a tuple, so it must be assigned (rather than modified in place)
+    to change the counts. Deallocated Sequences are kept on a
+    freelist, so that the objects are recycled across batches.
     """
     cdef:
-        public str name
-        public str sequence
-        public str qualities
-        public str name2
+        str _name
+        str _sequence  # the strings this Sequence is a view of
+        str _qualities
+        int _start  # offsets of the view within _sequence/_qualities
+        int _end
+        str _sequence_view  # cached views; None until accessed
+        str _qualities_view
+        str _name2
         public int original_length
-        public object match
-        public object match_info
-        public object clipped
-        public bint insert_overlap
-        public bint merged
+        tuple _match  # (match, match_info), or None if both are None
+        int _clipped[4]
         public int corrected
+        unsigned char _flags
+        str _raw  # the text that the record was read from, or None
+        int _raw_start  # offset of the record in _raw
     
     def __init__(self, str name, str sequence, str qualities=None, str name2='',
                  original_length=None, match=None, match_info=None, clipped=None,
                  insert_overlap=False, merged=False, corrected=0):
         """Set qualities to None if there are no quality values"""
         self.name = name
-        self.sequence = sequence
-        self.qualities = qualities
+        self._sequence = self._sequence_view = sequence
+        self._qualities = self._qualities_view = qualities
+        self._start = 0
+        self._end = len(sequence)
         self.name2 = name2
         self.original_length = original_length or len(sequence)
-        self.match = match
-        self.match_info = match_info
-        self.clipped = clipped or [0,0,0,0]
-        self.insert_overlap = insert_overlap
-        self.merged = merged
+        if match is not None or match_info is not None:
+            self._match = (match, match_info)
+        if clipped:
+            self.clipped = clipped
+        else:
+            self._clipped[:] = [0, 0, 0, 0]
+        self._flags = (
+            (INSERT_OVERLAP if insert_overlap else 0) |
+            (MERGED if merged else 0))
         self.corrected = corrected
         if qualities is not None and len(qualities) != len(sequence):
             rname = truncate_string(name)
@@ -49,7 +91,119 @@ cdef class Sequence(object):
                 "length  of read ({2}) do not match".format(
                     rname, len(qualities), len(sequence)))
     
+    property name:
+        def __get__(self):
+            return self._name
+        
+        def __set__(self, str value):
+            self._name = value
+            self._raw = None
+    
+    property name2:
+        def __get__(self):
+            return self._name2
+        
+        def __set__(self, str value):
+            self._name2 = value
+            self._raw = None
+    
+    property sequence:
+        def __get__(self):
+            if self._sequence_view is None:
+                self._sequence_view = self._sequence[self._start:self._end]
+            return self._sequence_view
+        
+        def __set__(self, str value):
+            self._detach()
+            self._sequence = self._sequence_view = value
+            self._end = len(value)
+    
+    property qualities:
+        def __get__(self):
+            if self._qualities_view is None and self._qualities is not None:
+                self._qualities_view = self._qualities[self._start:self._end]
+            return self._qualities_view
+        
+        def __set__(self, str value):
+            self._detach()
+            self._qualities = self._qualities_view = value
+    
+    property raw:
+        """The text of the FASTQ record that this Sequence was read from, or
+        None if the Sequence was not created by a reader that keeps the record
+        text, or has been changed since.
+        """
+        def __get__(self):
+            if self._raw is None:
+                return None
+            # '@name\nsequence\n+name2\nqualities\n'
+            return self._raw[
+                self._raw_start:self._raw_start + len(self._name) +
+                len(self._name2) + 2 * len(self._sequence) + 6]
+    
+    property match:
+        def __get__(self):
+            return self._match[0] if self._match is not None else None
+        
+        def __set__(self, value):
+            self._set_match(value, self.match_info)
+    
+    property match_info:
+        def __get__(self):
+            return self._match[1] if self._match is not None else None
+        
+        def __set__(self, value):
+            self._set_match(self.match, value)
+    
+    cdef _set_match(self, match, match_info):
+        if match is None and match_info is None:
+            self._match = None
+        else:
+            self._match = (match, match_info)
+    
+    property clipped:
+        def __get__(self):
+            return (
+                self._clipped[0], self._clipped[1], self._clipped[2],
+                self._clipped[3])
+        
+        def __set__(self, value):
+            self._clipped[0], self._clipped[1], self._clipped[2], \
+                self._clipped[3] = value
+    
+    property insert_overlap:
+        def __get__(self):
+            return (self._flags & INSERT_OVERLAP) != 0
+        
+        def __set__(self, value):
+            if value:
+                self._flags |= INSERT_OVERLAP
+            else:
+                self._flags &= ~INSERT_OVERLAP
+    
+    property merged:
+        def __get__(self):
+            return (self._flags & MERGED) != 0
+        
+        def __set__(self, value):
+            if value:
+                self._flags |= MERGED
+            else:
+                self._flags &= ~MERGED
+    
+    cdef _detach(self):
+        """
+        Materialize the views, and make them the strings that this Sequence
+        is a view of.
+        """
+        self._sequence = self.sequence
+        self._qualities = self.qualities
+        self._start = 0
+        self._end = len(self._sequence)
+        self._raw = None
+    
     def subseq(self, begin=0, end=None):
+        cdef Sequence new_read
         if end is None:
             new_read = self[begin:]
         else:
@@ -57,12 +211,13 @@ cdef class Sequence(object):
         end_bases = len(self) - end
         offset = 2 if self.match else 0
         if begin:
-            new_read.clipped[offset] += begin
+            new_read._clipped[offset] += begin
         if end_bases:
-            new_read.clipped[offset+1] += end_bases
+            new_read._clipped[offset+1] += end_bases
         return (begin, end_bases, new_read)
     
     def clip(self, front=0, back=0):
+        cdef Sequence new_read
         if back < 0:
             new_read = self[front:back]
             back *= -1
@@ -70,9 +225,9 @@ cdef class Sequence(object):
             new_read = self[front:]
         offset = 2 if self.match else 0
         if front:
-            new_read.clipped[offset] += front
+            new_read._clipped[offset] += front
         if back:
-            new_read.clipped[offset+1] += back
+            new_read._clipped[offset+1] += back
         return (front, back, new_read)
     
     def reverse_complement(self):
@@ -96,7 +251,7 @@ cdef class Sequence(object):
             self.original_length,
             None,
             match_info,
-            list(self.clipped),
+            self.clipped,
             self.insert_overlap,
             self.merged,
             self.corrected
@@ -111,6 +266,36 @@ cdef class Sequence(object):
     
     def __getitem__(self, key):
         """slicing"""
+        cdef Py_ssize_t start, stop, step, slicelength
+        cdef Sequence new_read
+        if (
+                PySlice_Check(key) and (
+                    self._qualities is None or
+                    len(self._qualities) == len(self._sequence))):
+            PySlice_GetIndicesEx(
+                key, self._end - self._start, &start, &stop, &step,
+                &slicelength)
+            if step == 1:
+                # Create a view without copying the strings.
+                if type(self) is Sequence:
+                    new_read = Sequence.__new__(Sequence)
+                else:
+                    new_read = type(self).__new__(type(self))
+                new_read._name = self._name
+                new_read._sequence = self._sequence
+                new_read._qualities = self._qualities
+                new_read._start = self._start + start
+                new_read._end = self._start + start + slicelength
+                new_read._name2 = self._name2
+                new_read.original_length = self.original_length
+                new_read._match = self._match
+                new_read._clipped = self._clipped
+                new_read._flags = self._flags
+                new_read.corrected = self.corrected
+                if slicelength == self._end - self._start:
+                    new_read._raw = self._raw
+                    new_read._raw_start = self._raw_start
+                return new_read
         return self.__class__(
             self.name,
             self.sequence[key],
@@ -119,7 +304,7 @@ cdef class Sequence(object):
             self.original_length,
             self.match,
             self.match_info,
-            list(self.clipped),
+            self.clipped,
             self.insert_overlap,
             self.merged,
             self.corrected
@@ -133,7 +318,7 @@ cdef class Sequence(object):
             truncate_string(self.name), truncate_string(self.sequence), qstr)
 
     def __len__(self):
-        return len(self.sequence)
+        return self._end - self._start
 
     def __richcmp__(self, other, int op):
         if 2 <= op <= 3:
@@ -148,27 +333,129 @@ cdef class Sequence(object):
             raise NotImplementedError()
 
     def __reduce__(self):
+        if self._raw is not None:
+            # The record text is all that is needed to recreate the Sequence
+            return (_from_raw, (self.raw,))
         return (Sequence, (self.name, self.sequence, self.qualities, self.name2))
 
+def _from_raw(str record):
+    """Create a Sequence from the text of a single FASTQ record, as returned
+    by Sequence.raw.
+    """
+    cdef Py_ssize_t end1 = record.index('\n')
+    cdef Py_ssize_t end2 = record.index('\n', end1 + 1)
+    cdef Py_ssize_t end3 = record.index('\n', end2 + 1)
+    cdef Sequence read = Sequence(
+        record[1:end1], record[end1 + 1:end2], record[end3 + 1:-1],
+        record[end2 + 2:end3])
+    read._raw = record
+    read._raw_start = 0
+    return read
+
 class FastqReader(SequenceReader):
     """Reader for FASTQ files. Does not support multi-line FASTQ files.
     """
     file_format = "FASTQ"
     delivers_qualities = True
+    chunk_size = 65536
     
-    def __init__(self, filename, quality_base=33, sequence_class=Sequence):
+    def __init__(
+            self, filename, quality_base=33, sequence_class=Sequence,
+            keep_raw=False):
         """
         file is a filename or a file-like object.
         If file is a filename, then .gz files are supported.
+        If keep_raw is True, the file is read in chunks, and each Sequence
+        references the chunk that contains its record (see Sequence.raw).
+        This requires a file object with a read method, and is ignored for
+        other sequence classes.
         """
         super().__init__(filename, quality_base=quality_base)
         self.sequence_class = sequence_class
+        self.keep_raw = keep_raw
     
     def __iter__(self):
+        """
+        Yield Sequence objects
+        """
+        if (
+                self.keep_raw and self.sequence_class is Sequence and
+                hasattr(self._file, 'read')):
+            return self._iter_chunks()
+        return self._iter_lines()
+    
+    def _iter_chunks(self):
+        """
+        Yield Sequence objects that reference the text of their records. Records
+        with Windows line breaks, and a final record without a line break, do
+        not reference their text, since it differs from the formatted record.
+        """
+        cdef str buf = ''
+        cdef str chunk, name, name2, sequence, qualities
+        cdef Py_ssize_t pos = 0
+        cdef Py_ssize_t end1, end2, end3, end4
+        cdef int strip = 0
+        cdef int record = 0
+        cdef bint keep = True
+        cdef Sequence read
+        read_chunk = self._file.read
+        chunk_size = self.chunk_size
+        
+        while True:
+            end1 = _find_newline(buf, pos)
+            end2 = _find_newline(buf, end1 + 1) if end1 >= 0 else -1
+            end3 = _find_newline(buf, end2 + 1) if end2 >= 0 else -1
+            end4 = _find_newline(buf, end3 + 1) if end3 >= 0 else -1
+            if end4 < 0:
+                chunk = read_chunk(chunk_size)
+                if chunk:
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                    continue
+                if pos == len(buf):
+                    break
+                if end3 >= 0 and end3 + 1 < len(buf):
+                    # The last line has no line break
+                    buf = buf[pos:] + '\n'
+                    pos = 0
+                    keep = False
+                    continue
+                # The file ends within a record. As in _iter_lines, an
+                # invalid line is reported rather than the missing lines.
+                if end1 < 0:
+                    end1 = len(buf)
+            
+            if buf[pos] != '@':
+                raise FormatError(
+                    "Line {0} in FASTQ file is expected to start with '@', "
+                    "but found {1!r}".format(
+                        4 * record + 1, buf[pos:min(end1 + 1, pos + 10)]))
+            if record == 0 and end1 > 0 and buf[end1 - 1] == '\r':
+                strip = 1
+                keep = False
+            name = buf[pos + 1:end1 - strip]
+            if end2 >= 0 and end2 + 1 < len(buf):
+                name2 = _parse_name2(
+                    buf, end2 + 1, end3 - strip if end3 >= 0 else len(buf),
+                    name, 4 * record + 3)
+            if end4 < 0:
+                raise FormatError("FASTQ file ended prematurely")
+            sequence = buf[end1 + 1:end2 - strip]
+            qualities = buf[end3 + 1:end4 - strip]
+            read = Sequence(name, sequence, qualities, name2)
+            if keep:
+                read._raw = buf
+                read._raw_start = pos
+            yield read
+            pos = end4 + 1
+            record += 1
+    
+    def _iter_lines(self):
         """
         Yield Sequence objects
         """
         cdef int i = 0
+        cdef int record = 0
         cdef int strip
         cdef str line, name, qualities, sequence, name2
         sequence_class = self.sequence_class
@@ -187,7 +474,7 @@ class FastqReader(SequenceReader):
                 if not (line and line[0] == '@'):
                     raise FormatError("Line {0} in FASTQ file is expected to "
                                       "start with '@', but found {1!r}".format(
-                                      i+1, line[:10]))
+                                      4*record+i+1, line[:10]))
                 name = line[1:strip]
             elif i == 1:
                 sequence = line[:strip]
@@ -199,14 +486,14 @@ class FastqReader(SequenceReader):
                     if not (line and line[0] == '+'):
                         raise FormatError("Line {0} in FASTQ file is expected "
                                           "to start with '+', but found {1!r}".format(
-                                          i+1, line[:10]))
+                                          4*record+i+1, line[:10]))
                     if len(line) > 1:
                         if not line[1:] == name:
                             raise FormatError(
                                 "At line {0}: Sequence descriptions in the FASTQ file don't match "
                                 "({1!r} != {2!r}).\n"
                                 "The second sequence description must be either empty "
-                                "or equal to the first description.".format(i+1,
+                                "or equal to the first description.".format(4*record+i+1,
                                     name, line[1:]))
                         name2 = name
                     else:
@@ -217,6 +504,42 @@ class FastqReader(SequenceReader):
                 else:
                     qualities = line.rstrip('\r\n')
                 yield sequence_class(name, sequence, qualities, name2=name2)
+                record += 1
             i = (i + 1) % 4
         if i != 0:
             raise FormatError("FASTQ file ended prematurely")
+
+cdef inline str _parse_name2(
+        str buf, Py_ssize_t start, Py_ssize_t end, str name, int line):
+    """Returns the second sequence description on the line of buf from start
+    to end (excluding the line break), which must start with '+' and be
+    empty or equal to name."""
+    cdef str name2
+    if buf[start] != '+':
+        raise FormatError(
+            "Line {0} in FASTQ file is expected to start with '+', "
+            "but found {1!r}".format(line, buf[start:min(end, start + 10)]))
+    if end <= start + 1:
+        return ''
+    name2 = buf[start + 1:end]
+    if name2 != name:
+        raise FormatError(
+            "At line {0}: Sequence descriptions in the FASTQ "
+            "file don't match ({1!r} != {2!r}).\n"
+            "The second sequence description must be either "
+            "empty or equal to the first description.".format(
+                line, name, name2))
+    return name2
+
+cdef inline Py_ssize_t _find_newline(str buf, Py_ssize_t start):
+    """Returns the index of the first line break in buf at or after start,
+    or -1."""
+    cdef const char* data
+    cdef const char* found
+    if PyUnicode_KIND(buf) != PyUnicode_1BYTE_KIND:
+        return buf.find('\n', start)
+    if start >= len(buf):
+        return -1
+    data = <const char*> PyUnicode_DATA(buf)
+    found = <const char*> memchr(data + start, b'\n', len(buf) - start)
+    return found - data if found != NULL else -1
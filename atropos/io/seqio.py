@@ -383,19 +383,20 @@ class PairedSequenceReader(SequenceReaderBase):
         file1, file2: The pair of files.
         colorspace: Whether the sequences are in colorspace.
         file_format: A file_format instance.
+        keep_raw: Whether FASTQ reads should keep the text of their records.
     """
     input_read = PAIRED
     interleaved = False
     
     def __init__(
             self, file1, file2, quality_base=33, colorspace=False,
-            file_format=None):
+            file_format=None, keep_raw=False):
         self.reader1 = open_reader(
             file1, colorspace=colorspace, quality_base=quality_base,
-            file_format=file_format)
+            file_format=file_format, keep_raw=keep_raw)
         self.reader2 = open_reader(
             file2, colorspace=colorspace, quality_base=quality_base,
-            file_format=file_format)
+            file_format=file_format, keep_raw=keep_raw)
     
     @property
     def input_names(self):
@@ -457,15 +458,17 @@ class InterleavedSequenceReader(SequenceReaderBase):
         path: The interleaved FASTQ file.
         colorspace: Whether the sequences are in colorspace.
         file_format: A file_format instance.
+        keep_raw: Whether FASTQ reads should keep the text of their records.
     """
     input_read = PAIRED
     interleaved = True
     
     def __init__(
-            self, path, quality_base=33, colorspace=False, file_format=None):
+            self, path, quality_base=33, colorspace=False, file_format=None,
+            keep_raw=False):
         self.reader = open_reader(
             path, quality_base=quality_base, colorspace=colorspace,
-            file_format=file_format)
+            file_format=file_format, keep_raw=keep_raw)
     
     def __getattr__(self, name):
         return getattr(self.reader, name)
@@ -662,6 +665,10 @@ class FastqFormat(SequenceFileFormat):
     """FASTQ SequenceFileFormat.
     """
     def format(self, read):
+        # Unchanged reads are written as they were read
+        raw = read.raw
+        if raw is not None:
+            return raw
         return self.format_entry(
             read.name, read.sequence, read.qualities, read.name2)
     
@@ -779,7 +786,7 @@ def paired_to_read2(reader):
 def open_reader(
         file1=None, file2=None, qualfile=None, quality_base=None, 
         colorspace=False, file_format=None, interleaved=False, 
-        input_read=None):
+        input_read=None, keep_raw=False):
     """Open sequence files in FASTA or FASTQ format for reading. This is
     a factory that returns an instance of one of the ...Reader
     classes also defined in this module.
@@ -803,6 +810,9 @@ def open_reader(
         input_read: When file1 is a paired-end interleaved or SAM/BAM
             file, this specifies whether to only use the first or second read
             (1 or 2) or to use both reads (None).
+        keep_raw: Whether reads from (non-colorspace) FASTQ files should keep
+            the text of their records, so that unchanged reads can be written
+            without formatting them (see Sequence.raw).
     """
     if interleaved and (file2 is not None or qualfile is not None):
         raise ValueError(
@@ -813,7 +823,7 @@ def open_reader(
     if file2 is not None:
         return PairedSequenceReader(
             file1, file2, quality_base=quality_base, colorspace=colorspace,
-            file_format=file_format)
+            file_format=file_format, keep_raw=keep_raw)
     
     if qualfile is not None:
         if colorspace:
@@ -860,7 +870,7 @@ def open_reader(
         elif interleaved:
             reader = InterleavedSequenceReader(
                 file1, quality_base=quality_base, colorspace=colorspace,
-                file_format=file_format)
+                file_format=file_format, keep_raw=keep_raw)
             if input_read == READ1:
                 return paired_to_read1(reader)
             elif input_read == READ2:
@@ -871,8 +881,10 @@ def open_reader(
             fasta_handler = ColorspaceFastaReader if colorspace else FastaReader
             return fasta_handler(file1)
         elif file_format == 'fastq':
-            fastq_handler = ColorspaceFastqReader if colorspace else FastqReader
-            return fastq_handler(file1, quality_base=quality_base)
+            if colorspace:
+                return ColorspaceFastqReader(file1, quality_base=quality_base)
+            return FastqReader(
+                file1, quality_base=quality_base, keep_raw=keep_raw)
         elif file_format == 'sra-fastq' and colorspace:
             return SRAColorspaceFastqReader(file1, quality_base=quality_base)
     
@@ -1,12 +1,15 @@
 """Widely useful utility methods.
 """
 from collections import OrderedDict, Iterable
+from contextlib import contextmanager
 from datetime import datetime
 import errno
 import functools
+from itertools import islice
 import logging
 import math
 from numbers import Number
+import random
 import time
 from atropos import AtroposError
 
@@ -49,16 +52,32 @@ LOG2 = math.log(2)
 
 class RandomMatchProbability(object):
     """Class for computing random match probability for DNA sequences based on
-    binomial expectation. Maintains a cache of factorials to speed computation.
+    binomial expectation.
+    
+    Probabilities are precomputed in log space for every (matches, size)
+    combination up to `max_size`, so each lookup is O(1). Tables are stored in
+    flat, triangular layout, where the value for (matches, size) is at index
+    `size * (size + 1) / 2 + matches`. The log-space tables are contiguous
+    arrays of doubles (a numpy array if numpy is available, otherwise an
+    :class:`array.array`), so they can be passed to Cython code as a
+    `double[::1]` memoryview (see :func:`atropos.align._align.log_rmp_lookup`).
+    Tables that are built (e.g. using :method:`precompute`) before worker
+    processes are started are shared read-only with the workers.
+    
+    Also maintains a cache of factorials.
     
     Args:
-        init_size: Initial cache size.
+        init_size: Initial factorial cache size.
+        max_size: Initial maximum sequence size for the probability tables.
+            Tables are extended on demand.
     """
-    def __init__(self, init_size=150):
-        self.cache = {}
+    def __init__(self, init_size=150, max_size=256):
         self.factorials = [1] * init_size
         self.max_n = 1
         self.cur_array_size = init_size
+        self.max_size = max_size
+        self.log_tables = {}
+        self.tables = {}
     
     def __call__(self, matches, size, match_prob=0.25, mismatch_prob=0.75):
         """Computes the random-match probability for a given sequence size and
@@ -71,33 +90,53 @@ class RandomMatchProbability(object):
         Returns:
             The probability.
         """
-        # First see if we have the result in the cache
-        key = (matches, size, match_prob)
-        prob = self.cache.get(key, None)
-        if prob:
-            return prob
-        
-        # When there are no mismatches, the probability is
-        # just that of observing a specific sequence of the
-        # given length by chance.
-        if matches == size:
-            prob = match_prob ** matches
+        try:
+            return self.tables[(match_prob, mismatch_prob)][
+                ((size * (size + 1)) >> 1) + matches]
+        except (KeyError, IndexError):
+            # The table either hasn't been built yet or needs to be extended
+            self.log_table(match_prob, mismatch_prob, size)
+            return self.tables[(match_prob, mismatch_prob)][
+                ((size * (size + 1)) >> 1) + matches]
+    
+    def log_probability(
+            self, matches, size, match_prob=0.25, mismatch_prob=0.75):
+        """Returns the natural log of the random-match probability.
+        """
+        return self.log_table(match_prob, mismatch_prob, size)[
+            ((size * (size + 1)) >> 1) + matches]
+    
+    def log_table(self, match_prob=0.25, mismatch_prob=0.75, min_size=None):
+        """Returns the log-space probability table for the given base
+        probabilities.
         
-        else:
-            nfac = self.factorial(size)
-            prob = 0.0
-            for i in range(matches, size+1):
-                j = size - i
-                prob += (
-                    (mismatch_prob ** j) *
-                    (match_prob ** i) *
-                    nfac /
-                    self.factorial(i) /
-                    self.factorial(j)
-                )
+        Args:
+            match_prob, mismatch_prob: Base probabilities.
+            min_size: Minimum sequence size that must be covered by the table.
         
-        self.cache[key] = prob
-        return prob
+        Returns:
+            A flat array of log probabilities.
+        """
+        if min_size and min_size > self.max_size:
+            self._extend(min_size)
+        key = (match_prob, mismatch_prob)
+        if key not in self.log_tables:
+            self.precompute(match_prob, mismatch_prob)
+        return self.log_tables[key]
+    
+    def precompute(self, match_prob=0.25, mismatch_prob=0.75):
+        """Build the probability tables for the given base probabilities.
+        """
+        log_table = build_log_rmp_table(
+            self.max_size, match_prob, mismatch_prob)
+        key = (match_prob, mismatch_prob)
+        self.log_tables[key] = log_table
+        self.tables[key] = [math.exp(logp) for logp in log_table]
+    
+    def _extend(self, size):
+        self.max_size = max(size, 2 * self.max_size)
+        for match_prob, mismatch_prob in tuple(self.log_tables.keys()):
+            self.precompute(match_prob, mismatch_prob)
     
     def factorial(self, num):
         """Returns `num`!.
@@ -118,6 +157,80 @@ class RandomMatchProbability(object):
             next_i += 1
         self.max_n = idx
 
+NEG_INF = float('-inf')
+
+def _log(value):
+    return math.log(value) if value > 0 else NEG_INF
+
+def build_log_rmp_table(max_size, match_prob=0.25, mismatch_prob=0.75):
+    """Build a table of log random-match probabilities, i.e. the log of the
+    binomial tail probability of observing at least `matches` matching bases in
+    a sequence of length `size`, for all 0 <= matches <= size <= max_size.
+    
+    Args:
+        max_size: Maximum sequence size.
+        match_prob: Probability of two random bases matching.
+        mismatch_prob: Probability of two random bases not matcing.
+    
+    Returns:
+        A flat array of length `(max_size + 1) * (max_size + 2) / 2`, in which
+        the value for (matches, size) is at `size * (size + 1) / 2 + matches`.
+        This is a numpy array if numpy is available, otherwise an
+        :class:`array.array`.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return _build_log_rmp_table_python(max_size, match_prob, mismatch_prob)
+    
+    sizes = np.arange(max_size + 1, dtype=np.float64)
+    log_factorials = np.zeros(max_size + 1)
+    np.cumsum(np.log(sizes[1:]), out=log_factorials[1:])
+    log_match, log_mismatch = _log(match_prob), _log(mismatch_prob)
+    table = np.empty(((max_size + 1) * (max_size + 2)) >> 1)
+    offset = 0
+    with np.errstate(invalid='ignore'):
+        # When a probability is zero, 0 * log(0) must be 0 rather than nan
+        match_terms = np.where(sizes > 0, sizes * log_match, 0.0)
+        mismatch_terms = np.where(sizes > 0, sizes * log_mismatch, 0.0)
+    for size in range(max_size + 1):
+        terms = (
+            log_factorials[size] - log_factorials[:size + 1] -
+            log_factorials[size::-1] + match_terms[:size + 1] +
+            mismatch_terms[size::-1])
+        table[offset:offset + size + 1] = np.logaddexp.accumulate(
+            terms[::-1])[::-1]
+        offset += size + 1
+    # Rounding error can result in probabilities slightly greater than 1
+    np.minimum(table, 0.0, out=table)
+    return table
+
+def _build_log_rmp_table_python(max_size, match_prob, mismatch_prob):
+    from array import array
+    log_factorials = [0.0] * (max_size + 1)
+    for num in range(2, max_size + 1):
+        log_factorials[num] = log_factorials[num - 1] + math.log(num)
+    log_match, log_mismatch = _log(match_prob), _log(mismatch_prob)
+    table = array('d')
+    for size in range(max_size + 1):
+        tail = [0.0] * (size + 1)
+        cumulative = NEG_INF
+        for matches in range(size, -1, -1):
+            mismatches = size - matches
+            term = (
+                log_factorials[size] - log_factorials[matches] -
+                log_factorials[mismatches] +
+                (matches * log_match if matches else 0) +
+                (mismatches * log_mismatch if mismatches else 0))
+            if cumulative == NEG_INF:
+                cumulative = term
+            elif term != NEG_INF:
+                high, low = max(cumulative, term), min(cumulative, term)
+                cumulative = high + math.log1p(math.exp(low - high))
+            tail[matches] = min(cumulative, 0.0)
+        table.extend(tail)
+    return table
+
 class Mergeable(object):
     """Base class for objects that can merge themselves with another.
     """
@@ -228,6 +341,56 @@ class Timing(Summarizable):
         summary.update(self.cur_time - self.start_time)
         return summary
 
+try:
+    from time import perf_counter_ns
+except ImportError: # Python < 3.7
+    def perf_counter_ns():
+        """Returns the value of :func:`time.perf_counter` in nanoseconds.
+        """
+        return int(time.perf_counter() * 1E9)
+
+class Profiler(Summarizable):
+    """Counts the calls to, and the time spent in, the functions it wraps.
+    Functions are grouped into sections; functions wrapped with the same
+    section and name share a timer.
+    """
+    def __init__(self):
+        self.timers = OrderedDict()
+    
+    def wrap(self, func, section, name):
+        """Returns a function that calls `func` and records the call and its
+        duration.
+        
+        Args:
+            func: The function to wrap.
+            section: The section to which the timer belongs.
+            name: The timer name.
+        """
+        key = (section, name)
+        if key not in self.timers:
+            self.timers[key] = [0, 0]
+        timer = self.timers[key]
+        def timed(*args, **kwargs):
+            """Calls the wrapped function and updates its timer.
+            """
+            start = perf_counter_ns()
+            result = func(*args, **kwargs)
+            timer[1] += perf_counter_ns() - start
+            timer[0] += 1
+            return result
+        return timed
+    
+    def summarize(self):
+        """Returns a summary dict {section: {name: {calls, time}}}, where time
+        is in seconds.
+        """
+        summary = OrderedDict()
+        for (section, name), (calls, nanos) in self.timers.items():
+            if section not in summary:
+                summary[section] = OrderedDict()
+            summary[section][name] = dict(calls=calls, time=nanos / 1E9)
+        return summary
+
 class CountingDict(dict, Mergeable, Summarizable):
     """A dictionary that always returns 0 on get of a missing key.
     
@@ -282,8 +445,10 @@ class Histogram(CountingDict):
     def get_summary_stats(self):
         """Returns dict with mean, median, and modes of histogram.
         """
-        values = tuple(self.keys())
-        counts = tuple(self.values())
+        # weighted_median requires the values in sorted order
+        items = sorted(self.items())
+        values = tuple(value for value, _ in items)
+        counts = tuple(count for _, count in items)
         mu0 = weighted_mean(values, counts)
         return dict(
             mean=mu0,
@@ -352,6 +517,51 @@ class MergingDict(OrderedDict, Mergeable):
         merge_dicts(self, other)
         return self
 
+class LRUCache(object):
+    """A mapping of bounded size that discards the least-recently used entry
+    when full. Keeps track of the number of lookups that hit and miss.
+    
+    Args:
+        max_size: Maximum number of entries to retain.
+    """
+    def __init__(self, max_size):
+        if max_size <= 0:
+            raise ValueError("'max_size' must be > 0")
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    def get(self, key, default=None):
+        """Returns the value for `key`, or `default` if `key` is not cached.
+        A successful lookup marks the entry as most-recently used.
+        """
+        entries = self._entries
+        if key not in entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        entries.move_to_end(key)
+        return entries[key]
+    
+    def __setitem__(self, key, value):
+        entries = self._entries
+        entries[key] = value
+        entries.move_to_end(key)
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
+    
+    def clear(self):
+        """Remove all entries. Hit/miss counts are retained.
+        """
+        self._entries.clear()
+
 def merge_dicts(dest, src):
     """Merge corresponding items in `src` into `dest`. Values in `src` missing
     in `dest` are simply added to `dest`. Values that appear in both `src` and
@@ -459,23 +669,69 @@ def qual2int(qual, base=33):
     """
     return ord(qual) - base
 
-def quals2ints(quals, base=33):
-    """Convert an iterable of quality characters to phred-scale ints.
-    
-    Args:
-        quals: The qualities.
-        base: The offset of the first quality value (Old Illumina = 64,
-            new Illumina = 33).
-    
-    Returns:
-        A tuple of integer qualities.
+PHRED_PROBS = tuple(10 ** (-qual / 10.0) for qual in range(256))
+"""Error probabilities of phred-scale qualities 0-255."""
+
+@functools.lru_cache(maxsize=None)
+def _phred_table(base):
+    """Table for `bytes.translate` that converts quality characters with the
+    given base to phred-scale ints.
     """
-    return (ord(q) - base for q in quals)
+    return bytes((code - base) % 256 for code in range(256))
 
-def qual2prob(qchar):
-    """Converts a quality char to a probability.
+def _encode_quals(quals, base):
+    """Encode a string of quality characters as bytes, checking that all of
+    them are valid for the given base.
     """
-    return 10 ** (-qual2int(qchar) / 10)
+    try:
+        encoded = quals.encode('ascii')
+    except UnicodeEncodeError:
+        encoded = None
+    if encoded is None or (encoded and min(encoded) < base):
+        raise ValueError(
+            "Invalid quality character in {!r} for base {}".format(
+                quals, base))
+    return encoded
+
+def _quals2ints_python(quals, base=33):
+    return _encode_quals(quals, base).translate(_phred_table(base))
+
+def _qual_sum_python(quals, base=33):
+    encoded = _encode_quals(quals, base)
+    return sum(encoded) - base * len(encoded)
+
+def _qual_sums_python(quals_list, base=33):
+    return [_qual_sum_python(quals, base) for quals in quals_list]
+
+def _qual_prob_sum_python(quals, base=33):
+    return sum(map(PHRED_PROBS.__getitem__, _quals2ints_python(quals, base)))
+
+# Import cythonized functions, defaulting to pure python implementations.
+# Both convert qualities with a lookup table, rather than per character in
+# Python, and raise ValueError for invalid quality characters:
+# * quals2ints(quals, base=33): Convert a string of quality characters to
+#   phred-scale ints, returned as bytes (i.e. an array of uint8).
+# * qual_sum(quals, base=33), qual_sums(quals_list, base=33): Sum of the
+#   phred-scale qualities of a quality string, or of each of a sequence of
+#   quality strings.
+# * qual_prob_sum(quals, base=33): Sum of the error probabilities of a
+#   quality string.
+try:
+    from ._quals import (
+        quals2ints, qual_sum, qual_sums, qual_prob_sum)
+except ImportError:
+    logging.getLogger().debug(
+        "Import failed for cythonized quality conversion functions")
+    quals2ints = _quals2ints_python
+    qual_sum = _qual_sum_python
+    qual_sums = _qual_sums_python
+    qual_prob_sum = _qual_prob_sum_python
+
+def qual2prob(qchar, base=33):
+    """Converts a quality char to a probability. Raises ValueError if the
+    character is below the quality base.
+    """
+    return qual_prob_sum(qchar, base)
 
 def enumerate_range(collection, start, end):
     """Generates an indexed series:  (0,coll[0]), (1,coll[1]) ...
@@ -496,6 +752,46 @@ def enumerate_range(collection, start, end):
         yield (idx, next(itr))
         idx += 1
 
+def reservoir_sample(iterable, size, rng=random):
+    """Select a uniform random sample of items from an iterable of unknown
+    length in a single pass, holding at most `size` items in memory.
+    
+    Uses Li's "Algorithm L", which draws the number of items to skip before the
+    next replacement rather than a random number for every item.
+    
+    Args:
+        iterable: The items to sample from.
+        size: The number of items to sample.
+        rng: The source of random numbers (an object with `random` and
+            `randrange` methods, such as a :class:`random.Random`).
+    
+    Returns:
+        A list of (at most) `size` items, in the order in which they occurred in
+        `iterable`.
+    """
+    def log_random():
+        # log of a uniform random number on the open interval (0, 1)
+        while True:
+            value = rng.random()
+            if value > 0:
+                return math.log(value)
+    
+    itr = iter(iterable)
+    reservoir = list(enumerate(islice(itr, size)))
+    if len(reservoir) == size > 0:
+        index = size - 1
+        log_weight = log_random() / size
+        while True:
+            skip = int(log_random() / math.log(-math.expm1(log_weight)))
+            item = next(islice(itr, skip, None), reservoir)
+            if item is reservoir:
+                break
+            index += skip + 1
+            reservoir[rng.randrange(size)] = (index, item)
+            log_weight += log_random() / size
+        reservoir.sort(key=lambda indexed_item: indexed_item[0])
+    return [item for _, item in reservoir]
+
 def mean(values):
     """Computes the mean of a sequence of numeric values.
     
@@ -655,6 +951,34 @@ def truncate_string(string, max_len=100):
         string = string[:max_len-3] + '...'
     return string
 
+@contextmanager
+def cprofiled(path):
+    """Context manager that profiles the enclosed code using :mod:`cProfile`
+    and writes the stats to `path`. Does nothing if `path` is None.
+    """
+    if path is None:
+        yield
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+def merge_cprofiles(paths, outfile):
+    """Merge stats files written by :mod:`cProfile` into a single file.
+    
+    Args:
+        paths: The stats files to merge.
+        outfile: The merged stats file.
+    """
+    import pstats
+    stats = pstats.Stats(*paths)
+    stats.dump_stats(outfile)
+
 def run_interruptible(func, *args, **kwargs):
     """Run a function, gracefully handling keyboard interrupts.
     
@@ -0,0 +1,73 @@
+# kate: syntax Python;
+# cython: profile=False, emit_code_comments=False
+"""
+Conversion of ASCII-encoded base qualities.
+"""
+from cpython.bytes cimport PyBytes_FromStringAndSize
+
+cdef double PHRED_PROBS[256]
+
+def _init_probs():
+    """
+    Fill in the table of error probabilities of phred qualities. The values
+    are computed as in atropos.util.PHRED_PROBS.
+    """
+    cdef int i
+    for i in range(256):
+        PHRED_PROBS[i] = 10 ** (-i / 10.0)
+
+_init_probs()
+
+cdef inline int _phred(Py_UCS4 qual, int base) except -1:
+    cdef int value = <int>qual - base
+    if qual > 127 or value < 0:
+        raise ValueError(
+            "Invalid quality character {!r} for base {}".format(qual, base))
+    return value
+
+def quals2ints(str quals, int base=33):
+    """
+    Convert a string of quality characters to phred-scale ints, returned as
+    bytes (i.e. an array of uint8).
+    """
+    cdef Py_ssize_t i = 0
+    cdef Py_UCS4 qual
+    cdef bytes result = PyBytes_FromStringAndSize(NULL, len(quals))
+    cdef char* values = result
+    for qual in quals:
+        values[i] = <char>_phred(qual, base)
+        i += 1
+    return result
+
+cdef long _qual_sum(str quals, int base) except? -1:
+    cdef Py_UCS4 qual
+    cdef long total = 0
+    for qual in quals:
+        total += _phred(qual, base)
+    return total
+
+cdef double _qual_prob_sum(str quals, int base) except? -1:
+    cdef Py_UCS4 qual
+    cdef double total = 0
+    for qual in quals:
+        total += PHRED_PROBS[_phred(qual, base)]
+    return total
+
+def qual_sum(str quals, int base=33):
+    """
+    Sum of the phred-scale qualities in a string of quality characters.
+    """
+    return _qual_sum(quals, base)
+
+def qual_sums(quals_list, int base=33):
+    """
+    List of the sums of the phred-scale qualities in each of a sequence of
+    quality strings.
+    """
+    return [_qual_sum(quals, base) for quals in quals_list]
+
+def qual_prob_sum(str quals, int base=33):
+    """
+    Sum of the error probabilities of a string of quality characters.
+    """
+    return _qual_prob_sum(quals, base)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""Microbenchmark of quality conversion: converting each character in python
+versus the lookup-table functions in atropos.util (compiled, and the pure
+python fallbacks).
+
+Usage: python benchmarks/bench_quals.py [read_length]
+"""
+import random
+import sys
+import timeit
+from atropos import util
+
+def per_char_ints(quals_list, base=33):
+    return [list(ord(qual) - base for qual in quals) for quals in quals_list]
+
+def per_char_sums(quals_list, base=33):
+    return [sum(ord(qual) - base for qual in quals) for quals in quals_list]
+
+def per_char_prob_sums(quals_list, base=33):
+    return [
+        sum(10 ** (-(ord(qual) - base) / 10) for qual in quals)
+        for quals in quals_list]
+
+def batch(func):
+    return lambda quals_list: [func(quals) for quals in quals_list]
+
+BENCHMARKS = (
+    ('quals2ints', per_char_ints, batch(util.quals2ints),
+     batch(util._quals2ints_python)),
+    ('qual_sums', per_char_sums, util.qual_sums, util._qual_sums_python),
+    ('qual_prob_sum', per_char_prob_sums, batch(util.qual_prob_sum),
+     batch(util._qual_prob_sum_python)))
+
+def main(read_length=100, batch_size=10000, repeat=3):
+    rnd = random.Random(1)
+    quals_list = [
+        ''.join(chr(33 + rnd.randint(0, 40)) for _ in range(read_length))
+        for _ in range(batch_size)]
+    compiled = util.quals2ints is not util._quals2ints_python
+    print("compiled functions: {}".format(compiled))
+    print("function\tper_char_s\ttable_s\ttable_python_s")
+    for name, *funcs in BENCHMARKS:
+        times = [
+            min(timeit.repeat(
+                lambda: func(quals_list), number=1, repeat=repeat))
+            for func in funcs]
+        print("{}\t{:.4f}\t{:.4f}\t{:.4f}".format(name, *times))
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
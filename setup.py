@@ -82,7 +82,10 @@ def check_cython_version():
 extensions = [
     Extension('atropos.align._align', sources=['atropos/align/_align.pyx']),
     Extension('atropos.commands.trim._qualtrim', sources=['atropos/commands/trim/_qualtrim.pyx']),
+    Extension('atropos.commands.trim._errorcorrect', sources=['atropos/commands/trim/_errorcorrect.pyx']),
+    Extension('atropos.commands.trim._trimchain', sources=['atropos/commands/trim/_trimchain.pyx']),
     Extension('atropos.io._seqio', sources=['atropos/io/_seqio.pyx']),
+    Extension('atropos.util._quals', sources=['atropos/util/_quals.pyx']),
 ]
 
 cmdclass = versioneer.get_cmdclass()
@@ -136,7 +139,7 @@ setup(
     extras_require = {
         'progressbar' : ['progressbar2'],
         'tqdm' : ['tqdm'],
-        'khmer' : ['khmer'],
+        'numpy' : ['numpy'],
         'pysam' : ['pysam'],
         'jinja' : ['jinja2'],
         'sra' : ['srastream>=0.1.3']
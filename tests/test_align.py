@@ -4,7 +4,9 @@ from .utils import approx_equal
 from atropos.adapters import BACK
 from atropos.align import (
     locate, compare_prefixes, compare_suffixes, Aligner, InsertAligner)
-from atropos.util import RandomMatchProbability
+from atropos.align._align import log_rmp_lookup
+from atropos.util import (
+    RandomMatchProbability, build_log_rmp_table, _build_log_rmp_table_python)
 
 class TestAligner():
     def test(self):
@@ -17,6 +19,16 @@ class TestAligner():
         aligner = Aligner(reference, 1.0, flags=BACK)
         aligner.locate('CAA')
 
+    def test_reference_swap(self):
+        aligner = Aligner('', 0.1, flags=BACK)
+        for reference, query in (
+                ('CTCCAGCTTAGACATATC', 'CTTAGACA'),
+                ('GCTTAGACATATCGCTTAGACATATCGCTTAGACATATC', 'ATCGCTTAGTCATAT'),
+                ('GCTTAG', 'TTAGGG')):
+            aligner.reference = reference
+            assert aligner.locate(query) == Aligner(
+                reference, 0.1, flags=BACK).locate(query)
+
 
 def test_polya():
     s = 'AAAAAAAAAAAAAAAAA'
@@ -141,6 +153,35 @@ def test_match_probability():
     i5 = 0.25 ** 5
     assert approx_equal(a.match_probability(k, n), i3 + i4 + i5, 0.0001)
 
+def test_match_probability_table():
+    def binomial_tail(k, n, p=0.25, q=0.75):
+        return sum(
+            math.factorial(n) / math.factorial(i) / math.factorial(n - i) *
+            (p ** i) * (q ** (n - i))
+            for i in range(k, n + 1))
+    
+    rmp = RandomMatchProbability(max_size=10)
+    for n in range(0, 40, 3):
+        for k in range(0, n + 1):
+            expected = binomial_tail(k, n)
+            assert approx_equal(rmp(k, n), expected, expected * 1E-9)
+            assert approx_equal(
+                rmp(k, n, 0.5, 0.5), binomial_tail(k, n, 0.5, 0.5), 1E-9)
+    # table was extended
+    assert rmp.max_size >= 39
+    log_table = rmp.log_table()
+    assert approx_equal(
+        log_rmp_lookup(log_table, 3, 5), math.log(binomial_tail(3, 5)), 1E-9)
+    assert approx_equal(
+        rmp.log_probability(3, 5), math.log(binomial_tail(3, 5)), 1E-9)
+
+def test_match_probability_table_python():
+    table1 = build_log_rmp_table(50)
+    table2 = _build_log_rmp_table_python(50, 0.25, 0.75)
+    assert len(table1) == len(table2) == (51 * 52) // 2
+    for logp1, logp2 in zip(table1, table2):
+        assert approx_equal(logp1, logp2, 1E-9)
+
 def test_insert_align():
     a1_seq = 'TTAGACATATGG'
     a2_seq = 'CAGTGGAGTATA'
@@ -209,3 +250,74 @@ def test_multi_aligner_with_mismatches():
     assert matches[1][3] == 12
     assert matches[1][4] == 11
     assert matches[1][5] == 1
+
+def test_packed_sequence():
+    from atropos.align import PackedSequence
+    from atropos.util import reverse_complement
+    seq = 'ACGTNACGGTTACCAGTNNACGTACGATCGATCGTAGCTAGCTAGGATCNAGTCA'
+    packed = PackedSequence(seq)
+    assert len(packed) == len(seq)
+    assert packed.acgtn
+    assert str(packed) == seq
+    assert str(packed[3:40]) == seq[3:40]
+    assert str(packed[40:]) == seq[40:]
+    assert str(packed.reverse_complement()) == reverse_complement(seq)
+    assert str(packed[5:38].reverse_complement()) == reverse_complement(seq[5:38])
+    assert str(PackedSequence('').reverse_complement()) == ''
+    # Characters other than ACGTN can be packed, but are flagged
+    other = PackedSequence('ACGTRYacgt')
+    assert not other.acgtn
+    assert str(other.reverse_complement()) == reverse_complement('ACGTRYacgt')
+
+def test_packed_kmers():
+    from atropos.align import PackedSequence
+    seq = 'ACGTNACGTACGTAAACGTR'
+    kmers = PackedSequence(seq).kmers(4)
+    substrings = [seq[i:(i+4)] for i in range(len(seq) - 3)]
+    assert len(kmers) == len(substrings)
+    for kmer1, sub1 in zip(kmers, substrings):
+        if 'N' in sub1 or 'R' in sub1:
+            assert kmer1 == sub1
+        else:
+            assert isinstance(kmer1, int)
+        for kmer2, sub2 in zip(kmers, substrings):
+            assert (kmer1 == kmer2) == (sub1 == sub2)
+
+def test_compare_packed():
+    from atropos.align import PackedSequence
+    pairs = [
+        ('AAGATCGG', 'AAGATCGGTTTNN'),
+        ('AAGNTCGGAACGATCGATCGATCGATCGATGCATCGAA', 'ATGNTCGGAACGATCGATCGAACGATCGATGCATCGATTA'),
+        ('NNACGT', 'NAACGT'),
+        ('ACGRAC', 'ACGTAC'),
+        ('', 'ACGT')]
+    for ref, query in pairs:
+        packed_ref = PackedSequence(ref)
+        packed_query = PackedSequence(query)
+        assert compare_prefixes(packed_ref, packed_query) == compare_prefixes(ref, query)
+        assert compare_suffixes(packed_ref, packed_query) == compare_suffixes(ref, query)
+
+def test_multi_aligner_locate_packed():
+    import random
+    from atropos.align import (
+        MultiAligner, PackedSequence, START_WITHIN_SEQ1, STOP_WITHIN_SEQ2)
+    from atropos.util import reverse_complement
+    rng = random.Random(123)
+    def rand_seq(size, alphabet='ACGT'):
+        return ''.join(rng.choice(alphabet) for _ in range(size))
+    for _ in range(500):
+        insert = rand_seq(rng.randint(10, 100))
+        size = rng.randint(20, 100)
+        read1 = list((insert + rand_seq(size))[:size])
+        read2 = (reverse_complement(insert) + rand_seq(size))[:size]
+        for _ in range(rng.randint(0, 5)):
+            read1[rng.randrange(size)] = rng.choice('ACGTN')
+        read1 = ''.join(read1)
+        aligner = MultiAligner(
+            rng.choice((0.1, 0.2, 0.3)), START_WITHIN_SEQ1 | STOP_WITHIN_SEQ2,
+            rng.randint(1, 5))
+        max_matches = rng.choice((2, 100))
+        assert aligner.locate_packed(
+            PackedSequence(read2).reverse_complement(), PackedSequence(read1),
+            max_matches
+        ) == aligner.locate(reverse_complement(read2), read1, max_matches)
@@ -394,6 +394,50 @@ def test_custom_bisulfite_3():
 def test_custom_bisulfite_4():
     run('-b TTAGACATATCTCCGTCG -q 0,0 --bisulfite 2,2,0,0', 'small_mincut3.fastq', 'small.fastq')
 
+def test_profile_pipeline():
+    # profiling does not change the output
+    run('-b TTAGACATATCTCCGTCG --profile-pipeline', 'small.fastq', 'small.fastq')
+    with temporary_path('small.fastq') as tmp_fastq:
+        retcode, summary = get_command('trim').execute([
+            '-b', 'TTAGACATATCTCCGTCG', '-m', '10', '--profile-pipeline',
+            '-se', datapath('small.fastq'), '-o', tmp_fastq])
+        assert retcode == 0
+        profile = summary['profile']
+        assert profile['modifiers']['AdapterCutter']['calls'] == 3
+        assert profile['filters']['too_short']['calls'] == 1
+        assert profile['formatters']['format']['calls'] == 3
+        assert profile['results']['write_result']['calls'] == 1
+        assert all(
+            timer['time'] >= 0
+            for timers in profile.values()
+            for timer in timers.values())
+
+def test_cprofile():
+    import glob
+    import pstats
+    import shutil
+    import tempfile
+    for threads in ((), ('-T', '2')):
+        profile_dir = tempfile.mkdtemp()
+        try:
+            with temporary_path('small.fastq') as tmp_fastq:
+                retcode, summary = get_command('trim').execute([
+                    '-b', 'TTAGACATATCTCCGTCG', '--cprofile', profile_dir,
+                    '-se', datapath('small.fastq'), '-o', tmp_fastq
+                ] + list(threads))
+                assert retcode == 0
+            prefix = os.path.join(profile_dir, 'atropos-{}'.format(os.getpid()))
+            names = set(
+                path[len(prefix):] for path in glob.glob(prefix + '*.prof'))
+            expected = {'.main.prof', '.prof'}
+            if threads:
+                expected |= {'.worker0.prof', '.writer.prof'}
+            assert expected <= names, names
+            stats = pstats.Stats(prefix + '.prof')
+            assert stats.total_calls > 0
+        finally:
+            shutil.rmtree(profile_dir)
+
 @skipIf(
     no_internet("https://ncbi.nlm.nih.gov") or no_import('srastream'), 
     "No internet connection or srastream not importable")
@@ -0,0 +1,172 @@
+# coding: utf-8
+import random
+from unittest import skipIf
+from atropos.adapters import AdapterCache
+from atropos.commands.detect import (
+    ContaminantIndex, DetectorState, HeuristicDetector,
+    create_contaminant_matchers)
+from atropos.commands.detect.kmers import np, CountMinSketch
+from atropos.io.seqio import Sequence
+from atropos.util import merge_dicts, reverse_complement
+
+def random_sequences(rnd, num_seqs, max_len, adapters):
+    seqs = set()
+    for _ in range(num_seqs):
+        length = rnd.choice((max_len, rnd.randint(10, max_len)))
+        seq = ''.join(
+            'N' if rnd.random() < 0.01 else rnd.choice('ACGT')
+            for _ in range(length))
+        if rnd.random() < 0.4:
+            pos = rnd.randint(0, length)
+            seq = (seq[:pos] + rnd.choice(adapters))[:length]
+        seqs.add(seq)
+    return seqs
+
+@skipIf(np is None, "numpy is not installed")
+def test_heuristic_candidates():
+    rnd = random.Random(3)
+    for kmer_size in (8, 10, 12):
+        adapters = [
+            ''.join(rnd.choice('ACGT') for _ in range(rnd.randint(10, 30)))
+            for _ in range(2)]
+        detector = HeuristicDetector(kmer_size=kmer_size, n_reads=1000)
+        detector._read_length = 40
+        detector._read_sequences = random_sequences(rnd, 1000, 40, adapters)
+        results, result_seqs = detector._get_candidates()
+        expected, expected_seqs = detector._get_candidates_python(
+            list(detector._read_sequences))
+        assert len(results) > 0
+        assert sorted(results) == sorted(expected)
+        for kmer, _ in results:
+            assert sorted(result_seqs(kmer)) == sorted(expected_seqs(kmer))
+
+@skipIf(np is None, "numpy is not installed")
+def test_count_min_sketch():
+    rnd = random.Random(4)
+    seqs = list(random_sequences(rnd, 200, 40, ['ACGTTCGAAGTCCGATTAGC']))
+    kmer_size = 8
+    counts = {}
+    for seq in seqs:
+        for i in range(len(seq) - kmer_size + 1):
+            kmer = seq[i:(i + kmer_size)]
+            if 'N' not in kmer:
+                kmer = min(kmer, reverse_complement(kmer))
+                counts[kmer] = counts.get(kmer, 0) + 1
+
+    # a narrow sketch over-estimates, but never under-estimates
+    narrow = CountMinSketch(kmer_size, 256)
+    narrow.consume_and_tag(seqs)
+    assert narrow.n_consumed == sum(counts.values())
+    assert all(narrow.get(kmer) >= count for kmer, count in counts.items())
+    assert any(narrow.get(kmer) > count for kmer, count in counts.items())
+
+    sketch = CountMinSketch(kmer_size, 4**kmer_size)
+    sketch.consume_and_tag(seqs[:100])
+    other = CountMinSketch(kmer_size, 4**kmer_size)
+    other.consume_and_tag(seqs[100:])
+    sketch.merge(other)
+    for kmer, count in counts.items():
+        assert sketch.get(kmer) == count
+        assert sketch.get(reverse_complement(kmer)) == count
+    assert sketch.get('ACGTNACG') == 0
+
+    tags = sketch.get_tagset()
+    assert 0 < len(tags) < len(counts)
+    assert set(tags) <= set(counts)
+    frequent = sketch.frequent_tags(10)
+    assert frequent == dict(
+        (kmer, counts[kmer]) for kmer in tags if counts[kmer] >= 10)
+
+def test_merge_detector_states():
+    states = []
+    for batch_index, read_length, seqs in (
+            (3, 40, ('ACGT', 'CCCC')), (1, 36, ('ACGT', 'GGGG')),
+            (None, None, ())):
+        state = DetectorState()
+        if batch_index:
+            state.set_read_length(read_length, batch_index)
+        state.read_sequences.update(seqs)
+        states.append(state)
+    summary = dict(detect=dict(state=states[0]))
+    for state in states[1:]:
+        merge_dicts(summary, dict(detect=dict(state=state)))
+    merged = summary['detect']['state']
+    assert merged.read_length == 36
+    assert merged.read_sequences == {'ACGT', 'CCCC', 'GGGG'}
+    paired = dict(state=(DetectorState(), DetectorState()))
+    merge_dicts(paired, dict(state=(merged, DetectorState())))
+    assert [state.read_length for state in paired['state']] == [36, None]
+    assert paired['state'][0].read_sequences == merged.read_sequences
+
+def test_contaminant_index():
+    rnd = random.Random(5)
+    contaminants = AdapterCache(None)
+    contaminants.load_from_file()
+    adapters = contaminants.sequences
+    seqs = random_sequences(rnd, 200, 60, adapters)
+    seqs.update(reverse_complement(seq) for seq in list(seqs)[:50])
+    for kmer_size in (8, 12, 40):
+        index = ContaminantIndex(contaminants, kmer_size)
+        matchers = create_contaminant_matchers(contaminants, kmer_size)
+        for min_match_frac in (0, 0.1):
+            for seq in seqs:
+                expected = []
+                for contam in matchers:
+                    match = contam.match(seq, reverse_complement(seq))
+                    if match[0] >= min_match_frac:
+                        expected.append((contam.seq,) + match)
+                actual = [
+                    (match[0].seq,) + match[1:]
+                    for match in index.match(
+                        seq, min_match_frac=min_match_frac)]
+                assert actual == expected
+        assert (
+            [contam.matches for contam in index] ==
+            [contam.matches for contam in matchers])
+
+class BatchRunner(object):
+    def __init__(self, batches):
+        self.batches = batches
+        self.summary = dict(detect={})
+
+    def iterator(self):
+        return iter(self.batches)
+
+def random_batches(rnd, num_batches, batch_size, adapters):
+    batches = []
+    for index in range(1, num_batches + 1):
+        seqs = []
+        for _ in range(batch_size):
+            seq = ''.join(rnd.choice('ACGT') for _ in range(50))
+            if adapters and rnd.random() < 0.2:
+                pos = rnd.randint(10, 30)
+                seq = (seq[:pos] + rnd.choice(adapters))[:50]
+            seqs.append(seq)
+        records = [
+            Sequence('read{}'.format(i), seq, 'I' * len(seq))
+            for i, seq in enumerate(seqs)]
+        batches.append((dict(index=index, source=0, size=batch_size), records))
+    return batches
+
+@skipIf(np is None, "numpy is not installed")
+def test_early_stop():
+    rnd = random.Random(11)
+    adapters = ['AGATCGGAAGAGCACACGTCTGAACTCCAGTCAC']
+    for batch_adapters in (adapters, ()):
+        batches = random_batches(rnd, 20, 500, batch_adapters)
+        detector = HeuristicDetector(
+            n_reads=10000, early_stop=0.2, early_stop_interval=1000,
+            past_end_bases=None)
+        runner = BatchRunner(batches)
+        detector(runner)
+        assert detector.stopped
+        n_reads = runner.summary['total_record_count']
+        assert n_reads < 10000
+        assert detector.n_reads == n_reads
+        matches = runner.summary['detect']['matches'][0]
+        if batch_adapters:
+            assert len(matches) > 0
+            assert matches[0]['longest_kmer'] in adapters[0]
+            assert matches[0]['abundance'] > 0
+        else:
+            assert len(matches) == 0
@@ -0,0 +1,184 @@
+# coding: utf-8
+from bisect import bisect
+from collections import Counter
+import io
+import pickle
+import random
+from unittest import skipIf
+from unittest.mock import patch
+from atropos.commands.error import (
+    np, shadow_counts, shadow_regression, BaseQualityErrorEstimator,
+    ShadowRegressionErrorEstimator, PairedErrorEstimator)
+from atropos.commands.error.reports import generate_reports
+from atropos.commands.multicore import ParallelPipelineMixin
+from atropos.io.seqio import Sequence
+from atropos.util import merge_dicts
+
+def brute_force_shadows(seqs, counts):
+    is_shadow = [False] * len(seqs)
+    shadows = {}
+    for i, seq in enumerate(seqs):
+        for j, other in enumerate(seqs):
+            if len(seq) != len(other):
+                continue
+            diffs = [p for p in range(len(seq)) if seq[p] != other[p]]
+            if len(diffs) != 1:
+                continue
+            if counts[j] > counts[i]:
+                is_shadow[i] = True
+            elif counts[j] < counts[i]:
+                key = (i, diffs[0])
+                shadows[key] = shadows.get(key, 0) + counts[j]
+    return is_shadow, shadows
+
+def simulate_reads(rnd, num_reads, templates, error_rates):
+    # cumulative weights, for a weighted choice of template (random.choices
+    # requires python 3.6)
+    cum_weights = []
+    total = 0
+    for _ in templates:
+        total += rnd.randint(1, 100)
+        cum_weights.append(total)
+    reads = []
+    for _ in range(num_reads):
+        read = list(templates[bisect(cum_weights, rnd.randrange(total))])
+        for pos, error_rate in enumerate(error_rates):
+            if rnd.random() < error_rate:
+                read[pos] = rnd.choice([b for b in 'ACGT' if b != read[pos]])
+        reads.append(''.join(read))
+    return Counter(reads)
+
+@skipIf(np is None, "numpy is not installed")
+def test_shadow_counts():
+    rnd = random.Random(1)
+    for length in (1, 5, 12):
+        templates = [
+            ''.join(rnd.choice('ACGT') for _ in range(length))
+            for _ in range(10)]
+        reads = simulate_reads(rnd, 300, templates, [0.1] * length)
+        reads.update(
+            read[:rnd.randint(1, length)] for read in list(reads)[:20])
+        seqs = list(reads.keys())
+        counts = list(reads.values())
+        is_shadow, shadows = shadow_counts(seqs, counts)
+        expected_is_shadow, expected_shadows = brute_force_shadows(
+            seqs, counts)
+        assert list(is_shadow) == expected_is_shadow
+        assert dict(
+            ((seq_idx, cycle), count)
+            for seq_idx, cycle, count in zip(*shadows)) == expected_shadows
+
+@skipIf(np is None, "numpy is not installed")
+def test_shadow_regression():
+    rnd = random.Random(2)
+    error_rates = [0.005 * (1 + pos / 10) for pos in range(20)]
+    templates = [
+        ''.join(rnd.choice('ACGT') for _ in range(20)) for _ in range(100)]
+    reads = simulate_reads(rnd, 50000, templates, error_rates)
+    counts = list(reads.values())
+    per_read, per_cycle = shadow_regression(
+        counts, *shadow_counts(list(reads.keys()), counts))
+    expected = 1.0
+    for error_rate in error_rates:
+        expected *= 1 - error_rate
+    assert abs(per_read['error rate'] - (1 - expected)) < 0.01
+    assert [cycle[0] for cycle in per_cycle] == list(range(1, 21))
+    for (_, error_rate, stderr), expected in zip(per_cycle, error_rates):
+        assert abs(error_rate - expected) < 0.003
+        assert stderr < 0.001
+
+def estimate_serial(pipeline_class, pipeline_args, batches):
+    pipeline = pipeline_class(**pipeline_args)
+    summary = dict(errorrate={})
+    for batch in batches:
+        pipeline.handle_records(dict(bp=[0, 0]), batch)
+    pipeline.add_estimates(summary)
+    return summary['errorrate']
+
+def estimate_parallel(pipeline_class, pipeline_args, batches):
+    impl_class = type(
+        'ErrorEstimatorImpl', (ParallelPipelineMixin, pipeline_class),
+        dict(state_class=pipeline_class))
+    summary = dict(errorrate={})
+    # each worker processes every third batch; states are pickled as they are
+    # when they are sent to the main process
+    for worker in range(3):
+        pipeline = impl_class(**pipeline_args)
+        for batch in batches[worker::3]:
+            pipeline.handle_records(dict(bp=[0, 0]), batch)
+        merge_dicts(summary, dict(errorrate=dict(
+            state=pickle.loads(pickle.dumps(pipeline.state)))))
+    pipeline = impl_class(**pipeline_args)
+    pipeline.state = summary['errorrate'].pop('state')
+    pipeline.add_estimates(summary)
+    return summary['errorrate']
+
+@skipIf(np is None, "numpy is not installed")
+def test_merge_estimators():
+    rnd = random.Random(3)
+    templates = [
+        ''.join(rnd.choice('ACGT') for _ in range(30)) for _ in range(20)]
+    reads = list(simulate_reads(rnd, 3000, templates, [0.01] * 30).elements())
+    rnd.shuffle(reads)
+    records = [
+        Sequence(
+            'read{}'.format(i), seq,
+            ''.join(chr(33 + rnd.randint(2, 40)) for _ in seq))
+        for i, seq in enumerate(reads)]
+    paired_records = list(zip(records, reversed(records)))
+    for estimator_class in (
+            BaseQualityErrorEstimator, ShadowRegressionErrorEstimator):
+        for pipeline_class, pipeline_args, recs in (
+                (estimator_class, dict(max_read_len=25), records),
+                (PairedErrorEstimator,
+                 dict(estimator_class=estimator_class), paired_records)):
+            batches = [recs[i:i+100] for i in range(0, len(recs), 100)]
+            assert estimate_parallel(
+                pipeline_class, pipeline_args, batches) == estimate_serial(
+                    pipeline_class, pipeline_args, batches)
+
+def test_per_cycle_quality_error():
+    rnd = random.Random(4)
+    records = [
+        Sequence(
+            'read{}'.format(i), 'A' * length,
+            ''.join(chr(33 + rnd.randint(2, 40)) for _ in range(length)))
+        for i, length in enumerate(
+            rnd.randint(0, 40) for _ in range(500))]
+    probs = [[] for _ in range(30)]
+    for record in records:
+        for cycle, qual in enumerate(record.qualities[:30]):
+            probs[cycle].append(10 ** (-(ord(qual) - 33) / 10))
+    expected = sum(sum(cycle) for cycle in probs) / sum(map(len, probs))
+    results = []
+    for numpy in (np, None):
+        with patch('atropos.commands.error.np', numpy):
+            estimator = BaseQualityErrorEstimator(max_read_len=30)
+            estimator.handle_records(dict(bp=[0, 0]), records[:250])
+            for record in records[250:]:
+                estimator.handle_reads(None, record)
+        results.append(estimator.estimate())
+    assert results[0] == results[1]
+    estimate, details = results[0]
+    assert abs(estimate - expected) < 1e-9
+    per_cycle = details['per_cycle']
+    assert [cycle for cycle, _ in per_cycle] == list(range(1, 31))
+    for (_, error), cycle_probs in zip(per_cycle, probs):
+        assert abs(error - sum(cycle_probs) / len(cycle_probs)) < 1e-9
+
+    summary = dict(
+        input=dict(input_names=['reads.fq']),
+        errorrate=dict(
+            estimate=(estimate,), total_len=(estimator.total_len,),
+            details=(details,)))
+    out = io.StringIO()
+    generate_reports(out, summary)
+    lines = out.getvalue().splitlines()
+    assert 'Error rate: {:.2%}'.format(estimate) in lines
+    table = lines[lines.index('    Cycle   Error') + 2:]
+    assert len(table) == 30
+    max_error = max(error for _, error in per_cycle)
+    for line, (cycle, error) in zip(table, per_cycle):
+        fields = line.split()
+        assert fields[:2] == [str(cycle), '{:.2%}'.format(error)]
+        assert len(fields[2]) == round(error * 50 / max_error)
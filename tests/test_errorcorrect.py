@@ -0,0 +1,52 @@
+# coding: utf-8
+import random
+from pytest import raises
+from atropos.commands.trim.errorcorrect import (
+    correct_mismatches, _correct_mismatches_python)
+from atropos.util import reverse_complement
+
+def random_pair(rng, with_quals=True):
+    frag = ''.join(rng.choice('ACGT') for _ in range(rng.randint(20, 60)))
+    read1 = list(frag)
+    read2 = list(reverse_complement(frag))
+    for _ in range(rng.randint(0, 8)):
+        read = rng.choice((read1, read2))
+        read[rng.randrange(len(read))] = rng.choice('ACGTN')
+    quals = [None, None]
+    if with_quals:
+        quals = [
+            ''.join(chr(33 + rng.randint(2, 40)) for _ in range(len(frag)))
+            for _ in range(2)]
+    return ''.join(read1), quals[0], ''.join(read2), quals[1]
+
+def test_correct_mismatches_identical_to_python():
+    rng = random.Random(42)
+    for _ in range(2000):
+        action = rng.choice(('N', 'liberal', 'conservative'))
+        seq1, qual1, seq2, qual2 = random_pair(
+            rng, action != 'N' or rng.random() < 0.5)
+        size = len(seq1)
+        overlap = rng.randint(1, size)
+        args = (
+            seq1, qual1, seq2, qual2, size - overlap, size, 0, overlap, action,
+            rng.randint(1, 10))
+        assert correct_mismatches(*args) == _correct_mismatches_python(*args)
+
+def test_correct_mismatches():
+    # read1 has an N and a low-quality mismatch; read2 has an N
+    seq1 = 'ACGTNCGAAC'
+    qual1 = 'IIIIIII#II'
+    seq2 = reverse_complement('ACNTACGTAC')
+    qual2 = 'IIIIIIIIII'
+    result = correct_mismatches(
+        seq1, qual1, seq2, qual2, 0, 10, 0, 10, 'conservative', 1)
+    assert result == (
+        2, 1, 'ACGTACGTAC', 'IIIIIIIIII', reverse_complement('ACGTACGTAC'),
+        'IIIIIIIIII')
+    result = correct_mismatches(seq1, None, seq2, None, 0, 10, 0, 10, 'N', 1)
+    assert result == (
+        3, 3, 'ACNTNCGNAC', None, reverse_complement('ACNTNCGNAC'), None)
+
+def test_correct_mismatches_invalid_base():
+    with raises(KeyError):
+        correct_mismatches('ACGT', None, 'AXGT', None, 0, 4, 0, 4, 'N', 1)
@@ -39,3 +39,34 @@ def test_ncontentfilter_paired():
         assert filter_legacy(read1, read2) == filter(read1)
         # discard entire pair if one of the reads fulfills criteria
         assert filter_both(read1, read2) == expected
+
+def test_filter_batch():
+    import random
+    from atropos.commands.trim.filters import (
+        Filters, FilterFactory, TooShortReadFilter, TooLongReadFilter,
+        UntrimmedFilter)
+    rnd = random.Random(3)
+    def create_filters(paired, min_affected, n_count):
+        filters = Filters(FilterFactory(paired, min_affected))
+        filters.add_filter(TooShortReadFilter, 5)
+        filters.add_filter(UntrimmedFilter)
+        filters.add_filter(TooLongReadFilter, 25)
+        filters.add_filter(NContentFilter, n_count)
+        return filters
+    def random_read():
+        seq = ''.join(rnd.choice('ACGTNn') for _ in range(rnd.randint(0, 30)))
+        read = Sequence('read', seq, qualities='#'*len(seq))
+        if rnd.random() < 0.9:
+            read.match = True
+        return read
+    for paired, min_affected, n_count in (
+            (False, 1, 3), ('first', 1, 0.2), ('both', 1, 0.1),
+            ('both', 2, 4)):
+        filters1 = create_filters(paired, min_affected, n_count)
+        filters2 = create_filters(paired, min_affected, n_count)
+        records = [
+            (random_read(), random_read()) if paired else (random_read(),)
+            for _ in range(500)]
+        assert filters1.filter_batch(records) == [
+            filters2.filter(*record) for record in records]
+        assert filters1.summarize() == filters2.summarize()
@@ -90,10 +90,10 @@ def test_min_cutter_T_T():
     min_trimmer = MinCutter((5,-5), True, True)
     
     read1 = Sequence('read1', "CAATCGATCGAACGTACCGAT")
-    assert read1.clipped == [0,0,0,0], str(read1.clipped)
+    assert read1.clipped == (0,0,0,0), str(read1.clipped)
     read1 = unconditional_before(read1)
     assert read1.sequence == "ATCGATCGAACGTACCG"
-    assert read1.clipped == [2,2,0,0], str(read1.clipped)
+    assert read1.clipped == (2,2,0,0), str(read1.clipped)
     
     # test without adapter trimming
     assert min_trimmer(read1).sequence == "ATCGATCGAACGTACCG"
@@ -104,15 +104,15 @@ def test_min_cutter_T_T():
     read2.match, read2.match_info = front_match(read2)
     read3 = min_trimmer(read2)
     assert read3.sequence == "TCGAACGTACCG", read3.sequence
-    assert read3.clipped == [2,2,1,0]
+    assert read3.clipped == (2,2,1,0)
     
     # test with subsequent clipping
     read4 = unconditional_after(read2)
     assert read4.sequence == "TCGAACGTACC", read4.sequence
-    assert read4.clipped == [2,2,1,1], read4.clipped
+    assert read4.clipped == (2,2,1,1), read4.clipped
     read5 = min_trimmer(read4)
     assert read5.sequence == "TCGAACGTACC", read5.sequence
-    assert read5.clipped == [2,2,1,1], read5.clipped
+    assert read5.clipped == (2,2,1,1), read5.clipped
 
 def test_min_cutter_F_T():
     unconditional_before = UnconditionalCutter((2,-2))
@@ -122,7 +122,7 @@ def test_min_cutter_F_T():
     read1 = Sequence('read1', "CAATCGATCGAACGTACCGAT")
     read1 = unconditional_before(read1)
     assert read1.sequence == "ATCGATCGAACGTACCG"
-    assert read1.clipped == [2,2,0,0]
+    assert read1.clipped == (2,2,0,0)
     
     # test without adapter trimming
     assert min_trimmer(read1).sequence == "ATCGATCGAACGTACCG"
@@ -133,15 +133,15 @@ def test_min_cutter_F_T():
     read2.sequence = "CGATCGAACGTACCG"
     read3 = min_trimmer(read2)
     assert read3.sequence == "GAACGTACCG", read3.sequence
-    assert read3.clipped == [2,2,5,0]
+    assert read3.clipped == (2,2,5,0)
     
     # test with subsequent clipping
     read4 = unconditional_after(read2)
     assert read4.sequence == "GATCGAACGTACC"
-    assert read4.clipped == [2,2,1,1]
+    assert read4.clipped == (2,2,1,1)
     read5 = min_trimmer(read4)
     assert read5.sequence == "GAACGTACC", read5.sequence
-    assert read5.clipped == [2,2,5,1]
+    assert read5.clipped == (2,2,5,1)
 
 def test_min_cutter_T_F():
     unconditional_before = UnconditionalCutter((2,-2))
@@ -150,7 +150,7 @@ def test_min_cutter_T_F():
     read1 = Sequence('read1', "CAATCGATCGAACGTACCGAT")
     read1 = unconditional_before(read1)
     assert read1.sequence == "ATCGATCGAACGTACCG"
-    assert read1.clipped == [2,2,0,0]
+    assert read1.clipped == (2,2,0,0)
     
     # test without adapter trimming
     assert min_trimmer(read1).sequence == "CGATCGAACGTAC"
@@ -459,3 +459,193 @@ def test_overwrite_read():
     assert new_read2.sequence == highseq
     assert new_read2.qualities == ints2quals(highq)
     assert new_read1.corrected == new_read2.corrected == 0
+
+def test_adapter_cutter_cache():
+    a1 = 'AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGTAGATCTC'
+    frag = 'CCAAGCAGACATTCACTCAGATTGCA'
+    seqs = [(frag + a1)[0:40], frag + 'ACGTACGTACGTAC', (frag + a1)[0:40]]
+    
+    def run_cutter(cache_size):
+        adapter = AdapterParser().parse_from_spec(a1, name='adapter')
+        cutter = AdapterCutter([adapter], cache_size=cache_size)
+        trimmed = [
+            cutter(Sequence('read{}'.format(i), seq, '#' * len(seq)))
+            for i, seq in enumerate(seqs)]
+        return cutter, trimmed
+    
+    uncached, expected = run_cutter(0)
+    cached, actual = run_cutter(10)
+    assert 'cache_hits' not in uncached.summarize()
+    for exp, act in zip(expected, actual):
+        assert exp == act
+        assert exp.match_info == act.match_info
+        if exp.match:
+            assert act.match.read is not exp.match.read
+            assert str(exp.match) == str(act.match)
+    exp_adapter = uncached.adapters[0]
+    act_adapter = cached.adapters[0]
+    assert exp_adapter.lengths_back == act_adapter.lengths_back
+    assert exp_adapter.errors_back == act_adapter.errors_back
+    assert exp_adapter.adjacent_bases == act_adapter.adjacent_bases
+    summary = cached.summarize()
+    assert summary['cache_hits'] == 1
+    assert summary['cache_misses'] == 2
+
+def test_insert_adapter_cutter_cache():
+    a1 = 'AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGTAGATCTC'
+    a2 = 'AGATCGGAAGAGCACACGTCTGAACTCCAGTCACGAGTTA'
+    frag = 'CCAAGCAGACATTCACTCAGATTGCA'
+    r1 = (frag + a1)[0:40]
+    r2 = reverse_complement(reverse_complement(a2) + frag)[0:40]
+    parser = AdapterParser()
+    cutter = InsertAdapterCutter(
+        parser.parse_from_spec(a1), parser.parse_from_spec(a2),
+        cache_size=10)
+    for _ in range(3):
+        read1, read2 = cutter(
+            Sequence('foo', r1, '#' * 40), Sequence('foo', r2, '#' * 40))
+        assert read1.insert_overlap
+        assert read1.sequence == frag
+        assert read2.sequence == reverse_complement(frag)
+        assert read1.match.read is not read2.match.read
+    summary = cutter.summarize()
+    assert summary['records_with_adapters'] == [3, 3]
+    assert summary['cache_hits'] == 2
+    assert summary['cache_misses'] == 1
+    assert sum(cutter.adapter1.lengths_back.values()) == 3
+
+def test_lru_cache():
+    from atropos.util import LRUCache
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache.get('a') == 1
+    cache['c'] = 3
+    assert 'b' not in cache
+    assert len(cache) == 2
+    assert cache.get('b', 0) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_fused_trimmers():
+    import random
+    from atropos.commands.trim.modifiers import TrimChain
+    if TrimChain is None:
+        return
+    def trimmers():
+        return [
+            (UnconditionalCutter, dict(lengths=[2, -1])),
+            (NEndTrimmer, {}),
+            (QualityTrimmer, dict(cutoff_front=10, cutoff_back=20)),
+            (NextseqQualityTrimmer, dict(cutoff=15)),
+            (MinCutter, dict(lengths=[4, -4])),
+            (RRBSTrimmer, {}),
+            (MinCutter, dict(lengths=[6, -3], count_trimmed=False))]
+    rnd = random.Random(17)
+    for _ in range(20):
+        config = rnd.sample(trimmers(), rnd.randint(2, 5))
+        unfused = SingleEndModifiers()
+        fused = SingleEndModifiers()
+        for mod_class, kwargs in config:
+            unfused.add_modifier(mod_class, **kwargs)
+            fused.add_modifier(mod_class, **kwargs)
+        fused.compile()
+        assert any(isinstance(stage, TrimChain) for stage in fused._stages)
+        for _ in range(100):
+            length = rnd.randint(0, 30)
+            seq = ''.join(rnd.choice('ACGGTNN') for _ in range(length))
+            qual = ''.join(chr(33 + rnd.randint(0, 40)) for _ in range(length))
+            read = Sequence('read', seq, qual)
+            if length >= 8 and rnd.random() < 0.5:
+                read.match, read.match_info = rnd.choice(
+                    (front_match, back_match))(read)
+            expected = unfused.modify(read)[0]
+            actual = fused.modify(read)[0]
+            assert actual.sequence == expected.sequence
+            assert actual.qualities == expected.qualities
+            assert actual.clipped == expected.clipped
+        for mods1, mods2 in zip(unfused.modifiers, fused.modifiers):
+            assert mods1[0].trimmed_bases == mods2[0].trimmed_bases
+
+def test_read_screen():
+    import random
+    from atropos.commands.trim.modifiers import ReadScreen
+    if ReadScreen is None:
+        return
+    adapter_seq = 'AGATCGGAAGAGCACACGTCTGAACTCCAGTCAC'
+    def mutate(seq, errors):
+        seq = list(seq)
+        for _ in range(min(errors, len(seq))):
+            i = rnd.randrange(len(seq))
+            op = rnd.randint(0, 2)
+            if op == 0:
+                seq[i] = rnd.choice('ACGT')
+            elif op == 1:
+                del seq[i]
+            else:
+                seq.insert(i, rnd.choice('ACGT'))
+        return ''.join(seq)
+    def modifiers(max_error_rate, min_overlap):
+        mods = SingleEndModifiers()
+        mods.add_modifier(
+            AdapterCutter, adapters=[
+                Adapter(
+                    adapter_seq, BACK, max_error_rate, min_overlap,
+                    name='adapter')])
+        mods.add_modifier(QualityTrimmer, cutoff_front=0, cutoff_back=20)
+        mods.add_modifier(RRBSTrimmer)
+        return mods
+    rnd = random.Random(5)
+    num_passed = 0
+    for max_error_rate, min_overlap in ((0.1, 3), (0.2, 1), (0.3, 5)):
+        unscreened = modifiers(max_error_rate, min_overlap)
+        screened = modifiers(max_error_rate, min_overlap)
+        screened.compile()
+        assert screened._screen is not None
+        for _ in range(2000):
+            length = rnd.randint(0, 60)
+            seq = ''.join(rnd.choice('ACGT') for _ in range(length))
+            if length and rnd.random() < 0.5:
+                overlap = rnd.randint(1, len(adapter_seq))
+                fragment = mutate(adapter_seq[:overlap], rnd.randint(0, 3))
+                seq = (seq + fragment)[-length:]
+            qual = ''.join(
+                chr(33 + (40 if rnd.random() < 0.98 else 2)) for _ in seq)
+            if screened._screen(Sequence('read', seq, qual)):
+                num_passed += 1
+                # Reads that pass the screen are not changed by the modifiers
+                read = unscreened.modify(Sequence('read', seq, qual))[0]
+                assert read.sequence == seq
+                assert read.match is None
+    assert num_passed > 1000
+    # The screen is disabled by modifiers that change every read
+    mods = modifiers(0.1, 3)
+    mods.add_modifier(UnconditionalCutter, lengths=[2])
+    mods.compile()
+    assert mods._screen is None
+    # Summaries are the same whether or not reads are screened
+    reads = [
+        Sequence('read', seq, '#' * len(seq))
+        for seq in ('ACGTACGTAC', 'CCCCAGATCGGAAG', 'TTTTTTTTTT')]
+    unscreened = modifiers(0.1, 3)
+    screened = modifiers(0.1, 3)
+    screened.compile()
+    for read in reads:
+        assert (
+            screened.modify(read)[0].sequence ==
+            unscreened.modify(read)[0].sequence)
+    assert screened.summarize() == unscreened.summarize()
+
+def test_profile_modifiers():
+    from atropos.util import Profiler
+    m = PairedEndModifiers(paired="both")
+    m.add_modifier(UnconditionalCutter, read=1|2, lengths=[5])
+    m.add_modifier(MergeOverlapping)
+    profiler = Profiler()
+    m.profile(profiler)
+    read1 = Sequence('read1', 'ACGTTTACGTA', '##456789###')
+    read2 = Sequence('read1', 'ACGTTTACGTA', '##456789###')
+    mod_read1, mod_read2 = m.modify(read1, read2)
+    assert mod_read1.sequence == 'TACGTA'
+    summary = profiler.summarize()['modifiers']
+    assert summary['UnconditionalCutter']['calls'] == 2
+    assert summary['MergeOverlapping']['calls'] == 1
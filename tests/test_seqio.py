@@ -38,6 +38,51 @@ class TestSequence:
             ColorspaceSequence(name="name", sequence="K0123", qualities="####")
 
 
+    def test_slice_view(self):
+        seq = Sequence('name', 'ACGTACGTAC', 'ABCDEFGHIJ', clipped=[1, 0, 0, 0])
+        view = seq[2:9][1:-1]
+        assert len(view) == 5
+        assert view.sequence == 'TACGT'
+        assert view.qualities == 'DEFGH'
+        assert view.clipped == (1, 0, 0, 0)
+        assert view.clipped is not seq.clipped
+        assert seq[5:2].sequence == ''
+        assert len(seq[-3:]) == 3
+        assert seq[::2].sequence == 'AGAGA'
+        assert Sequence('name', 'ACGT')[1:].qualities is None
+
+    def test_slice_view_assignment(self):
+        seq = Sequence('name', 'ACGTACGTAC', 'ABCDEFGHIJ')
+        view = seq[2:8]
+        view.sequence = view.sequence + 'NN'
+        assert view.qualities == 'CDEFGH'
+        view.qualities = view.qualities + '##'
+        assert len(view) == 8
+        assert view[4:].sequence == 'GTNN'
+        assert view[4:].qualities == 'GH##'
+        assert seq.sequence == 'ACGTACGTAC'
+        assert seq.qualities == 'ABCDEFGHIJ'
+
+    def test_compact_fields(self):
+        seq = Sequence('name', 'ACGTACGTAC', 'ABCDEFGHIJ', merged=True)
+        assert seq.merged and not seq.insert_overlap
+        seq.insert_overlap = True
+        seq.merged = False
+        assert seq.insert_overlap and not seq.merged
+        assert seq.match is None and seq.match_info is None
+        seq.match_info = ['info']
+        assert seq.match is None and seq.match_info == ['info']
+        # clipped is immutable; it must be assigned to change the counts
+        with raises(TypeError):
+            seq.clipped[0] = 5
+        assert seq.clipped == (0, 0, 0, 0)
+        seq.clipped = [1, 2, 3, 4]
+        front, back, clipped = seq.clip(2, -1)
+        assert clipped.clipped == (3, 3, 3, 4)
+        assert clipped.insert_overlap and clipped.match_info == ['info']
+        assert seq.clipped == (1, 2, 3, 4)
+
+
 class TestFastaReader:
     def test(self):
         with FastaReader("tests/data/simple.fasta") as f:
@@ -122,6 +167,78 @@ class TestFastqReader:
         with raises(FormatError), FastqReader(fastq) as fq:
             list(fq)
 
+    def test_keep_raw(self):
+        fmt = FastqFormat()
+        for path in (
+                "tests/data/simple.fastq", "tests/data/plus.fastq",
+                "tests/data/small.fastq", "tests/data/dos.fastq"):
+            with FastqReader(path) as f:
+                expected = list(f)
+            with FastqReader(path, keep_raw=True) as f:
+                # Use a small chunk size so that records span chunks
+                f.chunk_size = 7
+                reads = list(f)
+            assert reads == expected
+            assert [r.name2 for r in reads] == [r.name2 for r in expected]
+            for read in reads:
+                assert read.raw == fmt.format_entry(
+                    read.name, read.sequence, read.qualities, read.name2)
+                assert fmt.format(read) == read.raw
+        # Line breaks are only translated when reading in text mode
+        fastq = StringIO("@r1\r\nACGT\r\n+r1\r\nIIII\r\n")
+        reads = list(FastqReader(fastq, keep_raw=True))
+        assert reads[0].raw is None
+        assert (reads[0].name, reads[0].qualities, reads[0].name2) == (
+            "r1", "IIII", "r1")
+
+    def test_keep_raw_no_final_newline(self):
+        fastq = StringIO("@r1\nACGT\n+\nIIII\n@r2\nAC\n+r2\nII")
+        reads = list(FastqReader(fastq, keep_raw=True))
+        assert reads[0].raw == "@r1\nACGT\n+\nIIII\n"
+        assert reads[1].raw is None
+        assert (reads[1].sequence, reads[1].name2) == ("AC", "r2")
+        fastq = StringIO("@r1\nACGT\n+\nIIII\n@r2\nAC\n")
+        with raises(FormatError):
+            list(FastqReader(fastq, keep_raw=True))
+
+    def test_keep_raw_errors(self):
+        # Reading in chunks reports the same errors as reading lines
+        for text, message in (
+                ("@r1\nACGT\n+\n", "FASTQ file ended prematurely"),
+                ("@r1\nACGT\n", "FASTQ file ended prematurely"),
+                ("@r1\nACGT\n+\nIIII\n\n",
+                 "Line 5 in FASTQ file is expected to start with '@', "
+                 "but found '\\n'"),
+                ("@r1\nACGT\n+\nIIII\nr2\nACGT\n+\nIIII\n",
+                 "Line 5 in FASTQ file is expected to start with '@', "
+                 "but found 'r2\\n'"),
+                ("@r1\nACGT\n-r1\nIIII\n@r2\nACGT\n+\nIIII\n",
+                 "Line 3 in FASTQ file is expected to start with '+', "
+                 "but found '-r1'"),
+                ("@r1\nACGT\n+r2\n",
+                 "At line 3: Sequence descriptions in the FASTQ file don't "
+                 "match ('r1' != 'r2')")):
+            for keep_raw in (False, True):
+                with raises(FormatError) as err:
+                    list(FastqReader(StringIO(text), keep_raw=keep_raw))
+                assert str(err.value).startswith(message), (keep_raw, text)
+
+    def test_keep_raw_changed(self):
+        import pickle
+        fastq = StringIO("@r1\nACGT\n+\nIIII\n")
+        read = list(FastqReader(fastq, keep_raw=True))[0]
+        assert read[:].raw == read.raw
+        assert read[1:].raw is None
+        copy = pickle.loads(pickle.dumps(read))
+        assert copy.raw == read.raw and copy == read
+        for attr, value in (
+                ('name', 'r2'), ('name2', 'r1'), ('sequence', 'TTTT'),
+                ('qualities', '####')):
+            changed = read[:]
+            setattr(changed, attr, value)
+            assert changed.raw is None
+        assert read.raw == "@r1\nACGT\n+\nIIII\n"
+
     def test_context_manager(self):
         filename = "tests/data/simple.fastq"
         with open(filename) as f:
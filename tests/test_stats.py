@@ -0,0 +1,72 @@
+# coding: utf-8
+import random
+from unittest import skipIf
+from unittest.mock import patch
+from atropos.commands.stats import (
+    np, BaseCountingArray, SingleEndReadStatistics, PairedEndReadStatistics)
+from atropos.io.seqio import Sequence
+from atropos.util import Summarizable
+
+def random_reads(rnd, num_reads, max_len):
+    reads = []
+    for i in range(num_reads):
+        length = rnd.choice((max_len, rnd.randint(0, max_len)))
+        reads.append(Sequence(
+            'read{}'.format(i),
+            ''.join(rnd.choice('ACGTN') for _ in range(length)),
+            ''.join(chr(33 + rnd.randint(0, 40)) for _ in range(length))))
+    return reads
+
+def summarize(value):
+    if isinstance(value, Summarizable):
+        value = value.summarize()
+    if isinstance(value, dict):
+        return dict((key, summarize(val)) for key, val in value.items())
+    return value
+
+@skipIf(np is None, "numpy is not installed")
+def test_batch_stats():
+    rnd = random.Random(7)
+    for qualities in (True, None):
+        batches = [
+            list(zip(
+                random_reads(rnd, rnd.randint(1, 30), 40),
+                random_reads(rnd, rnd.randint(1, 30), 20)))
+            for _ in range(4)]
+        batches[1][0] = (Sequence('empty', '', ''), batches[1][0][1])
+        for stats_class in (SingleEndReadStatistics, PairedEndReadStatistics):
+            with patch('atropos.commands.stats.np', None):
+                expected = stats_class(qualities=qualities)
+                batched = stats_class(qualities=qualities)
+            for batch in batches:
+                for record in batch:
+                    expected.collect(*record)
+                batched.collect_batch(batch)
+            # without arrays, batches are collected record by record
+            assert summarize(batched.summarize()) == summarize(
+                expected.summarize())
+
+            # two accumulators whose arrays are merged
+            actual = stats_class(qualities=qualities)
+            other = stats_class(qualities=qualities)
+            actual.collect_batch(batches[0])
+            actual.collect(*batches[1][0])
+            actual.collect_batch(batches[1][1:])
+            other.collect_batch(batches[2])
+            other.collect_batch(batches[3])
+            if stats_class is SingleEndReadStatistics:
+                pairs = ((actual, other),)
+            else:
+                pairs = ((actual.read1, other.read1), (actual.read2, other.read2))
+            for stats, other_stats in pairs:
+                assert isinstance(stats.bases, BaseCountingArray)
+                stats.bases.merge(other_stats.bases)
+                stats.base_qualities.merge(other_stats.base_qualities)
+                for name in (
+                        'sequence_lengths', 'sequence_gc',
+                        'sequence_qualities'):
+                    getattr(stats, name).merge(getattr(other_stats, name))
+                stats.count += other_stats.count
+
+            assert summarize(actual.summarize()) == summarize(
+                expected.summarize())
@@ -1,7 +1,9 @@
 # coding: utf-8
 from atropos.adapters import Adapter, ColorspaceAdapter, PREFIX, BACK
+from atropos.commands import get_command
 from atropos.commands.trim.modifiers import AdapterCutter
 from atropos.io.seqio import ColorspaceSequence, Sequence
+from .utils import datapath, temporary_path
 
 def test_cs_5p():
     read = ColorspaceSequence("name", "0123", "DEFG", "T")
@@ -23,3 +25,27 @@ def test_statistics():
         for d in (adapter.lengths_front, adapter.lengths_back):
             trimmed_bp += sum(seqlen * count for (seqlen, count) in d.items())
     assert trimmed_bp <= len(read), trimmed_bp
+
+
+def sampled_reads(*params):
+    command = get_command('trim')
+    with temporary_path('sampled.fastq') as out:
+        options = command.parse_args(
+            ['-a', 'TTAGACATAT', '-se', datapath('small.fastq'), '-o', out] +
+            list(params))
+        runner = command.get_command_runner_class()(options)
+        try:
+            return [read for _, read in runner.iterable]
+        finally:
+            runner.reader.close()
+
+
+def test_sample_reads_drop_raw():
+    # Trimming keeps the record text, so reads reference the chunk they
+    # were read from...
+    reads = sampled_reads('--max-reads', '2')
+    assert all(read.raw is not None for read in reads)
+    # ...but reads held in the reservoir must not.
+    reads = sampled_reads('--max-reads', '2', '--sample-reads')
+    assert len(reads) == 2
+    assert all(read.raw is None for read in reads)
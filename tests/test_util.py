@@ -0,0 +1,60 @@
+# coding: utf-8
+from collections import Counter
+import random
+from pytest import raises
+from atropos import util
+from atropos.util import reservoir_sample
+
+def test_reservoir_sample():
+    # fewer items than the sample size
+    assert reservoir_sample(range(5), 10) == list(range(5))
+    assert reservoir_sample(range(5), 5) == list(range(5))
+    assert reservoir_sample(range(5), 0) == []
+
+    sample = reservoir_sample(range(1000), 50, random.Random(1))
+    assert len(sample) == 50
+    assert len(set(sample)) == 50
+    assert sample == sorted(sample)
+    assert sample == reservoir_sample(range(1000), 50, random.Random(1))
+    assert sample != reservoir_sample(range(1000), 50, random.Random(2))
+
+def test_reservoir_sample_uniform():
+    rnd = random.Random(3)
+    trials = 20000
+    counts = Counter()
+    for _ in range(trials):
+        counts.update(reservoir_sample(range(20), 5, rnd))
+    # each item is selected with probability 1/4
+    expected = trials / 4
+    for item in range(20):
+        assert abs(counts[item] - expected) < 0.05 * expected
+
+def test_quality_conversion():
+    rnd = random.Random(4)
+    functions = (
+        (util.quals2ints, util._quals2ints_python),
+        (util.qual_sum, util._qual_sum_python),
+        (util.qual_prob_sum, util._qual_prob_sum_python))
+    for _ in range(500):
+        base = rnd.choice((33, 64))
+        quals = ''.join(
+            chr(base + rnd.randint(0, 41)) for _ in range(rnd.randint(0, 150)))
+        ints = [ord(qual) - base for qual in quals]
+        probs = [10 ** (-i / 10) for i in ints]
+        for func in functions[0]:
+            assert func(quals, base) == bytes(ints)
+        for func in functions[1]:
+            assert func(quals, base) == sum(ints)
+        # the compiled and python functions are identical
+        assert util.qual_prob_sum(quals, base) == \
+            util._qual_prob_sum_python(quals, base)
+        assert abs(util.qual_prob_sum(quals, base) - sum(probs)) < 1e-9
+    for func in (util.qual_sums, util._qual_sums_python):
+        assert func(['', 'I', '!5'], 33) == [0, 40, 20]
+    assert util.qual2prob('+') == 0.1
+    assert util.qual2prob('J', 64) == 0.1
+    for funcs in functions:
+        for func in funcs:
+            for quals, base in (('5', 64), ('I\u00e9I', 33)):
+                with raises(ValueError):
+                    func(quals, base)